@@ -9,8 +9,20 @@ app.config_from_object("django.conf:settings", namespace="CELERY")
 app.autodiscover_tasks()
 
 app.conf.CELERYBEAT_SCHEDULE = {
-    "clean_votes": {
-        "task": "hospital.tasks.reset_schedule",
-        "schedule": crontab(minute='*/1'),
+    "purge_expired_schedules": {
+        "task": "hospital.tasks.purge_expired_schedules",
+        "schedule": crontab(minute=30),
+    },
+    "extend_schedules": {
+        "task": "hospital.tasks.extend_schedules",
+        "schedule": crontab(hour=1, minute=0),
+    },
+    "extend_partitions": {
+        "task": "hospital.tasks.extend_partitions",
+        "schedule": crontab(hour=2, minute=0),
+    },
+    "drain_outbox": {
+        "task": "hospital.tasks.drain_outbox",
+        "schedule": 5.0,
     }
 }
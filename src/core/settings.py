@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 import os
+from importlib.util import find_spec
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -37,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'hospital',
     'users',
@@ -146,7 +148,9 @@ REST_FRAMEWORK = {
   ),
   'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
-    ]
+    ],
+  'DEFAULT_PAGINATION_CLASS': 'hospital.pagination.KeysetPagination',
+  'PAGE_SIZE': 25,
 }
 
 # REDIS related settings
@@ -159,3 +163,97 @@ CELERY_ACCEPT_CONTENT = ["application/json"]
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TASK_SERIALIZER = "json"
 
+# Cache shared by all processes, local memory of each process when django-redis is not installed
+if find_spec('django_redis'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': "redis://" + REDIS_HOST + ":" + REDIS_PORT + "/2",
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+
+# Schedule related settings
+SCHEDULE_BATCH_SIZE = 1000
+SCHEDULE_HORIZON_WEEKS = 8
+# Compute free visits from schedules on read and store a visit only when it is booked
+VIRTUAL_VISITS = False
+
+# Search related settings
+SEARCH_RESULTS_LIMIT = 10
+
+# Authentication related settings
+# Seconds for which authenticated users are cached in the shared cache and in every process
+# and the longest a deactivation with QuerySet.update goes unnoticed, saves drop cached users right away
+AUTH_CACHE_TTL = 300
+AUTH_LOCAL_CACHE_TTL = 10
+AUTH_LOCAL_CACHE_SIZE = 1024
+# Seconds for which access tokens are valid, they are renewed with refresh tokens
+ACCESS_TOKEN_TTL = 15 * 60
+REFRESH_TOKEN_TTL = 30 * 24 * 60 * 60
+# Passwords are hashed by this many threads per process, other logins wait for them
+LOGIN_HASH_WORKERS = 4
+# Seconds a login waits for a hashing thread before it is refused
+LOGIN_HASH_TIMEOUT = 10
+
+# Staff import related settings
+STAFF_IMPORT_CHUNK_SIZE = 1000
+# Processes hashing passwords of imported users, the number of CPUs when None
+STAFF_IMPORT_WORKERS = None
+
+# Visit holds related settings
+VISIT_HOLDS_BACKEND = 'hospital.holds.RedisHoldStore'
+VISIT_HOLDS_REDIS_URL = "redis://" + REDIS_HOST + ":" + REDIS_PORT + "/1"
+# Seconds for which a client can hold a visit before booking it
+VISIT_HOLD_TTL = 300
+
+# Booking related settings
+BULK_BOOKING_MAX_ITEMS = 500
+
+# Export related settings
+# Rows fetched from the server-side cursor at a time
+EXPORT_CHUNK_SIZE = 2000
+
+# Outbox related settings
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_ATTEMPTS = 5
+# Days for which handled events are kept
+OUTBOX_KEEP_DAYS = 7
+
+# Retention related settings
+# Schedules and visits older than this amount of days are removed
+RETENTION_DAYS = 5
+RETENTION_CHUNK_SIZE = 1000
+# Copy removed rows to <table>_archive tables
+RETENTION_ARCHIVE = False
+RETENTION_LOCK_TIMEOUT = 60 * 60
+# Partition visits and schedules by month on PostgreSQL, see hospital.partitions
+DATE_PARTITIONS = False
+# Months for which partitions are created ahead of time
+DATE_PARTITIONS_AHEAD = 3
+
+# Sync related settings
+# Changes for delta sync are kept for this amount of days
+CHANGELOG_KEEP_DAYS = 30
+SYNC_PAGE_SIZE = 500
+# Seconds for which new changes are held back, has to be longer than the time from writing a change to the commit
+# of its transaction, changes committed later than that can be missed by clients, see hospital.sync.horizon
+SYNC_SAFETY_LAG = 5
+
+# Catalogue cache related settings
+CATALOGUE_CACHE_TIMEOUT = 60 * 60
+# Seconds for which browsers and proxies may reuse catalogue responses
+CATALOGUE_CACHE_MAX_AGE = 60
+# Seconds other requests wait for the one which builds a missing response
+CATALOGUE_CACHE_LOCK_TIMEOUT = 5
+
+# Calendar feed related settings
+# Days of past visits included in calendar feeds
+CALENDAR_PAST_DAYS = 30
+CALENDAR_CACHE_TIMEOUT = 7 * 24 * 60 * 60
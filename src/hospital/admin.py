@@ -6,6 +6,7 @@ from . import models
 class VisitAdmin(admin.ModelAdmin):
     list_display = ('id', 'doctor', 'time', 'date')
     list_display_links = ('doctor', )
+    list_select_related = ('doctor', )
     list_filter = ('date',)
     search_fields = ('doctor__first_name',)
 
@@ -6,4 +6,4 @@ class HospitalConfig(AppConfig):
     name = 'hospital'
 
     def ready(self):
-        from . import signals
+        from . import signals, handlers
@@ -0,0 +1,130 @@
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import groupby
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .holds import hold_store
+from .models import FreeSlot, Schedule, Visit
+from .slots import schedule_times, upcoming
+
+_batch = threading.local()
+
+
+def index_visits(visits):
+    """Add free visits from the queryset to the free slot index"""
+    if settings.VIRTUAL_VISITS:
+        return
+    rows = visits.filter(booking_visit__isnull=True).values_list(
+        'id', 'doctor_id', 'doctor__hospital_id', 'date', 'time'
+    )
+    FreeSlot.objects.bulk_create(
+        [
+            FreeSlot(visit_id=visit, doctor_id=doctor, hospital_id=hospital, date=date, time=time)
+            for visit, doctor, hospital, date, time in rows.iterator()
+        ],
+        batch_size=settings.SCHEDULE_BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def occupy_slots(visit_ids):
+    """Remove booked visits from the free slot index"""
+    FreeSlot.objects.filter(visit_id__in=visit_ids).delete()
+
+
+def release_slots(visit_ids):
+    """Return visits to the free slot index once the transaction which freed them is committed"""
+    visit_ids = list(visit_ids)
+    transaction.on_commit(lambda: index_visits(Visit.objects.filter(id__in=visit_ids)))
+
+
+@contextmanager
+def batch_slots():
+    """Booking signals leave the free slot index and events alone inside the block, the caller handles the batch"""
+    _batch.active = True
+    try:
+        yield
+    finally:
+        _batch.active = False
+
+
+def in_batch():
+    return getattr(_batch, 'active', False)
+
+
+def search_free_slots(date_from, date_to, specialization=None, hospital=None, time_from=None, time_to=None,
+                      limit=25):
+    """
+    Earliest free visits across doctors which are not held or started, ordered by date and time.
+
+    Holds are checked only for the found slots, a page at a time, and not
+    sent to the database as a list of every held visit.
+    """
+    if settings.VIRTUAL_VISITS:
+        return _search_schedules(date_from, date_to, specialization, hospital, time_from, time_to, limit)
+
+    slots = FreeSlot.objects.filter(upcoming(datetime.now()), date__gte=date_from, date__lte=date_to)
+    if specialization:
+        slots = slots.filter(doctor__specialization__url=specialization)
+    if hospital:
+        slots = slots.filter(hospital=hospital)
+    if time_from:
+        slots = slots.filter(time__gte=time_from)
+    if time_to:
+        slots = slots.filter(time__lt=time_to)
+    slots = slots.select_related('doctor').order_by('date', 'time', 'visit_id')
+    found = []
+    offset = 0
+    while len(found) < limit:
+        page = list(slots[offset:offset + limit])
+        if not page:
+            break
+        offset += limit
+        held = hold_store().held_among([slot.visit_id for slot in page])
+        found.extend(slot for slot in page if slot.visit_id not in held)
+    return found[:limit]
+
+
+def _search_schedules(date_from, date_to, specialization, hospital, time_from, time_to, limit):
+    """Availability search computed from schedule windows, used with virtual visits"""
+    schedules = Schedule.objects.filter(
+        date__gte=date_from, date__lte=date_to, doctor__visit_duration__isnull=False
+    )
+    if specialization:
+        schedules = schedules.filter(doctor__specialization__url=specialization)
+    if hospital:
+        schedules = schedules.filter(doctor__hospital=hospital)
+    if time_from:
+        schedules = schedules.filter(time_to__gt=time_from)
+    if time_to:
+        schedules = schedules.filter(time_from__lt=time_to)
+    schedules = schedules.select_related('doctor').order_by('date', 'doctor_id')
+
+    now = datetime.now()
+    found = []
+    for date, day_schedules in groupby(schedules.iterator(), key=lambda schedule: schedule.date):
+        day_schedules = list(day_schedules)
+        doctors = {schedule.doctor_id for schedule in day_schedules}
+        booked = set(Visit.objects.filter(
+            Q(booking_visit__isnull=False) | Q(pk__in=hold_store().held_visits(doctors)),
+            date=date, doctor__in=doctors
+        ).values_list('doctor_id', 'time'))
+        day_slots = [
+            FreeSlot(doctor=schedule.doctor, hospital_id=schedule.doctor.hospital_id, date=date, time=time)
+            for schedule in day_schedules
+            for time in schedule_times(schedule, int(schedule.doctor.visit_duration))
+            if (schedule.doctor_id, time) not in booked and _in_window(time, time_from, time_to)
+        ]
+        day_slots = [slot for slot in day_slots if datetime.combine(date, slot.time) > now]
+        found.extend(sorted(day_slots, key=lambda slot: (slot.time, slot.doctor_id)))
+        if len(found) >= limit:
+            break
+    return found[:limit]
+
+
+def _in_window(time, time_from, time_to):
+    return (not time_from or time >= time_from) and (not time_to or time < time_to)
@@ -0,0 +1,91 @@
+import logging
+from datetime import datetime
+
+from django.db import IntegrityError, transaction
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotFound, ValidationError
+
+from .holds import HoldsUnavailable, hold_store
+from .models import Booking, Schedule, Visit
+from .slots import claim_slot
+
+logger = logging.getLogger(__name__)
+
+
+class SlotUnavailable(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'This visit is already booked.'
+    default_code = 'slot_unavailable'
+
+
+def book_visit(client, visit_id, service=None, idempotency_key=None):
+    """
+    Book the visit for the client.
+
+    The visit row is locked with SELECT ... FOR UPDATE SKIP LOCKED, so of many
+    clients booking the same visit at once one gets it and the others get
+    SlotUnavailable right away instead of queueing on the lock. Visits held
+    by other clients can not be booked, client's own hold is released once
+    the booking is committed. A repeated request with the same idempotency
+    key returns the booking it created.
+    """
+    booking = replayed_booking(client, visit_id, idempotency_key)
+    if booking:
+        return booking
+
+    try:
+        with transaction.atomic():
+            visit = Visit.objects.select_for_update(skip_locked=True, of=('self',)).filter(
+                pk=visit_id, booking_visit__isnull=True
+            ).first()
+            if visit is None:
+                if not Visit.objects.filter(pk=visit_id).exists():
+                    raise NotFound('Visit does not exist.')
+                raise SlotUnavailable()
+            check_bookable(visit)
+            if hold_store().holder(visit.pk) not in (None, client.pk):
+                raise SlotUnavailable('This visit is held by another client.')
+            booking = Booking.objects.create(
+                visit=visit, client=client, service=service, idempotency_key=idempotency_key
+            )
+            transaction.on_commit(lambda: release_hold(visit, client))
+            return booking
+    except IntegrityError:
+        # Lost the race to a concurrent request, either for the visit or with the same idempotency key
+        booking = replayed_booking(client, visit_id, idempotency_key)
+        if booking:
+            return booking
+        raise SlotUnavailable()
+
+
+def release_hold(visit, client):
+    """Release client's hold of the booked visit, the booking stands when Redis is down and the hold just expires"""
+    try:
+        hold_store().release(visit.pk, visit.doctor_id, client.pk)
+    except HoldsUnavailable:
+        logger.warning('Hold of booked visit %s was not released', visit.pk, exc_info=True)
+
+
+def book_slot(client, doctor, visit_date, visit_time, service=None, idempotency_key=None):
+    """Book a slot of doctor's schedule, used with virtual visits which are stored on booking"""
+    visit = claim_slot(doctor, visit_date, visit_time)
+    return book_visit(client, visit.pk, service, idempotency_key)
+
+
+def replayed_booking(client, visit_id, idempotency_key):
+    if not idempotency_key:
+        return None
+    booking = Booking.objects.filter(client=client, idempotency_key=idempotency_key).first()
+    if booking and booking.visit_id != visit_id:
+        raise ValidationError('Idempotency key was already used for another visit.')
+    return booking
+
+
+def check_bookable(visit):
+    """Reject visits in the past and visits which are not in doctor's schedule anymore"""
+    if datetime.combine(visit.date, visit.time) <= datetime.now():
+        raise ValidationError('Visit is in the past.')
+    if not Schedule.objects.filter(
+        doctor_id=visit.doctor_id, date=visit.date, time_from__lte=visit.time, time_to__gt=visit.time
+    ).exists():
+        raise ValidationError('Doctor has no visit at this time.')
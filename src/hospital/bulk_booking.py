@@ -0,0 +1,139 @@
+from datetime import datetime
+
+from django.db import transaction
+
+from users.models import Client
+from .availability import batch_slots, occupy_slots, release_slots
+from .calendars import invalidate_calendars
+from .holds import hold_store
+from .models import Booking, Schedule, Visit
+from .outbox import booking_event, publish_events
+from .sync import record, record_rows
+
+
+def bulk_cancel(hospital_id, items):
+    """Cancel bookings of hospital's doctors, returns a result for every item, clients hear only of future visits"""
+    booking_ids = [item['booking'] for item in items]
+    now = datetime.now()
+    with transaction.atomic():
+        bookings = Booking.objects.filter(
+            pk__in=booking_ids, visit__doctor__hospital_id=hospital_id
+        ).select_related('visit').in_bulk()
+        with batch_slots():
+            Booking.objects.filter(pk__in=bookings).delete()
+        release_slots([booking.visit_id for booking in bookings.values()])
+        record(bookings.values(), deleted=True)
+        publish_events([
+            booking_event('booking.cancelled', booking, booking.visit) for booking in bookings.values()
+            if datetime.combine(booking.visit.date, booking.visit.time) > now
+        ])
+        invalidate_calendars(
+            doctors=[booking.visit.doctor_id for booking in bookings.values()],
+            clients=[booking.client_id for booking in bookings.values()]
+        )
+    return [
+        success(booking=pk, visit=bookings[pk].visit_id, status='cancelled') if pk in bookings else
+        failure('Booking does not exist.', booking=pk)
+        for pk in booking_ids
+    ]
+
+
+def bulk_move(hospital_id, items):
+    """Move bookings of hospital's doctors to other free visits, returns a result for every item"""
+    with transaction.atomic():
+        bookings = Booking.objects.select_for_update(of=('self',)).filter(
+            pk__in=[item['booking'] for item in items], visit__doctor__hospital_id=hospital_id
+        ).in_bulk()
+        visits = lock_free_visits(hospital_id, [item['visit'] for item in items])
+        results, moved, released = [], [], []
+        for item in items:
+            booking, visit = bookings.pop(item['booking'], None), visits.pop(item['visit'], None)
+            if booking is None:
+                results.append(failure('Booking does not exist.', **item))
+            elif visit is None:
+                results.append(failure('Visit is not available.', **item))
+            else:
+                released.append(booking.visit_id)
+                booking.visit = visit
+                moved.append(booking)
+                results.append(success(status='moved', **item))
+        Booking.objects.bulk_update(moved, ['visit'])
+        record(moved)
+        occupy_slots([booking.visit_id for booking in moved])
+        release_slots(released)
+        publish_events([
+            booking_event('booking.moved', booking, booking.visit, f'booking.moved:{booking.pk}:{booking.visit_id}')
+            for booking in moved
+        ])
+        invalidate_calendars(
+            doctors=[booking.visit.doctor_id for booking in moved] + list(
+                Visit.objects.filter(pk__in=released).values_list('doctor_id', flat=True)
+            ),
+            clients=[booking.client_id for booking in moved]
+        )
+    return results
+
+
+def bulk_create(hospital_id, items):
+    """Book free visits of hospital's doctors for clients, returns a result for every item"""
+    with transaction.atomic():
+        clients = set(Client.objects.filter(pk__in=[item['client'] for item in items]).values_list('pk', flat=True))
+        visits = lock_free_visits(hospital_id, [item['visit'] for item in items])
+        results, bookings = [], []
+        for item in items:
+            visit = visits.pop(item['visit'], None)
+            if item['client'] not in clients:
+                results.append(failure('Client does not exist.', visit=item['visit'], client=item['client']))
+            elif visit is None:
+                results.append(failure('Visit is not available.', visit=item['visit'], client=item['client']))
+            else:
+                bookings.append(Booking(visit=visit, client_id=item['client'], service=item.get('service')))
+                results.append(None)
+        with batch_slots():
+            created = iter(Booking.objects.bulk_create(bookings))
+        occupy_slots([booking.visit_id for booking in bookings])
+        record_rows(Booking.objects.filter(visit__in=[booking.visit_id for booking in bookings]))
+        publish_events([booking_event('booking.created', booking, booking.visit) for booking in bookings])
+        invalidate_calendars(
+            doctors=[booking.visit.doctor_id for booking in bookings],
+            clients=[booking.client_id for booking in bookings]
+        )
+    return [result or success_booking(next(created)) for result in results]
+
+
+def lock_free_visits(hospital_id, visit_ids):
+    """
+    Lock requested visits of hospital's doctors which can be booked, by id.
+
+    Visits locked by concurrent bookings are skipped, as are visits which are
+    booked, held, in the past or not in doctor's schedule anymore. Everything
+    is checked with a fixed number of queries for the whole batch.
+    """
+    visits = list(Visit.objects.select_for_update(skip_locked=True, of=('self',)).filter(
+        pk__in=visit_ids, doctor__hospital_id=hospital_id, booking_visit__isnull=True
+    ).exclude(pk__in=hold_store().held_among(visit_ids)))
+    schedules = {}
+    for schedule in Schedule.objects.filter(
+        doctor_id__in={visit.doctor_id for visit in visits}, date__in={visit.date for visit in visits}
+    ).only('doctor_id', 'date', 'time_from', 'time_to'):
+        schedules.setdefault((schedule.doctor_id, schedule.date), []).append(schedule)
+    now = datetime.now()
+    return {
+        visit.pk: visit for visit in visits
+        if datetime.combine(visit.date, visit.time) > now and any(
+            schedule.time_from <= visit.time < schedule.time_to
+            for schedule in schedules.get((visit.doctor_id, visit.date), ())
+        )
+    }
+
+
+def success(**result):
+    return dict(result, ok=True)
+
+
+def success_booking(booking):
+    return success(booking=booking.pk, visit=booking.visit_id, client=booking.client_id, status='created')
+
+
+def failure(detail, **result):
+    return dict(result, ok=False, detail=detail)
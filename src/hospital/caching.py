@@ -0,0 +1,119 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def version_key(model):
+    return f'catalogue:version:{model._meta.label_lower}'
+
+
+def bump_keys(keys, timeout=None):
+    """
+    Increment version counters under the keys.
+
+    Versions start from the current time, so a version evicted from the
+    cache never comes back with a value used before.
+    """
+    for key in keys:
+        cache.add(key, int(time.time() * 1000), timeout)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, int(time.time() * 1000), timeout)
+
+
+def current_versions(keys, timeout=None):
+    """Versions under the keys with one cache lookup, missing ones are started"""
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, int(time.time() * 1000), timeout)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def bump_versions(*models):
+    """Invalidate cached responses built from the models"""
+    bump_keys([version_key(model) for model in models])
+
+
+def invalidate(*models):
+    """Bump versions of the models once the current transaction commits, so no request caches older data"""
+    transaction.on_commit(lambda: bump_versions(*models))
+
+
+def versions(models):
+    """Current versions of the models, missing ones are started"""
+    return current_versions([version_key(model) for model in models])
+
+
+def not_modified(request, etag, last_modified):
+    """Whether the client's copy with the validators is current, If-None-Match wins over If-Modified-Since"""
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        return etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since'))
+    return if_modified_since is not None and last_modified <= if_modified_since
+
+
+class CachedListMixin:
+    """
+    Cache whole serialized responses of a public list view.
+
+    Responses are keyed by the full URL and the versions of ``cache_models``,
+    which signals bump whenever any of those models change, so a change
+    invalidates every page at once. Responses carry ETag and Last-Modified
+    and conditional GETs are answered with 304. Only one request builds a
+    missing response, the others wait for it for a moment (see
+    CATALOGUE_CACHE_LOCK_TIMEOUT).
+    """
+    cache_models = ()
+
+    def list(self, request, *args, **kwargs):
+        etag, last_modified, data = self.cached_response(request, *args, **kwargs)
+        if not_modified(request, etag, last_modified):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(data)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = f'public, max-age={settings.CATALOGUE_CACHE_MAX_AGE}'
+        return response
+
+    def cache_key(self, request):
+        url = hashlib.md5(request.build_absolute_uri().encode('utf-8')).hexdigest()
+        model_versions = '.'.join(str(version) for version in versions(self.cache_models))
+        return f'catalogue:{type(self).__name__}:{model_versions}:{url}'
+
+    def cached_response(self, request, *args, **kwargs):
+        key = self.cache_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+        lock = f'{key}:lock'
+        locked = cache.add(lock, 1, settings.CATALOGUE_CACHE_LOCK_TIMEOUT)
+        if not locked:
+            deadline = time.monotonic() + settings.CATALOGUE_CACHE_LOCK_TIMEOUT
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                cached = cache.get(key)
+                if cached is not None:
+                    return cached
+        try:
+            data = super().list(request, *args, **kwargs).data
+            content = json.dumps(data, cls=JSONEncoder, sort_keys=True).encode('utf-8')
+            cached = (quote_etag(hashlib.md5(content).hexdigest()), int(time.time()), data)
+            cache.set(key, cached, settings.CATALOGUE_CACHE_TIMEOUT)
+            return cached
+        finally:
+            if locked:
+                cache.delete(lock)
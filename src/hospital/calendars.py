@@ -0,0 +1,214 @@
+import calendar
+import secrets
+import time
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils.http import quote_etag
+
+from .caching import bump_keys, current_versions
+from users.models import MyUser
+from .models import Booking, Schedule
+
+SALT = 'hospital.calendar'
+
+
+def version_key(role, pk):
+    return f'calendar:version:{role}:{pk}'
+
+
+def invalidate_calendars(doctors=(), clients=()):
+    """Bump calendar versions of the doctors and clients once the current transaction commits"""
+    keys = [version_key('doctor', pk) for pk in set(doctors)] + [version_key('client', pk) for pk in set(clients)]
+    if keys:
+        transaction.on_commit(lambda: bump_calendars(keys))
+
+
+def bump_calendars(keys):
+    bump_keys(keys, settings.CALENDAR_CACHE_TIMEOUT)
+    cache.set_many({f'{key}:modified': int(time.time()) for key in keys}, settings.CALENDAR_CACHE_TIMEOUT)
+
+
+def invalidate_showing(doctors=(), hospital=None):
+    """
+    Bump calendars which show names of the doctors or the hospital.
+
+    Those are the calendars of the doctors and of clients with bookings in
+    their feeds, which start CALENDAR_PAST_DAYS before today.
+    """
+    shown = Q(visit__doctor__in=doctors) if hospital is None else Q(visit__doctor__hospital=hospital)
+    clients = Booking.objects.filter(
+        shown, visit__date__gte=date.today() - timedelta(days=settings.CALENDAR_PAST_DAYS)
+    ).values_list('client_id', flat=True).distinct()
+    invalidate_calendars(doctors=doctors, clients=clients)
+
+
+def owner_key(user_id):
+    return f'calendar:owner:{user_id}'
+
+
+def feed_token(role, pk, user):
+    """Token of the feed address, the user gets a nonce with the first address"""
+    if not user.calendar_nonce:
+        rotate_nonce(user)
+    return signing.dumps([role, pk, user.pk, user.calendar_nonce], salt=SALT)
+
+
+def rotate_nonce(user):
+    """New secret of the user's feed addresses, older addresses stop working"""
+    user.calendar_nonce = secrets.token_urlsafe(16)
+    user.save(update_fields=['calendar_nonce'])
+
+
+def read_feed_token(token):
+    """Role, profile id, user id and nonce of a feed token, raises signing.BadSignature for forged tokens"""
+    try:
+        role, pk, user_id, nonce = signing.loads(token, salt=SALT)
+    except (TypeError, ValueError):
+        raise signing.BadSignature('Feed token has no nonce')
+    return role, pk, user_id, nonce
+
+
+def owner_nonce(user_id):
+    """
+    Current nonce of the active user, '' for inactive or deleted users.
+
+    Kept in the cache for AUTH_CACHE_TTL seconds and dropped when the user
+    is saved, deactivation through ``QuerySet.update`` is seen after the ttl.
+    """
+    nonce = MyUser.objects.filter(pk=user_id, is_active=True).values_list('calendar_nonce', flat=True).first() or ''
+    cache.set(owner_key(user_id), nonce, settings.AUTH_CACHE_TTL)
+    return nonce
+
+
+def forget_owner(user_id):
+    cache.delete(owner_key(user_id))
+
+
+def validators(role, pk, user_id, today):
+    """
+    ETag, Last-Modified time and version of the calendar and the owner's nonce, with one cache lookup.
+
+    The calendar starts CALENDAR_PAST_DAYS before today, so it changes every
+    day even when nothing is booked, the day is part of the ETag.
+    """
+    key = version_key(role, pk)
+    found = cache.get_many([key, f'{key}:modified', owner_key(user_id)])
+    nonce = found[owner_key(user_id)] if owner_key(user_id) in found else owner_nonce(user_id)
+    if key in found:
+        version = found[key]
+    else:
+        version = current_versions([key], settings.CALENDAR_CACHE_TIMEOUT)[0]
+    midnight = calendar.timegm(today.timetuple())
+    last_modified = max(found.get(f'{key}:modified', midnight), midnight)
+    return quote_etag(f'{role}-{pk}-{version}-{today:%Y%m%d}'), last_modified, version, nonce
+
+
+def cached_feed(role, pk, version, today):
+    """iCalendar text of the version of the calendar, built once per version and day"""
+    key = f'calendar:feed:{role}:{pk}:{version}:{today:%Y%m%d}'
+    feed = cache.get(key)
+    if feed is None:
+        feed = render_feed(FEED_EVENTS[role](pk, today - timedelta(days=settings.CALENDAR_PAST_DAYS)), today)
+        cache.set(key, feed, settings.CALENDAR_CACHE_TIMEOUT)
+    return feed
+
+
+def doctor_events(pk, since):
+    """Bookings and working hours of the doctor"""
+    events = []
+    bookings = Booking.objects.filter(visit__doctor_id=pk, visit__date__gte=since).order_by(
+        'visit__date', 'visit__time'
+    ).values_list('id', 'visit__date', 'visit__time', 'visit__doctor__visit_duration', 'client__first_name',
+                  'client__last_name', 'service')
+    for booking, day, hour, duration, first_name, last_name, service in bookings.iterator():
+        start = datetime.combine(day, hour)
+        events.append({
+            'uid': f'booking-{booking}', 'start': start, 'end': start + timedelta(minutes=duration or 30),
+            'summary': f'Visit: {first_name} {last_name}', 'description': service,
+        })
+    schedules = Schedule.objects.filter(doctor_id=pk, date__gte=since).order_by('date', 'time_from').values_list(
+        'id', 'date', 'time_from', 'time_to'
+    )
+    for schedule, day, time_from, time_to in schedules.iterator():
+        events.append({
+            'uid': f'schedule-{schedule}', 'start': datetime.combine(day, time_from),
+            'end': datetime.combine(day, time_to), 'summary': 'Working hours', 'transparent': True,
+        })
+    return events
+
+
+def client_events(pk, since):
+    """Bookings of the client"""
+    bookings = Booking.objects.filter(client_id=pk, visit__date__gte=since).order_by(
+        'visit__date', 'visit__time'
+    ).values_list('id', 'visit__date', 'visit__time', 'visit__doctor__visit_duration', 'visit__doctor__first_name',
+                  'visit__doctor__last_name', 'visit__doctor__hospital__title', 'visit__doctor__hospital__address',
+                  'service')
+    events = []
+    for booking, day, hour, duration, first_name, last_name, hospital, address, service in bookings.iterator():
+        start = datetime.combine(day, hour)
+        events.append({
+            'uid': f'booking-{booking}', 'start': start, 'end': start + timedelta(minutes=duration or 30),
+            'summary': f'Visit: {first_name} {last_name}', 'description': service,
+            'location': ', '.join(part for part in (hospital, address) if part),
+        })
+    return events
+
+
+FEED_EVENTS = {
+    'doctor': doctor_events,
+    'client': client_events,
+}
+
+
+def escape(text):
+    return text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\r\n', '\\n').replace(
+        '\n', '\\n'
+    )
+
+
+def fold(line):
+    """Split the content line into lines of at most 75 octets, continuation lines start with a space"""
+    parts, current, size = [], [], 0
+    for char in line:
+        length = len(char.encode('utf-8'))
+        if size + length > 75:
+            parts.append(''.join(current))
+            current, size = [' '], 1
+        current.append(char)
+        size += length
+    parts.append(''.join(current))
+    return '\r\n'.join(parts)
+
+
+def render_feed(events, today):
+    """
+    iCalendar text of the events, times are floating local times of the hospital.
+
+    DTSTAMP is the start of the day, so the text depends only on the data and the day.
+    """
+    stamp = f'{today:%Y%m%d}T000000Z'
+    lines = ['BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//Hospital//Calendar//EN', 'CALSCALE:GREGORIAN']
+    for event in events:
+        lines += [
+            'BEGIN:VEVENT',
+            f"UID:{event['uid']}@hospital",
+            f'DTSTAMP:{stamp}',
+            f"DTSTART:{event['start']:%Y%m%dT%H%M%S}",
+            f"DTEND:{event['end']:%Y%m%dT%H%M%S}",
+            f"SUMMARY:{escape(event['summary'])}",
+        ]
+        if event.get('description'):
+            lines.append(f"DESCRIPTION:{escape(event['description'])}")
+        if event.get('location'):
+            lines.append(f"LOCATION:{escape(event['location'])}")
+        if event.get('transparent'):
+            lines.append('TRANSP:TRANSPARENT')
+        lines.append('END:VEVENT')
+    lines.append('END:VCALENDAR')
+    return '\r\n'.join(fold(line) for line in lines) + '\r\n'
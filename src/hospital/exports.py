@@ -0,0 +1,120 @@
+import csv
+import zlib
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Booking, Feedback, Review, Visit
+
+
+class Export:
+    """Rows of a model for one hospital and a range of dates, columns are (header, lookup) pairs"""
+
+    def __init__(self, model, hospital, date, columns):
+        self.model = model
+        self.hospital = hospital
+        self.date = date
+        self.columns = columns
+
+    @property
+    def header(self):
+        return [header for header, lookup in self.columns]
+
+    def rows(self, hospital_id, date_from, date_to, chunk_size=None):
+        """
+        Tuples of column values ordered by date, read through a server-side cursor.
+
+        Only chunk_size rows are held in memory at a time, no matter how many
+        rows the export has.
+        """
+        return self.model.objects.filter(**{
+            self.hospital: hospital_id, f'{self.date}__gte': date_from, f'{self.date}__lte': date_to,
+        }).order_by(self.date, 'pk').values_list(
+            *[lookup for header, lookup in self.columns]
+        ).iterator(chunk_size=chunk_size or settings.EXPORT_CHUNK_SIZE)
+
+
+EXPORTS = {
+    'bookings': Export(Booking, 'visit__doctor__hospital', 'visit__date', [
+        ('id', 'id'), ('visit', 'visit_id'), ('date', 'visit__date'), ('time', 'visit__time'),
+        ('doctor', 'visit__doctor_id'), ('doctor_first_name', 'visit__doctor__first_name'),
+        ('doctor_last_name', 'visit__doctor__last_name'), ('client', 'client_id'),
+        ('client_first_name', 'client__first_name'), ('client_last_name', 'client__last_name'),
+        ('service', 'service'),
+    ]),
+    'visits': Export(Visit, 'doctor__hospital', 'date', [
+        ('id', 'id'), ('date', 'date'), ('time', 'time'), ('doctor', 'doctor_id'),
+        ('doctor_first_name', 'doctor__first_name'), ('doctor_last_name', 'doctor__last_name'),
+        ('booking', 'booking_visit__id'),
+    ]),
+    'reviews': Export(Review, 'hospital', 'created_at__date', [
+        ('id', 'id'), ('created_at', 'created_at'), ('author', 'author_id'), ('rating', 'rating__value'),
+        ('text', 'text'),
+    ]),
+    'feedbacks': Export(Feedback, 'doctor__hospital', 'created_at__date', [
+        ('id', 'id'), ('created_at', 'created_at'), ('doctor', 'doctor_id'), ('author', 'author_id'),
+        ('rating', 'rating__value'), ('text', 'text'),
+    ]),
+}
+
+
+class Line:
+    """File-like object which returns what is written, so csv.writer can produce lines one by one"""
+
+    def write(self, value):
+        return value
+
+
+def csv_chunks(header, rows, lines_per_chunk=100):
+    """CSV text in chunks of lines, small writes make streaming slow"""
+    writer = csv.writer(Line())
+    chunk = [writer.writerow(header)]
+    for row in rows:
+        chunk.append(writer.writerow(row))
+        if len(chunk) >= lines_per_chunk:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def ndjson_chunks(header, rows, lines_per_chunk=100):
+    """One JSON object per line, dates and times as ISO strings"""
+    encoder = DjangoJSONEncoder()
+    chunk = []
+    for row in rows:
+        chunk.append(encoder.encode(dict(zip(header, row))) + '\n')
+        if len(chunk) >= lines_per_chunk:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+FORMATS = {
+    'csv': (csv_chunks, 'text/csv'),
+    'ndjson': (ndjson_chunks, 'application/x-ndjson'),
+}
+
+
+def encoded(chunks):
+    for chunk in chunks:
+        yield chunk.encode('utf-8')
+
+
+def gzipped(chunks):
+    """Gzip compressed bytes of the chunks, compressed as they come"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_chunks(name, hospital_id, date_from, date_to, output='csv', compress=False):
+    """Bytes of an export in chunks, see EXPORTS and FORMATS"""
+    export = EXPORTS[name]
+    write = FORMATS[output][0]
+    chunks = encoded(write(export.header, export.rows(hospital_id, date_from, date_to)))
+    return gzipped(chunks) if compress else chunks
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.mail import send_mass_mail
+
+from users.models import Client
+from .outbox import handler
+
+BOOKING_MESSAGES = {
+    'booking.created': ('Your visit is booked', 'Your visit on {date} at {time} is booked.'),
+    'booking.moved': ('Your visit is moved', 'Your visit is moved to {date} at {time}.'),
+    'booking.cancelled': ('Your visit is cancelled', 'Your visit on {date} at {time} is cancelled.'),
+}
+
+
+@handler(*BOOKING_MESSAGES)
+def notify_clients(events):
+    """Send one email per booking event, with all emails of the batch sent over one connection"""
+    emails = dict(Client.objects.filter(
+        pk__in={event.payload['client'] for event in events}
+    ).values_list('pk', 'user__email'))
+    messages = []
+    for event in events:
+        if event.payload['client'] in emails:
+            subject, text = BOOKING_MESSAGES[event.topic]
+            messages.append((
+                subject, text.format(**event.payload), settings.DEFAULT_FROM_EMAIL, [emails[event.payload['client']]]
+            ))
+    send_mass_mail(messages)
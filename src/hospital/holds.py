@@ -0,0 +1,167 @@
+import threading
+import time
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import APIException
+
+
+class HoldsUnavailable(APIException):
+    status_code = 503
+    default_detail = 'Visits can not be held right now, try again later.'
+    default_code = 'holds_unavailable'
+
+
+HOLD_SCRIPT = """
+local holder = redis.call('GET', KEYS[1])
+if holder and holder ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+redis.call('ZADD', KEYS[2], ARGV[3], ARGV[4])
+return 1
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+redis.call('ZREM', KEYS[2], ARGV[2])
+return 1
+"""
+
+
+class RedisHoldStore:
+    """
+    Holds kept in Redis, shared by all processes.
+
+    Every hold is a key which expires by itself, plus a member of a sorted set
+    of the doctor's held visits scored by expiry time, so listing a doctor's
+    visits reads only that doctor's holds. Expired members are trimmed
+    whenever held visits are read, so nothing ever scans for expired holds.
+    When Redis is down holds are ignored and bookings work as if there were none.
+    """
+
+    def __init__(self):
+        self.redis = redis.Redis.from_url(
+            settings.VISIT_HOLDS_REDIS_URL, socket_connect_timeout=1, socket_timeout=1
+        )
+        self.hold_script = self.redis.register_script(HOLD_SCRIPT)
+        self.release_script = self.redis.register_script(RELEASE_SCRIPT)
+
+    def visit_key(self, visit_id):
+        return f'holds:visit:{visit_id}'
+
+    def held_key(self, doctor_id):
+        return f'holds:doctor:{doctor_id}'
+
+    def hold(self, visit_id, doctor_id, client_id, ttl):
+        """Hold the visit for the client, or extend client's hold. False when somebody else holds it"""
+        try:
+            return bool(self.hold_script(
+                keys=[self.visit_key(visit_id), self.held_key(doctor_id)],
+                args=[client_id, ttl, time.time() + ttl, visit_id]
+            ))
+        except redis.RedisError:
+            raise HoldsUnavailable()
+
+    def release(self, visit_id, doctor_id, client_id):
+        try:
+            return bool(self.release_script(
+                keys=[self.visit_key(visit_id), self.held_key(doctor_id)], args=[client_id, visit_id]
+            ))
+        except redis.RedisError:
+            raise HoldsUnavailable()
+
+    def holder(self, visit_id):
+        """Id of the client holding the visit, None when it is not held"""
+        try:
+            client_id = self.redis.get(self.visit_key(visit_id))
+        except redis.RedisError:
+            return None
+        return int(client_id) if client_id else None
+
+    def held_visits(self, doctor_ids):
+        """Ids of currently held visits of the doctors"""
+        now = time.time()
+        try:
+            pipeline = self.redis.pipeline()
+            for doctor_id in doctor_ids:
+                pipeline.zremrangebyscore(self.held_key(doctor_id), '-inf', now)
+                pipeline.zrangebyscore(self.held_key(doctor_id), now, '+inf')
+            return {int(visit_id) for visits in pipeline.execute()[1::2] for visit_id in visits}
+        except redis.RedisError:
+            return set()
+
+    def held_among(self, visit_ids):
+        """Which of the visits are currently held, with one MGET"""
+        visit_ids = list(visit_ids)
+        if not visit_ids:
+            return set()
+        try:
+            holders = self.redis.mget([self.visit_key(visit_id) for visit_id in visit_ids])
+        except redis.RedisError:
+            return set()
+        return {visit_id for visit_id, holder in zip(visit_ids, holders) if holder}
+
+
+class InMemoryHoldStore:
+    """Holds kept in the process memory, a stand-in for Redis in tests and development"""
+
+    def __init__(self):
+        self.holds = {}
+        self.lock = threading.Lock()
+
+    def hold(self, visit_id, doctor_id, client_id, ttl):
+        with self.lock:
+            if self.holder_now(visit_id) not in (None, client_id):
+                return False
+            self.holds[visit_id] = (client_id, time.monotonic() + ttl, doctor_id)
+            return True
+
+    def release(self, visit_id, doctor_id, client_id):
+        with self.lock:
+            if self.holder_now(visit_id) != client_id:
+                return False
+            del self.holds[visit_id]
+            return True
+
+    def holder(self, visit_id):
+        with self.lock:
+            return self.holder_now(visit_id)
+
+    def held_visits(self, doctor_ids):
+        doctor_ids = set(doctor_ids)
+        with self.lock:
+            return {
+                visit_id for visit_id in list(self.holds)
+                if self.holder_now(visit_id) is not None and self.holds[visit_id][2] in doctor_ids
+            }
+
+    def held_among(self, visit_ids):
+        with self.lock:
+            return {visit_id for visit_id in visit_ids if self.holder_now(visit_id) is not None}
+
+    def holder_now(self, visit_id):
+        client_id, expires, doctor_id = self.holds.get(visit_id, (None, 0, None))
+        if client_id is not None and expires <= time.monotonic():
+            del self.holds[visit_id]
+            return None
+        return client_id
+
+    def clear(self):
+        with self.lock:
+            self.holds.clear()
+
+
+@lru_cache(maxsize=None)
+def _store(backend):
+    return import_string(backend)()
+
+
+def hold_store():
+    """Hold store configured by VISIT_HOLDS_BACKEND, one per process"""
+    return _store(settings.VISIT_HOLDS_BACKEND)
@@ -0,0 +1,62 @@
+from functools import lru_cache
+from urllib.parse import quote
+
+from django.urls import get_script_prefix, get_urlconf, reverse
+from django.utils.http import RFC3986_SUBDELIMS
+from rest_framework import serializers
+
+# Digits pass both int and str path converters and do not occur in our routes
+MARKER = 7130508491
+SAFE = RFC3986_SUBDELIMS + '/~:@'
+
+
+@lru_cache(maxsize=None)
+def _route_template(view_name, kwargs, script_prefix, urlconf):
+    markers = {name: str(MARKER + number) for number, name in enumerate(kwargs)}
+    path = reverse(view_name, kwargs=markers, urlconf=urlconf)
+    for name, marker in markers.items():
+        path = path.replace(marker, '{%s}' % name)
+    return path
+
+
+def route_template(view_name, *kwargs):
+    """Path of the route with ``{kwarg}`` placeholders, reversed once per route and script prefix"""
+    return _route_template(view_name, kwargs, get_script_prefix(), get_urlconf())
+
+
+def url_template(request, view_name, *kwargs):
+    """Absolute URL template of the route for the request, relative path without a request"""
+    path = route_template(view_name, *kwargs)
+    if request is None:
+        return path
+    return f'{request.scheme}://{request.get_host()}{path}'
+
+
+def format_url(template, **kwargs):
+    return template.format(**{name: quote(str(value), safe=SAFE) for name, value in kwargs.items()})
+
+
+class TemplateURLField(serializers.Field):
+    """
+    Absolute URL of a route for the object.
+
+    The route is resolved once per serializer, list serializers share the
+    child, so rows only cost a string substitution of ``lookup_field``.
+    """
+
+    def __init__(self, view_name, lookup_field='pk', lookup_url_kwarg=None, **kwargs):
+        self.view_name = view_name
+        self.lookup_field = lookup_field
+        self.lookup_url_kwarg = lookup_url_kwarg or lookup_field
+        self.template = None
+        kwargs['read_only'] = True
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, obj):
+        return self.url(getattr(obj, self.lookup_field))
+
+    def url(self, lookup_value):
+        if self.template is None:
+            self.template = url_template(self.context.get('request'), self.view_name, self.lookup_url_kwarg)
+        return format_url(self.template, **{self.lookup_url_kwarg: lookup_value})
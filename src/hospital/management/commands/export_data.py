@@ -0,0 +1,33 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hospital.exports import EXPORTS, FORMATS, export_chunks
+
+
+class Command(BaseCommand):
+    help = 'Write bookings, visits, reviews or feedbacks of a hospital for a range of dates as CSV or NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=list(EXPORTS))
+        parser.add_argument('--hospital', type=int, required=True)
+        parser.add_argument('--date-from', type=date.fromisoformat, default=date.today())
+        parser.add_argument('--date-to', type=date.fromisoformat)
+        parser.add_argument('--format', dest='output', choices=list(FORMATS), default='csv')
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('--output', dest='path', help='File to write, standard output by default')
+
+    def handle(self, *args, **options):
+        if options['gzip'] and not options['path']:
+            raise CommandError('--gzip needs --output.')
+        chunks = export_chunks(
+            options['name'], options['hospital'], options['date_from'], options['date_to'] or options['date_from'],
+            options['output'], options['gzip']
+        )
+        if options['path']:
+            with open(options['path'], 'wb') as file:
+                for chunk in chunks:
+                    file.write(chunk)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk.decode('utf-8'), ending='')
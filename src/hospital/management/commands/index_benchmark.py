@@ -0,0 +1,162 @@
+import json
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from users.models import MyUser, Client, Doctor
+from hospital import views
+from hospital.models import Hospital, FreeSlot, HospitalLike, OutboxEvent, Review, Feedback, ScheduleRule
+from hospital.schedule_generator import schedule_horizon
+
+# Tables big enough that a sequential scan on them is a missing index
+LARGE_TABLES = {
+    'hospital_visit', 'hospital_booking', 'hospital_schedule', 'hospital_freeslot', 'hospital_review',
+    'hospital_feedback', 'hospital_hospitallike', 'hospital_doctorlike', 'hospital_outboxevent',
+}
+SLOTS_PER_DAY = 16
+
+
+def view_queryset(view_class, user=None, **kwargs):
+    """Queryset a list view pages through, ordered the way its paginator orders it"""
+    request = Request(APIRequestFactory().get('/'))
+    request.user = user or AnonymousUser()
+    view = view_class(request=request, args=(), kwargs=kwargs, format_kwarg=None)
+    queryset = view.get_queryset()
+    ordering = getattr(view, 'ordering', None)
+    return queryset.order_by(*ordering) if ordering else queryset
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', ()):
+        yield from plan_nodes(child)
+
+
+def describe(node):
+    scan = f"{node['Node Type']} on {node['Relation Name']}"
+    return f"{scan} using {node['Index Name']}" if 'Index Name' in node else scan
+
+
+class Command(BaseCommand):
+    help = 'Check with EXPLAIN that queries of the busiest endpoints use indexes, optionally on generated data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed-visits', type=int, default=0, help='Generate about this many visits first')
+        parser.add_argument('--hospitals', type=int, default=100)
+        parser.add_argument('--doctors', type=int, default=1000)
+        parser.add_argument('--clients', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Query plans are checked only on PostgreSQL.')
+        if options['seed_visits']:
+            self.seed(options['seed_visits'], options['hospitals'], options['doctors'], options['clients'])
+
+        doctor = Doctor.objects.filter(visits__isnull=False).select_related('user').first()
+        client = Client.objects.filter(booking__isnull=False).select_related('user').first()
+        if doctor is None or client is None:
+            raise CommandError('There is no doctor with visits or client with bookings, use --seed-visits.')
+
+        failed = [name for name, queryset in self.queries(doctor, client) if not self.explain_query(name, queryset)]
+        if failed:
+            raise CommandError(f'Sequential scans of large tables in: {", ".join(failed)}')
+        self.stdout.write(self.style.SUCCESS('All queries use indexes'))
+
+    def queries(self, doctor, client):
+        today = date.today()
+        page = slice(0, 26)
+        return [
+            ('doctor visits', view_queryset(views.VisitListAPIView, pk=doctor.pk)[page]),
+            ('availability', FreeSlot.objects.filter(
+                date__gte=today, date__lte=today + timedelta(days=7)
+            ).order_by('date', 'time', 'visit_id')[page]),
+            ('doctor bookings', view_queryset(views.BookingListAPIView, doctor.user)[page]),
+            ('client bookings', view_queryset(views.BookingListAPIView, client.user)[page]),
+            ('doctor schedule', view_queryset(views.ScheduleListCreateAPIView, doctor.user)[page]),
+            ('hospital doctors', view_queryset(views.DoctorsByHospitalsListAPIView, pk=doctor.hospital_id)[page]),
+            ('review check', Review.objects.filter(hospital_id=doctor.hospital_id, author=client)),
+            ('feedback check', Feedback.objects.filter(doctor=doctor, author=client)),
+            ('hospital like', HospitalLike.objects.filter(user=client, hospital_id=doctor.hospital_id)),
+            ('rules to extend', ScheduleRule.objects.filter(materialized_until__lt=schedule_horizon())),
+            ('pending events', OutboxEvent.objects.filter(processed_at__isnull=True).order_by('id')[:100]),
+        ]
+
+    def explain_query(self, name, queryset):
+        started = time.monotonic()
+        plan = json.loads(queryset.explain(format='json'))[0]['Plan']
+        seconds = time.monotonic() - started
+        scans = [describe(node) for node in plan_nodes(plan) if 'Relation Name' in node]
+        ok = not any(
+            node['Node Type'] == 'Seq Scan' and node['Relation Name'] in LARGE_TABLES for node in plan_nodes(plan)
+        )
+        style = self.style.SUCCESS if ok else self.style.ERROR
+        self.stdout.write(style(f'{name}: cost {plan["Total Cost"]}, planned in {seconds:.3f}s'))
+        for scan in scans:
+            self.stdout.write(f'    {scan}')
+        return ok
+
+    @transaction.atomic
+    def seed(self, visits, hospitals, doctors, clients):
+        """Generate hospitals, doctors, clients, schedules, visits, bookings and free slots with set-based inserts"""
+        password = make_password(None)
+        stamp = int(time.time())
+        hospitals = Hospital.objects.bulk_create([
+            Hospital(
+                title=f'Hospital {stamp}-{number}', short_title='Hospital', type='Private', description='Generated',
+                opening_time='08:00', closing_time='20:00', address='Street'
+            )
+            for number in range(hospitals)
+        ])
+        doctor_users = MyUser.objects.bulk_create([
+            MyUser(email=f'doctor{stamp}-{number}@example.com', password=password, is_doctor=True)
+            for number in range(doctors)
+        ], batch_size=1000)
+        client_users = MyUser.objects.bulk_create([
+            MyUser(email=f'client{stamp}-{number}@example.com', password=password) for number in range(clients)
+        ], batch_size=1000)
+        Doctor.objects.bulk_create([
+            Doctor(
+                user=user, first_name='Doctor', last_name=str(user.pk), visit_duration=30,
+                hospital=hospitals[number % len(hospitals)]
+            )
+            for number, user in enumerate(doctor_users)
+        ], batch_size=1000)
+        Client.objects.bulk_create([
+            Client(user=user, first_name='Client', last_name=str(user.pk), phone_number='+380000000000', gender='Male')
+            for user in client_users
+        ], batch_size=1000)
+        days = max(visits // (doctors * SLOTS_PER_DAY), 1)
+        past = days // 2
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO hospital_schedule (doctor_id, date, time_from, time_to, periodicity) '
+                "SELECT doctor.id, CURRENT_DATE - %s + day, time '08:00', time '16:00', 'Every day' "
+                'FROM users_doctor doctor, generate_series(0, %s - 1) day ON CONFLICT DO NOTHING', [past, days]
+            )
+            cursor.execute(
+                'INSERT INTO hospital_visit (doctor_id, date, time) '
+                "SELECT doctor.id, CURRENT_DATE - %s + day, time '08:00' + slot * interval '30 minutes' "
+                'FROM users_doctor doctor, generate_series(0, %s - 1) day, generate_series(0, %s - 1) slot '
+                'ON CONFLICT DO NOTHING', [past, days, SLOTS_PER_DAY]
+            )
+            cursor.execute(
+                'INSERT INTO hospital_booking (visit_id, client_id) '
+                'SELECT visit.id, bounds.first + visit.id %% bounds.amount FROM hospital_visit visit, '
+                '(SELECT MIN(id) AS first, COUNT(*) AS amount FROM users_client) bounds '
+                'WHERE visit.id %% 3 = 0 ON CONFLICT DO NOTHING'
+            )
+            cursor.execute(
+                'INSERT INTO hospital_freeslot (visit_id, doctor_id, hospital_id, date, time) '
+                'SELECT visit.id, visit.doctor_id, doctor.hospital_id, visit.date, visit.time '
+                'FROM hospital_visit visit JOIN users_doctor doctor ON doctor.id = visit.doctor_id '
+                'WHERE visit.date >= CURRENT_DATE AND NOT EXISTS '
+                '(SELECT 1 FROM hospital_booking booking WHERE booking.visit_id = visit.id) ON CONFLICT DO NOTHING'
+            )
+            cursor.execute('ANALYZE')
+        self.stdout.write(f'Generated {doctors} doctors, {clients} clients and {days} days of visits')
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from hospital.partitions import PARTITIONED, convert_to_partitioned, ensure_future_partitions, is_partitioned, \
+    partitions
+
+
+class Command(BaseCommand):
+    help = 'Partition visits and schedules by month and create partitions ahead of time (PostgreSQL only)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true', help='Convert tables which are not partitioned yet')
+        parser.add_argument('--months', type=int, default=settings.DATE_PARTITIONS_AHEAD)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Partitioning is supported only on PostgreSQL.')
+        for model in PARTITIONED:
+            if not is_partitioned(model):
+                if not options['convert']:
+                    self.stdout.write(f'{model._meta.db_table} is not partitioned, use --convert')
+                    continue
+                convert_to_partitioned(model)
+        ensure_future_partitions(months_ahead=options['months'])
+        for model in PARTITIONED:
+            if is_partitioned(model):
+                months = partitions(model)
+                self.stdout.write(self.style.SUCCESS(
+                    f'{model._meta.db_table}: {len(months)} partitions up to {months[-1]:%Y-%m}'
+                ))
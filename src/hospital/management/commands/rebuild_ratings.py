@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from users.models import Doctor
+from hospital.models import Hospital, Review, Feedback
+from hospital.ratings import average
+
+
+class Command(BaseCommand):
+    help = 'Recompute rating sums, amounts and averages of hospitals and doctors from reviews and feedbacks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        hospitals = self.rebuild(Hospital, Review, 'hospital', 'reviews_amount', options['batch_size'])
+        doctors = self.rebuild(Doctor, Feedback, 'doctor', 'feedbacks_amount', options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt ratings of {hospitals} hospitals and {doctors} doctors'))
+
+    def rebuild(self, model, ratings, target, amount, batch_size):
+        """Update objects in primary key ranges, each range with two set-based UPDATEs"""
+        rated = ratings.objects.filter(**{target: OuterRef('pk')}).order_by().values(target)
+        total = Subquery(rated.annotate(total=Sum('rating__value')).values('total'), output_field=IntegerField())
+        count = Subquery(rated.annotate(count=Count('id')).values('count'), output_field=IntegerField())
+
+        ids = model.objects.order_by('pk').values_list('pk', flat=True)
+        rebuilt = 0
+        last = None
+        while True:
+            chunk = list((ids.filter(pk__gt=last) if last else ids)[:batch_size])
+            if not chunk:
+                return rebuilt
+            objects = model.objects.filter(pk__in=chunk)
+            with transaction.atomic():
+                objects.update(**{'rating_sum': Coalesce(total, 0), amount: Coalesce(count, 0)})
+                objects.update(rating=average('rating_sum', amount))
+            rebuilt += len(chunk)
+            last = chunk[-1]
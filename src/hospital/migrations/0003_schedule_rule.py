@@ -0,0 +1,40 @@
+# Generated by Django 3.2.3 on 2026-10-18 14:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('hospital', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='schedule',
+            name='periodicity',
+            field=models.CharField(blank=True, choices=[('Every day', 'Every day'), ('Every week', 'Every week'), ('Except weekend', 'Except weekend'), ('Once', 'Once'), ('Custom', 'Custom')], max_length=255, null=True),
+        ),
+        migrations.CreateModel(
+            name='ScheduleRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rrule', models.CharField(max_length=255)),
+                ('exdates', models.TextField(blank=True, default='')),
+                ('dtstart', models.DateField()),
+                ('ends_on', models.DateField(blank=True, null=True)),
+                ('time_from', models.TimeField()),
+                ('time_to', models.TimeField()),
+                ('periodicity', models.CharField(choices=[('Every day', 'Every day'), ('Every week', 'Every week'), ('Except weekend', 'Except weekend'), ('Once', 'Once'), ('Custom', 'Custom')], default='Custom', max_length=255)),
+                ('materialized_until', models.DateField(blank=True, null=True)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='schedule_rules', to='users.doctor')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='schedule',
+            name='rule',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='schedules', to='hospital.schedulerule'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 3.2.3 on 2026-10-18 14:47
+
+import datetime
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def index_free_visits(apps, schema_editor):
+    Visit = apps.get_model('hospital', 'Visit')
+    FreeSlot = apps.get_model('hospital', 'FreeSlot')
+    rows = Visit.objects.filter(date__gte=datetime.date.today(), booking_visit__isnull=True).values_list(
+        'id', 'doctor_id', 'doctor__hospital_id', 'date', 'time'
+    )
+    FreeSlot.objects.bulk_create(
+        [
+            FreeSlot(visit_id=visit, doctor_id=doctor, hospital_id=hospital, date=date, time=time)
+            for visit, doctor, hospital, date, time in rows.iterator()
+        ],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('hospital', '0003_schedule_rule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FreeSlot',
+            fields=[
+                ('visit', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='free_slot', serialize=False, to='hospital.visit')),
+                ('date', models.DateField()),
+                ('time', models.TimeField()),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='free_slots', to='users.doctor')),
+                ('hospital', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='free_slots', to='hospital.hospital')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='freeslot',
+            index=models.Index(fields=['date', 'time'], name='hospital_fr_date_052e9d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='freeslot',
+            index=models.Index(fields=['hospital', 'date', 'time'], name='hospital_fr_hospita_0b2e70_idx'),
+        ),
+        migrations.RunPython(index_free_visits, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.3 on 2026-10-18 14:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0004_free_slot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='hospital',
+            index=models.Index(fields=['-hospital_likes_amount', 'id'], name='hospital_ho_hospita_3a2d6a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visit',
+            index=models.Index(fields=['doctor', 'date', 'time'], name='hospital_vi_doctor__ab9b14_idx'),
+        ),
+    ]
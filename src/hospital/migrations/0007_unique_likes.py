@@ -0,0 +1,41 @@
+# Generated by Django 3.2.3 on 2026-10-18 14:52
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_likes(apps, schema_editor):
+    """Keep the first like of every user and recount likes of affected objects"""
+    for like_model, target, counter_model, counter in (
+        ('HospitalLike', 'hospital', ('hospital', 'Hospital'), 'hospital_likes_amount'),
+        ('DoctorLike', 'doctor', ('users', 'Doctor'), 'doctor_likes_amount'),
+    ):
+        Like = apps.get_model('hospital', like_model)
+        Counted = apps.get_model(*counter_model)
+        duplicates = Like.objects.values('user', target).annotate(first=Min('id'), likes=Count('id')).filter(likes__gt=1)
+        for duplicate in duplicates:
+            Like.objects.filter(user=duplicate['user'], **{target: duplicate[target]}).exclude(
+                id=duplicate['first']
+            ).delete()
+            Counted.objects.filter(pk=duplicate[target]).update(
+                **{counter: Like.objects.filter(**{target: duplicate[target]}).count()}
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0006_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_likes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='doctorlike',
+            constraint=models.UniqueConstraint(fields=('user', 'doctor'), name='unique_doctor_like'),
+        ),
+        migrations.AddConstraint(
+            model_name='hospitallike',
+            constraint=models.UniqueConstraint(fields=('user', 'hospital'), name='unique_hospital_like'),
+        ),
+    ]
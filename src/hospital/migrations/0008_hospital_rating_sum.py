@@ -0,0 +1,45 @@
+# Generated by Django 3.2.3 on 2026-10-18 14:53
+
+from django.db import migrations, models
+from django.db.models import Case, Count, DecimalField, F, FloatField, IntegerField, OuterRef, Subquery, Sum, Value, \
+    When
+from django.db.models.functions import Cast, Coalesce
+
+
+def compute_rating_sums(apps, schema_editor):
+    """Start running sums and amounts from existing reviews and feedbacks, with averages computed from them"""
+    for rated_model, ratings_model, target, amount in (
+        (('hospital', 'Hospital'), 'Review', 'hospital', 'reviews_amount'),
+        (('users', 'Doctor'), 'Feedback', 'doctor', 'feedbacks_amount'),
+    ):
+        Rated = apps.get_model(*rated_model)
+        Ratings = apps.get_model('hospital', ratings_model)
+        rated = Ratings.objects.filter(**{target: OuterRef('pk')}).order_by().values(target)
+        total = rated.annotate(total=Sum('rating__value')).values('total')
+        count = rated.annotate(count=Count('id')).values('count')
+        Rated.objects.update(**{
+            'rating_sum': Coalesce(Subquery(total, output_field=IntegerField()), 0),
+            amount: Coalesce(Subquery(count, output_field=IntegerField()), 0),
+        })
+        Rated.objects.update(rating=Case(
+            When(**{f'{amount}__lte': 0}, then=Value(0)),
+            default=Cast(F('rating_sum'), FloatField()) / F(amount),
+            output_field=DecimalField(max_digits=3, decimal_places=2)
+        ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0007_unique_likes'),
+        ('users', '0003_doctor_rating_sum'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hospital',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(compute_rating_sums, migrations.RunPython.noop),
+    ]
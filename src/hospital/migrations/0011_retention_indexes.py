@@ -0,0 +1,21 @@
+# Generated by Django 3.2.3 on 2026-10-18 15:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0010_outbox_event'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='schedule',
+            index=models.Index(fields=['date'], name='hospital_sc_date_c49307_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visit',
+            index=models.Index(fields=['date'], name='hospital_vi_date_7818a0_idx'),
+        ),
+    ]
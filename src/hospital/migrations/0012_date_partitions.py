@@ -0,0 +1,81 @@
+from datetime import date
+
+from django.conf import settings
+from django.db import migrations, transaction
+
+# The SQL is kept here instead of using hospital.partitions, the migration must not change with app code
+
+
+def next_month(day):
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def convert(model, schema_editor):
+    """Turn the table into a table partitioned by month of ``date``, keeping its rows, see hospital.partitions"""
+    quote = schema_editor.connection.ops.quote_name
+    table = model._meta.db_table
+    legacy = f'{table}_legacy'
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)', [table])
+        row = cursor.fetchone()
+        if row and row[0] == 'p':
+            return
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+        sequence = cursor.fetchone()[0]
+        cursor.execute(f'SELECT MIN(date), MAX(date) FROM {quote(table)}')
+        first, last = cursor.fetchone()
+        today = date.today()
+
+        cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY NONE')
+        cursor.execute(f'ALTER TABLE {quote(table)} RENAME TO {quote(legacy)}')
+        cursor.execute(
+            f'CREATE TABLE {quote(table)} (LIKE {quote(legacy)} INCLUDING DEFAULTS) PARTITION BY RANGE (date)'
+        )
+        cursor.execute(f'CREATE TABLE {quote(table + "_default")} PARTITION OF {quote(table)} DEFAULT')
+        # Months of existing rows and the next three months, later months are created by extend_partitions
+        month = min(first or today, today).replace(day=1)
+        end = max(last or today, today)
+        for _ in range(3):
+            end = next_month(end)
+        while month <= end:
+            cursor.execute(
+                f'CREATE TABLE {quote(f"{table}_p{month:%Y%m}")} PARTITION OF {quote(table)} '
+                f'FOR VALUES FROM (%s) TO (%s)', [month, next_month(month)]
+            )
+            month = next_month(month)
+        cursor.execute(f'INSERT INTO {quote(table)} SELECT * FROM {quote(legacy)}')
+        cursor.execute(f'DROP TABLE {quote(legacy)} CASCADE')
+        cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY {quote(table)}.id')
+        cursor.execute(f'ALTER TABLE {quote(table)} ADD PRIMARY KEY (id, date)')
+
+    for field in model._meta.local_fields:
+        if field.remote_field and field.db_constraint:
+            schema_editor.execute(schema_editor._create_fk_sql(model, field, '_fk_%(to_table)s_%(to_column)s'))
+        if field.db_index and not field.unique:
+            schema_editor.execute(schema_editor._create_index_sql(model, fields=[field]))
+    schema_editor.alter_unique_together(model, [], model._meta.unique_together)
+    for constraint in model._meta.constraints:
+        schema_editor.add_constraint(model, constraint)
+    for index in model._meta.indexes:
+        schema_editor.add_index(model, index)
+
+
+def partition_tables(apps, schema_editor):
+    """Partition visits and schedules by month when DATE_PARTITIONS is on, only PostgreSQL supports it"""
+    if schema_editor.connection.vendor != 'postgresql' or not settings.DATE_PARTITIONS:
+        return
+    for name in ('Schedule', 'Visit'):
+        with transaction.atomic(using=schema_editor.connection.alias):
+            convert(apps.get_model('hospital', name), schema_editor)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('hospital', '0011_retention_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_tables, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 3.2.3 on 2026-10-18 15:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0012_date_partitions'),
+    ]
+
+    operations = [
+        # The new unique index of visits is built before the ones it replaces are dropped
+        migrations.AddConstraint(
+            model_name='visit',
+            constraint=models.UniqueConstraint(fields=('doctor', 'date', 'time'), name='unique_visit_slot'),
+        ),
+        migrations.RemoveConstraint(
+            model_name='booking',
+            name='unique_booking_idempotency_key',
+        ),
+        migrations.RemoveIndex(
+            model_name='visit',
+            name='hospital_vi_doctor__ab9b14_idx',
+        ),
+        migrations.AlterUniqueTogether(
+            name='visit',
+            unique_together=set(),
+        ),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['doctor', 'author'], name='hospital_fe_doctor__08f9d9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='outboxevent',
+            index=models.Index(condition=models.Q(('processed_at__isnull', False)), fields=['processed_at'], name='outbox_processed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['hospital', 'author'], name='hospital_re_hospita_d4bc71_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='schedulerule',
+            index=models.Index(fields=['materialized_until'], name='hospital_sc_materia_90d43e_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='booking',
+            constraint=models.UniqueConstraint(condition=models.Q(('idempotency_key__isnull', False)), fields=('client', 'idempotency_key'), name='unique_booking_idempotency_key'),
+        ),
+    ]
@@ -1,14 +1,20 @@
+from datetime import date
+
 from django.db import models
+from django.db.models import F
 from django.core.validators import RegexValidator
 
 from users.models import Doctor, Client
+from .caching import invalidate
+from .recurrence import RecurrenceRule
 
 
 SCHEDULE_CHOICES = (
     ('Every day', 'Every day'),
     ('Every week', 'Every week'),
     ('Except weekend', 'Except weekend'),
-    ('Once', 'Once')
+    ('Once', 'Once'),
+    ('Custom', 'Custom')
 )
 
 
@@ -30,13 +36,26 @@ class Hospital(models.Model):
     reviews_amount = models.PositiveIntegerField(default=0)
     hospital_likes_amount = models.PositiveIntegerField(default=0)
     rating = models.DecimalField(default=0, max_digits=3, decimal_places=2)
+    rating_sum = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-hospital_likes_amount', 'id']),
+        ]
 
     def __str__(self):
         return self.short_title
 
     def add_like(self):
-        self.hospital_likes_amount += 1
-        self.save()
+        """Increment likes counter in the database, without touching other columns"""
+        Hospital.objects.filter(pk=self.pk).update(hospital_likes_amount=F('hospital_likes_amount') + 1)
+        ChangeLog.objects.create(model='hospital', object_id=self.pk)
+        invalidate(Hospital)
+
+    def remove_like(self):
+        Hospital.objects.filter(pk=self.pk).update(hospital_likes_amount=F('hospital_likes_amount') - 1)
+        ChangeLog.objects.create(model='hospital', object_id=self.pk)
+        invalidate(Hospital)
 
 
 class Service(models.Model):
@@ -67,6 +86,11 @@ class Review(models.Model):
     created_at = models.DateTimeField(auto_now=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['hospital', 'author']),
+        ]
+
 
 class HospitalLike(models.Model):
     """Likes for hospitals"""
@@ -74,6 +98,11 @@ class HospitalLike(models.Model):
     user = models.ForeignKey(Client, related_name='hospital_likes', on_delete=models.CASCADE)
     hospital = models.ForeignKey(Hospital, related_name='likes', on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'hospital'], name='unique_hospital_like'),
+        ]
+
 
 class Specialization(models.Model):
     """Doctor services specialization"""
@@ -95,6 +124,11 @@ class Feedback(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     doctor = models.ForeignKey(Doctor, related_name='feedbacks', on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['doctor', 'author']),
+        ]
+
 
 class DoctorLike(models.Model):
     """Likes for doctors"""
@@ -102,6 +136,40 @@ class DoctorLike(models.Model):
     user = models.ForeignKey(Client, related_name='doctor_likes', on_delete=models.CASCADE)
     doctor = models.ForeignKey(Doctor, related_name='likes', on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'doctor'], name='unique_doctor_like'),
+        ]
+
+
+class ScheduleRule(models.Model):
+    """Recurrence rule of doctor's schedule, materialized into schedules ahead of time"""
+    doctor = models.ForeignKey(Doctor, related_name='schedule_rules', on_delete=models.CASCADE)
+    rrule = models.CharField(max_length=255)
+    exdates = models.TextField(blank=True, default='')
+    dtstart = models.DateField()
+    ends_on = models.DateField(null=True, blank=True)
+    time_from = models.TimeField(auto_now=False, auto_now_add=False)
+    time_to = models.TimeField(auto_now=False, auto_now_add=False)
+    periodicity = models.CharField(max_length=255, choices=SCHEDULE_CHOICES, default='Custom')
+    materialized_until = models.DateField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['materialized_until']),
+        ]
+
+    def __str__(self):
+        return f'{self.doctor}: {self.rrule}'
+
+    @property
+    def recurrence(self):
+        return RecurrenceRule.parse(self.rrule)
+
+    @property
+    def exdate_list(self):
+        return [date.fromisoformat(value) for value in self.exdates.split(',') if value]
+
 
 class Schedule(models.Model):
     """Doctor's Schedule"""
@@ -110,9 +178,13 @@ class Schedule(models.Model):
     time_to = models.TimeField(auto_now=False, auto_now_add=False)
     date = models.DateField()
     periodicity = models.CharField(max_length=255, choices=SCHEDULE_CHOICES, null=True, blank=True)
+    rule = models.ForeignKey(ScheduleRule, related_name='schedules', on_delete=models.SET_NULL, null=True, blank=True)
 
     class Meta:
         unique_together = ['doctor', 'date']
+        indexes = [
+            models.Index(fields=['date']),
+        ]
 
 
 class Visit(models.Model):
@@ -122,17 +194,95 @@ class Visit(models.Model):
     date = models.DateField()
 
     class Meta:
-        unique_together = ['doctor', 'time', 'date']
+        # Visits of a doctor are listed by date and time, the unique index serves that order
+        constraints = [
+            models.UniqueConstraint(fields=['doctor', 'date', 'time'], name='unique_visit_slot'),
+        ]
+        indexes = [
+            models.Index(fields=['date']),
+        ]
 
     def __str__(self):
         return f'{self.id}. Doctor: {self.doctor.first_name}, Date: {self.date}, Time: {self.time}'
 
 
+class FreeSlot(models.Model):
+    """Denormalized index of free visits, used by availability search"""
+    visit = models.OneToOneField(Visit, related_name='free_slot', on_delete=models.CASCADE, primary_key=True)
+    doctor = models.ForeignKey(Doctor, related_name='free_slots', on_delete=models.CASCADE)
+    hospital = models.ForeignKey(Hospital, related_name='free_slots', on_delete=models.CASCADE, null=True, blank=True)
+    date = models.DateField()
+    time = models.TimeField(auto_now=False, auto_now_add=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date', 'time']),
+            models.Index(fields=['hospital', 'date', 'time']),
+        ]
+
+
 class Booking(models.Model):
     """Model for booking a visit to doctor"""
     visit = models.OneToOneField(Visit, related_name='booking_visit', on_delete=models.CASCADE)
     client = models.ForeignKey(Client, verbose_name='clients', on_delete=models.CASCADE)
     service = models.TextField(null=True, blank=True)
+    idempotency_key = models.CharField(max_length=255, null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['client', 'idempotency_key'], condition=models.Q(idempotency_key__isnull=False),
+                name='unique_booking_idempotency_key'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.client} : {self.visit}'
+
+
+class OutboxEvent(models.Model):
+    """Event of a change, written in the transaction of the change and handled later by a worker"""
+    topic = models.CharField(max_length=64)
+    payload = models.JSONField(default=dict)
+    dedup_key = models.CharField(max_length=255, unique=True, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(processed_at__isnull=True), name='outbox_pending_idx'),
+            models.Index(
+                fields=['processed_at'], condition=models.Q(processed_at__isnull=False), name='outbox_processed_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.id}. {self.topic}'
+
+
+class ChangeLog(models.Model):
+    """
+    Insert, update or delete of a synced row, ids are the cursors of delta sync.
+
+    Rows are not referenced by foreign keys, so deletes are kept as tombstones.
+    ``doctor_id`` and ``client_id`` tell whose sync the change belongs to,
+    hospital changes belong to everyone.
+    """
+    model = models.CharField(max_length=16)
+    object_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    doctor_id = models.IntegerField(null=True, blank=True)
+    client_id = models.IntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'id']),
+            models.Index(fields=['doctor_id', 'id']),
+            models.Index(fields=['client_id', 'id']),
+        ]
+
+    def __str__(self):
+        return f'{self.id}. {"Deleted" if self.deleted else "Changed"} {self.model} {self.object_id}'
@@ -0,0 +1,79 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboxEvent
+
+HANDLERS = defaultdict(list)
+
+
+def handler(*topics):
+    """Register a function handling lists of events of the topics"""
+    def register(function):
+        for topic in topics:
+            HANDLERS[topic].append(function)
+        return function
+    return register
+
+
+def event(topic, dedup_key=None, **payload):
+    return OutboxEvent(topic=topic, dedup_key=dedup_key, payload=payload)
+
+
+def booking_event(topic, booking, visit, dedup_key=None):
+    """Event of a booking change, with everything needed to tell the client about it"""
+    return event(
+        topic, dedup_key or booking.pk and f'{topic}:{booking.pk}', booking=booking.pk, client=booking.client_id,
+        visit=visit.pk, doctor=visit.doctor_id, date=str(visit.date), time=visit.time.strftime('%H:%M')
+    )
+
+
+def publish(topic, dedup_key=None, **payload):
+    """Write an event in the current transaction, events with a known dedup_key are ignored"""
+    publish_events([event(topic, dedup_key, **payload)])
+
+
+def publish_events(events):
+    """Write events in the current transaction with one query"""
+    OutboxEvent.objects.bulk_create(events, ignore_conflicts=True)
+
+
+def drain(batch_size=None):
+    """
+    Handle a batch of pending events, returns the number of handled events.
+
+    Events are locked with SKIP LOCKED, so several workers can drain at once.
+    Every topic is handled in its own savepoint: when a handler fails, events
+    of the topic stay pending and are retried by a later drain, up to
+    OUTBOX_MAX_ATTEMPTS times. Delivery is at least once, handlers have to
+    be idempotent.
+    """
+    with transaction.atomic():
+        events = list(OutboxEvent.objects.select_for_update(skip_locked=True).filter(
+            processed_at__isnull=True, attempts__lt=settings.OUTBOX_MAX_ATTEMPTS
+        ).order_by('id')[:batch_size or settings.OUTBOX_BATCH_SIZE])
+        by_topic = defaultdict(list)
+        for outbox_event in events:
+            by_topic[outbox_event.topic].append(outbox_event)
+
+        handled, failed = [], []
+        for topic, topic_events in by_topic.items():
+            try:
+                with transaction.atomic():
+                    for topic_handler in HANDLERS[topic]:
+                        topic_handler(topic_events)
+            except Exception as error:
+                for outbox_event in topic_events:
+                    outbox_event.attempts += 1
+                    outbox_event.last_error = repr(error)
+                failed.extend(topic_events)
+            else:
+                handled.extend(topic_events)
+
+        OutboxEvent.objects.filter(pk__in=[outbox_event.pk for outbox_event in handled]).update(
+            processed_at=timezone.now()
+        )
+        OutboxEvent.objects.bulk_update(failed, ['attempts', 'last_error'])
+    return len(handled)
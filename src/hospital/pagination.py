@@ -0,0 +1,129 @@
+import json
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination which continues right after the last row of previous page.
+
+    Views set ``ordering``, which has to be unique (end it with ``id``) and backed by an index,
+    so every page costs one index range scan no matter how deep it is.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('id',)
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return api_settings.PAGE_SIZE
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_ordering(self, view):
+        return tuple(getattr(view, 'ordering', None) or self.ordering)
+
+    def decode_cursor(self, request, parsers=None):
+        """
+        Values of ordering fields of the last row of previous page, None for the first page.
+
+        ``parsers`` convert the values one by one, e.g. ``date.fromisoformat``,
+        cursors of another length or with values they reject are invalid.
+        """
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            position = json.loads(b64decode(cursor.encode('ascii')).decode('utf-8'))
+            if not isinstance(position, list) or (parsers is not None and len(position) != len(parsers)):
+                raise ValueError('Cursor does not match the ordering')
+            if parsers is not None:
+                position = [parse(value) for parse, value in zip(parsers, position)]
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def encode_cursor(self, position):
+        return b64encode(json.dumps(position, default=str).encode('utf-8')).decode('ascii')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        Return one page of rows.
+
+        Querysets are ordered and filtered here, other iterables must already
+        start right after the cursor (see ``decode_cursor``).
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(view)
+
+        if isinstance(queryset, QuerySet):
+            position = self.decode_cursor(request)
+            queryset = queryset.order_by(*self.ordering)
+            if position is not None:
+                if len(position) != len(self.ordering):
+                    raise NotFound(self.invalid_cursor_message)
+                try:
+                    queryset = queryset.filter(self.after(position))
+                except (TypeError, ValueError, ValidationError):
+                    # Values the fields can not take, e.g. a string for a date
+                    raise NotFound(self.invalid_cursor_message)
+        rows = list(queryset[:self.page_size + 1])
+
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_position = [self.value(rows[-1], field) for field in self.ordering] if self.has_next else None
+        return rows
+
+    def after(self, position):
+        """Condition matching rows which come after the position in the ordering"""
+        first = self.ordering[0]
+        condition = Q(**{first.lstrip('-') + ('__lte' if first.startswith('-') else '__gte'): position[0]})
+        following = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            following |= Q(**equal, **{name + ('__lt' if field.startswith('-') else '__gt'): value})
+            equal[name] = value
+        # The first condition is implied by the second one, it lets the database use an index range scan
+        return condition & following
+
+    def value(self, row, field):
+        if isinstance(row, dict):
+            return row[field.lstrip('-')]
+        value = row
+        for name in field.lstrip('-').split('__'):
+            value = getattr(value, name)
+        return value
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data)
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,168 @@
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import Booking, FreeSlot, Schedule, Visit
+
+PARTITIONED = (Schedule, Visit)
+# Rows which reference visits, they have to go before a partition of visits is dropped
+VISIT_REFERENCES = ((Booking, 'visit_id'), (FreeSlot, 'visit_id'))
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(day):
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def months(start, end):
+    """First days of months from the month of start up to the month of end, inclusive"""
+    month = month_start(start)
+    while month <= end:
+        yield month
+        month = next_month(month)
+
+
+def partition_name(model, month):
+    return f'{model._meta.db_table}_p{month:%Y%m}'
+
+
+def quote(name):
+    return connection.ops.quote_name(name)
+
+
+def is_partitioned(model):
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)', [model._meta.db_table])
+        row = cursor.fetchone()
+    return bool(row) and row[0] == 'p'
+
+
+def partitions(model):
+    """Months of existing monthly partitions of the model's table"""
+    prefix = f'{model._meta.db_table}_p'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+            'WHERE pg_inherits.inhparent = to_regclass(%s)', [model._meta.db_table]
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    return sorted(
+        date(int(name[-6:-2]), int(name[-2:]), 1) for name in names
+        if name.startswith(prefix) and name[len(prefix):].isdigit()
+    )
+
+
+def create_partitions(model, start, end):
+    """
+    Create monthly partitions covering dates from start to end which do not exist yet.
+
+    Rows of a new month which are already in the DEFAULT partition, e.g. visits
+    generated further ahead than the partitions, would make a plain
+    ``PARTITION OF`` fail. The partition is created as a plain table, the rows
+    are moved into it and it is attached, all in one transaction.
+    """
+    table = model._meta.db_table
+    default = f'{table}_default'
+    for month in months(start, end):
+        name = partition_name(model, month)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('SELECT to_regclass(%s), to_regclass(%s)', [name, default])
+            exists, has_default = cursor.fetchone()
+            if exists:
+                continue
+            cursor.execute(
+                f'CREATE TABLE {quote(name)} (LIKE {quote(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+            )
+            if has_default:
+                cursor.execute(
+                    f'WITH moved AS (DELETE FROM {quote(default)} WHERE date >= %s AND date < %s RETURNING *) '
+                    f'INSERT INTO {quote(name)} SELECT * FROM moved', [month, next_month(month)]
+                )
+            cursor.execute(
+                f'ALTER TABLE {quote(table)} ATTACH PARTITION {quote(name)} FOR VALUES FROM (%s) TO (%s)',
+                [month, next_month(month)]
+            )
+
+
+def ensure_future_partitions(models=PARTITIONED, months_ahead=None):
+    """Create partitions of partitioned tables from this month up to months_ahead months ahead"""
+    months_ahead = months_ahead or settings.DATE_PARTITIONS_AHEAD
+    end = date.today()
+    for _ in range(months_ahead):
+        end = next_month(end)
+    for model in models:
+        if is_partitioned(model):
+            create_partitions(model, date.today(), end)
+
+
+def drop_partitions(model, before):
+    """
+    Drop whole monthly partitions with dates up to ``before``, returns dropped partition names.
+
+    Dropping a partition is a metadata change, rows referencing dropped
+    visits are deleted first.
+    """
+    if not is_partitioned(model):
+        return []
+    dropped = []
+    for month in partitions(model):
+        if next_month(month) > before + timedelta(days=1):
+            break
+        name = quote(partition_name(model, month))
+        with transaction.atomic(), connection.cursor() as cursor:
+            if model is Visit:
+                for reference, column in VISIT_REFERENCES:
+                    cursor.execute(
+                        f'DELETE FROM {quote(reference._meta.db_table)} '
+                        f'WHERE {quote(column)} IN (SELECT id FROM {name})'
+                    )
+            cursor.execute(f'DROP TABLE {name}')
+        dropped.append(partition_name(model, month))
+    return dropped
+
+
+def convert_to_partitioned(model):
+    """
+    Turn the model's table into a table partitioned by month of ``date``, keeping its rows.
+
+    The primary key becomes (id, date), because keys of partitioned tables must
+    contain the partition column. For the same reason foreign keys which reference
+    visits are dropped from the database, Django keeps cascading deletes itself.
+    Runs in one transaction and locks the table while rows are copied.
+    """
+    table = model._meta.db_table
+    legacy = f'{table}_legacy'
+    with connection.schema_editor() as schema_editor, connection.cursor() as cursor:
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+        sequence = cursor.fetchone()[0]
+        cursor.execute(f'SELECT MIN(date), MAX(date) FROM {quote(table)}')
+        first, last = cursor.fetchone()
+
+        cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY NONE')
+        cursor.execute(f'ALTER TABLE {quote(table)} RENAME TO {quote(legacy)}')
+        cursor.execute(
+            f'CREATE TABLE {quote(table)} (LIKE {quote(legacy)} INCLUDING DEFAULTS) PARTITION BY RANGE (date)'
+        )
+        cursor.execute(f'CREATE TABLE {quote(table + "_default")} PARTITION OF {quote(table)} DEFAULT')
+        create_partitions(model, first or date.today(), next_month(last or date.today()))
+        cursor.execute(f'INSERT INTO {quote(table)} SELECT * FROM {quote(legacy)}')
+        cursor.execute(f'DROP TABLE {quote(legacy)} CASCADE')
+        cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY {quote(table)}.id')
+        cursor.execute(f'ALTER TABLE {quote(table)} ADD PRIMARY KEY (id, date)')
+
+        for field in model._meta.local_fields:
+            if field.remote_field and field.db_constraint:
+                schema_editor.execute(schema_editor._create_fk_sql(model, field, '_fk_%(to_table)s_%(to_column)s'))
+            if field.db_index and not field.unique:
+                schema_editor.execute(schema_editor._create_index_sql(model, fields=[field]))
+        schema_editor.alter_unique_together(model, [], model._meta.unique_together)
+        for constraint in model._meta.constraints:
+            schema_editor.add_constraint(model, constraint)
+        for index in model._meta.indexes:
+            schema_editor.add_index(model, index)
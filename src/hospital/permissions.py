@@ -21,12 +21,21 @@ class IsVisitOwner(BasePermission):
     """
     def has_object_permission(self, request, view, obj):
         if request.method in SAFE_METHODS:
-            if obj.booking_visit.client.user == request.user:
+            if obj.booking_visit.client.user_id == request.user.id:
                 return True
         else:
             return obj.doctor == request.user.user_doctor
 
 
+class IsHospitalAdmin(BasePermission):
+    """Permission for admins of a hospital, checked once per request, anonymous users have no admin flag"""
+    def has_permission(self, request, view):
+        if not getattr(request.user, 'is_hospital_admin', False):
+            return False
+        admin = getattr(request.user, 'user_hospital_admin', None)
+        return bool(admin and admin.hospital_id)
+
+
 class IsBookingAdmin(BasePermission):
     def has_object_permission(self, request, view, obj):
-        return obj.visit.doctor.hospital == request.user.hospital_admin.hospital
+        return obj.visit.doctor.hospital_id == request.user.user_hospital_admin.hospital_id
@@ -0,0 +1,37 @@
+from django.db.models import Case, DecimalField, F, FloatField, Value, When
+from django.db.models.functions import Cast
+
+from .caching import invalidate
+from .models import ChangeLog, Hospital
+
+
+def average(rating_sum, amount):
+    """Average rating expression, 0 when nothing is rated"""
+    return Case(
+        When(**{f'{amount}__lte': 0}, then=Value(0)),
+        default=Cast(F(rating_sum), FloatField()) / F(amount),
+        output_field=DecimalField(max_digits=3, decimal_places=2)
+    )
+
+
+def change_rating(model, pk, amount_field, delta_sum, delta_amount):
+    """
+    Add a change of ratings to running sum and amount of the object in one UPDATE.
+
+    The average is computed in the same statement from the old column values plus
+    the deltas, so concurrent changes never overwrite each other.
+    """
+    new_sum = F('rating_sum') + delta_sum
+    new_amount = F(amount_field) + delta_amount
+    model.objects.filter(pk=pk).update(**{
+        'rating_sum': new_sum,
+        amount_field: new_amount,
+        'rating': Case(
+            When(**{f'{amount_field}__lte': -delta_amount}, then=Value(0)),
+            default=Cast(new_sum, FloatField()) / new_amount,
+            output_field=DecimalField(max_digits=3, decimal_places=2)
+        ),
+    })
+    if model is Hospital:
+        ChangeLog.objects.create(model='hospital', object_id=pk)
+    invalidate(model)
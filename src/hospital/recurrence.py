@@ -0,0 +1,131 @@
+from datetime import datetime, timedelta
+
+WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+FREQUENCIES = {'DAILY': 1, 'WEEKLY': 7}
+
+PERIODICITY_RULES = {
+    'Every day': 'FREQ=DAILY',
+    'Every week': 'FREQ=WEEKLY',
+    'Except weekend': 'FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR',
+    'Once': 'FREQ=DAILY;COUNT=1',
+}
+
+
+class RecurrenceRule:
+    """
+    Subset of iCalendar RRULE: FREQ (DAILY or WEEKLY), INTERVAL, BYDAY, UNTIL and COUNT.
+
+    Example: ``FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE;UNTIL=20211231``
+    """
+
+    def __init__(self, freq, interval=1, byday=None, until=None, count=None):
+        self.freq = freq
+        self.interval = interval
+        self.byday = byday
+        self.until = until
+        self.count = count
+
+    @classmethod
+    def parse(cls, text):
+        """Build a rule from its string form, raises ValueError for unsupported rules"""
+        parts = _split_parts(text)
+        freq = parts.pop('FREQ', None)
+        if freq not in FREQUENCIES:
+            raise ValueError('FREQ must be one of: ' + ', '.join(FREQUENCIES))
+        rule = cls(freq)
+        if 'INTERVAL' in parts:
+            rule.interval = _positive(parts.pop('INTERVAL'), 'INTERVAL')
+        if 'BYDAY' in parts:
+            days = parts.pop('BYDAY').split(',')
+            if any(day not in WEEKDAYS for day in days):
+                raise ValueError('BYDAY must contain only: ' + ','.join(WEEKDAYS))
+            rule.byday = sorted({WEEKDAYS.index(day) for day in days})
+        if 'UNTIL' in parts:
+            rule.until = datetime.strptime(parts.pop('UNTIL')[:8], '%Y%m%d').date()
+        if 'COUNT' in parts:
+            rule.count = _positive(parts.pop('COUNT'), 'COUNT')
+        if rule.until and rule.count:
+            raise ValueError('UNTIL and COUNT can not be used together.')
+        if parts:
+            raise ValueError('Unsupported rule parts: ' + ', '.join(parts))
+        return rule
+
+    def __str__(self):
+        parts = [f'FREQ={self.freq}']
+        if self.interval != 1:
+            parts.append(f'INTERVAL={self.interval}')
+        if self.byday:
+            parts.append('BYDAY=' + ','.join(WEEKDAYS[day] for day in self.byday))
+        if self.until:
+            parts.append('UNTIL=' + self.until.strftime('%Y%m%d'))
+        if self.count:
+            parts.append(f'COUNT={self.count}')
+        return ';'.join(parts)
+
+    def _periods(self, dtstart, start):
+        """Yield first day of each period of the rule, skipping periods which end before start"""
+        length = FREQUENCIES[self.freq] * self.interval
+        first = dtstart
+        if self.freq == 'WEEKLY':
+            first -= timedelta(days=dtstart.weekday())
+        index = 0
+        if not self.count and start > first:
+            # Without COUNT earlier periods do not matter, so jump right to the start
+            index = max((start - first).days // length - 1, 0)
+        while True:
+            yield first + timedelta(days=index * length)
+            index += 1
+
+    def _period_dates(self, period, dtstart):
+        if self.freq == 'DAILY':
+            if self.byday is None or period.weekday() in self.byday:
+                return [period]
+            return []
+        days = self.byday if self.byday is not None else [dtstart.weekday()]
+        return [period + timedelta(days=day) for day in days]
+
+    def occurrences(self, dtstart, start, end, exdates=()):
+        """Dates of the rule between start and end inclusive, except exdates"""
+        found = 0
+        result = []
+        for period in self._periods(dtstart, start):
+            if period > end or (self.until and period > self.until):
+                break
+            for date in self._period_dates(period, dtstart):
+                if date < dtstart:
+                    continue
+                if date > end or (self.until and date > self.until):
+                    return result
+                found += 1
+                if date >= start and date not in exdates:
+                    result.append(date)
+                if self.count and found >= self.count:
+                    return result
+        return result
+
+    def last_date(self, dtstart):
+        """Date of last occurrence, None for endless rules"""
+        if self.until:
+            return self.until
+        if self.count:
+            span = timedelta(weeks=self.interval * self.count + 1)
+            dates = self.occurrences(dtstart, dtstart, dtstart + span)
+            return dates[-1] if dates else dtstart
+        return None
+
+
+def _split_parts(text):
+    parts = {}
+    for part in text.upper().strip().strip(';').split(';'):
+        name, sep, value = part.partition('=')
+        if not sep or not value:
+            raise ValueError(f'Invalid rule part "{part}".')
+        parts[name.strip()] = value.strip()
+    return parts
+
+
+def _positive(value, name):
+    number = int(value)
+    if number < 1:
+        raise ValueError(f'{name} must be a positive number.')
+    return number
@@ -0,0 +1,113 @@
+import logging
+import time
+import uuid
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+
+from users.models import RefreshToken
+from .models import Booking, ChangeLog, FreeSlot, OutboxEvent, Schedule, Visit
+from .partitions import drop_partitions
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY = 'retention:lock'
+
+
+def purge_expired(before=None, chunk_size=None, archive=None):
+    """
+    Delete schedules and visits dated ``before`` or earlier, with bookings and free slots of the visits.
+
+    Whole months of partitioned tables are dropped as partitions, remaining
+    rows are deleted with plain DELETE statements in chunks of ids, each
+    chunk in its own short transaction, so no model instances are loaded,
+    no signals are sent and booking writes never wait long on locks. With
+    ``archive`` rows are copied to ``<table>_archive`` tables first.
+    Handled outbox events older than OUTBOX_KEEP_DAYS, changes older than
+    CHANGELOG_KEEP_DAYS and expired refresh tokens are purged too. Removed
+    visits, bookings and schedules get no sync tombstones, see ``hospital.sync``.
+    Returns the number of removed rows per table and seconds spent.
+    """
+    before = before or date.today() - timedelta(days=settings.RETENTION_DAYS)
+    chunk_size = chunk_size or settings.RETENTION_CHUNK_SIZE
+    archive = settings.RETENTION_ARCHIVE if archive is None else archive
+    started = time.monotonic()
+    report = {
+        model._meta.db_table: 0 for model in (Booking, FreeSlot, Visit, Schedule, OutboxEvent, ChangeLog, RefreshToken)
+    }
+    report['dropped_partitions'] = drop_partitions(Visit, before) + drop_partitions(Schedule, before)
+
+    expired_visits = Visit.objects.filter(date__lte=before).values_list('id', flat=True)
+    for ids in chunks(expired_visits, chunk_size):
+        with transaction.atomic():
+            report[Booking._meta.db_table] += delete_rows(Booking, 'visit_id', ids, archive)
+            report[FreeSlot._meta.db_table] += delete_rows(FreeSlot, 'visit_id', ids, archive)
+            report[Visit._meta.db_table] += delete_rows(Visit, 'id', ids, archive)
+
+    expired_schedules = Schedule.objects.filter(date__lte=before).values_list('id', flat=True)
+    for ids in chunks(expired_schedules, chunk_size):
+        with transaction.atomic():
+            report[Schedule._meta.db_table] += delete_rows(Schedule, 'id', ids, archive)
+
+    handled_events = OutboxEvent.objects.filter(
+        processed_at__lt=timezone.now() - timedelta(days=settings.OUTBOX_KEEP_DAYS)
+    ).values_list('id', flat=True)
+    for ids in chunks(handled_events, chunk_size):
+        report[OutboxEvent._meta.db_table] += delete_rows(OutboxEvent, 'id', ids, False)
+
+    old_changes = ChangeLog.objects.filter(
+        created_at__lt=timezone.now() - timedelta(days=settings.CHANGELOG_KEEP_DAYS)
+    ).values_list('id', flat=True)
+    for ids in chunks(old_changes, chunk_size):
+        report[ChangeLog._meta.db_table] += delete_rows(ChangeLog, 'id', ids, False)
+
+    expired_tokens = RefreshToken.objects.filter(expires_at__lt=timezone.now()).values_list('id', flat=True)
+    for ids in chunks(expired_tokens, chunk_size):
+        report[RefreshToken._meta.db_table] += delete_rows(RefreshToken, 'id', ids, False)
+
+    report['seconds'] = round(time.monotonic() - started, 3)
+    logger.info('Expired rows removed: %s', report)
+    return report
+
+
+def chunks(ids, chunk_size):
+    """Lists of at most chunk_size ids, each queried after the previous one is deleted"""
+    while True:
+        chunk = list(ids[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+
+
+def delete_rows(model, column, ids, archive):
+    """Delete rows of the model with column values in ids, copying them to the archive table first"""
+    table = connection.ops.quote_name(model._meta.db_table)
+    condition = f'{connection.ops.quote_name(column)} IN ({", ".join(["%s"] * len(ids))})'
+    with connection.cursor() as cursor:
+        if archive:
+            archive_table = connection.ops.quote_name(f'{model._meta.db_table}_archive')
+            cursor.execute(f'CREATE TABLE IF NOT EXISTS {archive_table} AS SELECT * FROM {table} WHERE 1 = 0')
+            cursor.execute(f'INSERT INTO {archive_table} SELECT * FROM {table} WHERE {condition}', ids)
+        cursor.execute(f'DELETE FROM {table} WHERE {condition}', ids)
+        return cursor.rowcount
+
+
+def purge_expired_once(**options):
+    """
+    Run purge_expired unless another worker runs it already, returns its report or None.
+
+    The lock is a key added to the shared cache, it expires by itself when
+    a worker dies holding it.
+    """
+    token = uuid.uuid4().hex
+    if not cache.add(LOCK_KEY, token, settings.RETENTION_LOCK_TIMEOUT):
+        logger.info('Expired rows are being removed by another worker')
+        return None
+    try:
+        return purge_expired(**options)
+    finally:
+        if cache.get(LOCK_KEY) == token:
+            cache.delete(LOCK_KEY)
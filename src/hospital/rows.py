@@ -0,0 +1,118 @@
+from operator import methodcaller
+
+from django.db.models import QuerySet
+from rest_framework import ISO_8601, serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from .links import TemplateURLField
+
+
+def temporal_formatter(field, default_format):
+    output_format = getattr(field, 'format', default_format)
+    if output_format is None:
+        return None
+    if output_format.lower() == ISO_8601:
+        return methodcaller('isoformat')
+    return methodcaller('strftime', output_format)
+
+
+def file_formatter(field, model_field):
+    storage = model_field.storage
+    if not getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL):
+        return lambda name: name or None
+    request = field.context.get('request')
+
+    def url(name):
+        if not name:
+            return None
+        return request.build_absolute_uri(storage.url(name)) if request is not None else storage.url(name)
+    return url
+
+
+def value_formatter(field, model):
+    if isinstance(field, serializers.CharField):
+        return str
+    if isinstance(field, serializers.IntegerField):
+        return int
+    if isinstance(field, serializers.DateTimeField):
+        return field.to_representation
+    if isinstance(field, serializers.DateField):
+        return temporal_formatter(field, api_settings.DATE_FORMAT)
+    if isinstance(field, serializers.TimeField):
+        return temporal_formatter(field, api_settings.TIME_FORMAT)
+    if isinstance(field, serializers.FileField):
+        return file_formatter(field, model._meta.get_field(field.source))
+    return field.to_representation
+
+
+def compile_field(field, model):
+    """Column of the field and the function rendering its value, None when the value is rendered as it is"""
+    if isinstance(field, TemplateURLField):
+        return field.lookup_field, field.url
+    if isinstance(field, serializers.SlugRelatedField):
+        return f'{field.source}__{field.slug_field}', None
+    if '.' in field.source or field.source == '*' or isinstance(
+        field, (serializers.RelatedField, serializers.BaseSerializer, serializers.SerializerMethodField)
+    ):
+        raise TypeError(f'Field {field.field_name} needs model instances')
+    return field.source, value_formatter(field, model)
+
+
+class RowRenderer:
+    """
+    Render rows of a read-only model serializer from ``values()`` dicts.
+
+    Columns and formatters of the fields are compiled once, every row then
+    costs a dict lookup and at most one call per field. The output is the
+    same as of the serializer.
+    """
+
+    def __init__(self, serializer):
+        model = serializer.Meta.model
+        self.fields = [
+            (name, *compile_field(field, model))
+            for name, field in serializer.fields.items() if not field.write_only
+        ]
+
+    @property
+    def columns(self):
+        return [column for name, column, formatter in self.fields]
+
+    def render(self, rows):
+        fields = self.fields
+        return [
+            {
+                name: row[column] if formatter is None or row[column] is None else formatter(row[column])
+                for name, column, formatter in fields
+            }
+            for row in rows
+        ]
+
+
+class RowListMixin:
+    """
+    List view which renders its serializer with RowRenderer.
+
+    Only the serialized columns and the ordering columns are fetched. Views
+    whose queryset is not a QuerySet are serialized as usual.
+    """
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        if isinstance(queryset, QuerySet):
+            renderer = RowRenderer(self.get_serializer())
+            columns = renderer.columns
+            if self.paginator is not None:
+                ordering = self.paginator.get_ordering(self)
+                columns += [field.lstrip('-') for field in ordering if field.lstrip('-') not in columns]
+            queryset = queryset.values(*columns)
+            render = renderer.render
+        else:
+            def render(rows):
+                return self.get_serializer(rows, many=True).data
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(render(page))
+        return Response(render(queryset))
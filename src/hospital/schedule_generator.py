@@ -1,109 +1,119 @@
-from datetime import timedelta, datetime
+from datetime import date, timedelta, datetime
 
-from rest_framework.exceptions import APIException
+from django.conf import settings
+from django.db import transaction
+from rest_framework.exceptions import APIException, ValidationError
 
-from .models import Schedule, Visit
+from .availability import index_visits
+from .calendars import invalidate_calendars
+from .models import Schedule, ScheduleRule, Visit
+from .recurrence import PERIODICITY_RULES
+from .sync import record_rows
 
 
 def schedule_choose(serializer, doctor):
     """Call function to generate schedule. Depends on choice of periodicity"""
     date = serializer.data['date']
     date_time_obj = datetime.strptime(date, '%d/%m/%y %H:%M:%S')
-    time_from = datetime.strptime(serializer.data['time_from'], '%H:%M:%S')
-    time_to = datetime.strptime(serializer.data['time_to'], '%H:%M:%S')
-
-    if serializer.validated_data['periodicity'] == 'Every week':
-        return every_week_schedule(date_time_obj, time_from, time_to, doctor)
-    elif serializer.validated_data['periodicity'] == 'Except weekend':
-        return except_weekend_schedule(date_time_obj, time_from, time_to, doctor)
-    elif serializer.validated_data['periodicity'] == 'Every day':
-        return every_day_schedule(date_time_obj, time_from, time_to, doctor)
-    else:
-        return one_day_schedule(date_time_obj, time_from, time_to, doctor)
-
-
-def visits_generator(date, time_from, time_to, user):
-    """Generates a bunch of visits, for range of dates"""
-    visits = []
-    time = time_from
-    while time < time_to:
-        visits.append(Visit(
-            date=date,
-            time=time,
-            doctor=user
-        ))
-        time += timedelta(minutes=int(user.visit_duration))
-    Visit.objects.bulk_create(visits)
-
-
-def one_day_schedule(date, time_from, time_to, user):
-    """Generates one schedule object for one day"""
-    visits_generator(date, time_from, time_to, user)
-
-    return Schedule.objects.create(
-        time_from=time_from,
-        time_to=time_to,
-        date=date,
-        doctor=user,
-        periodicity='Once'
+    time_from = datetime.strptime(serializer.data['time_from'], '%H:%M:%S').time()
+    time_to = datetime.strptime(serializer.data['time_to'], '%H:%M:%S').time()
+    periodicity = serializer.validated_data['periodicity'] or 'Once'
+
+    if periodicity == 'Once':
+        if Schedule.objects.filter(doctor=doctor, date=date_time_obj.date()).exists():
+            raise ValidationError('Doctor already has a schedule on this date.')
+        return generate_schedule(doctor, [date_time_obj.date()], time_from, time_to, periodicity)
+    return create_rule(
+        doctor, PERIODICITY_RULES[periodicity], date_time_obj.date(), time_from, time_to, periodicity=periodicity
     )
 
 
-def every_day_schedule(date, time_from, time_to, user):
-    """"Generates schedules for all days in month, starting from chosen date"""
-    current_month = date.strftime("%B")
-    schedules = []
-    while current_month == date.strftime("%B"):
-        schedules.append(
-            Schedule(
-                time_from=time_from,
-                time_to=time_to,
-                date=date,
-                doctor=user,
-                periodicity='Every day'
-            ))
-        visits_generator(date, time_from, time_to, user)
-        date += timedelta(days=1)
-
-    return Schedule.objects.bulk_create(schedules)
-
-
-def every_week_schedule(date, time_from, time_to, user):
-    """Generates schedule for certain day of the week for all month, starting from chosen date"""
-    current_month = date.strftime("%B")
-    schedules = []
-    while current_month == date.strftime("%B"):
-        schedules.append(
-            Schedule(
-                time_from=time_from,
-                time_to=time_to,
-                date=date,
-                doctor=user,
-                periodicity='Every week'
-            ))
-        visits_generator(date, time_from, time_to, user)
-        date += timedelta(weeks=1)
-
-    return Schedule.objects.bulk_create(schedules)
-
-
-def except_weekend_schedule(date, time_from, time_to, user):
-    """"Generates schedules for all days in month except weekends, starting from chosen date"""
-    current_month = date.strftime("%B")
-    schedules = []
-    if date.isoweekday() > 5:
-        raise APIException('')
-    while current_month == date.strftime("%B"):
-        if date.isoweekday() > 5:
-            date += timedelta(days=2)
-        schedules.append(
-            Schedule(
-                time_from=time_from,
-                time_to=time_to,
-                date=date,
-                doctor=user,
-                periodicity='Except weekend'
-            ))
-        visits_generator(date, time_from, time_to, user)
-        date += timedelta(days=1)
-    return Schedule.objects.bulk_create(schedules)
+def schedule_horizon():
+    """Last date up to which recurring schedules are materialized"""
+    return date.today() + timedelta(weeks=settings.SCHEDULE_HORIZON_WEEKS)
+
+
+def create_rule(doctor, rrule, dtstart, time_from, time_to, exdates=(), periodicity='Custom'):
+    """Save a recurrence rule and materialize its schedules up to the horizon"""
+    rule = ScheduleRule(
+        doctor=doctor, rrule=rrule, dtstart=dtstart, time_from=time_from, time_to=time_to,
+        exdates=','.join(str(exdate) for exdate in sorted(exdates)), periodicity=periodicity
+    )
+    rule.ends_on = rule.recurrence.last_date(dtstart)
+    with transaction.atomic():
+        rule.save()
+        materialize_rule(rule)
+    return rule
+
+
+def materialize_rule(rule, horizon=None):
+    """Generate schedules of the rule which are not generated yet, up to the horizon"""
+    horizon = horizon or schedule_horizon()
+    if rule.ends_on and rule.ends_on < horizon:
+        horizon = rule.ends_on
+    start = max(rule.dtstart, date.today())
+    if rule.materialized_until:
+        start = max(start, rule.materialized_until + timedelta(days=1))
+    if start > horizon:
+        return []
+
+    dates = rule.recurrence.occurrences(rule.dtstart, start, horizon, rule.exdate_list)
+    with transaction.atomic():
+        schedules = generate_schedule(rule.doctor, dates, rule.time_from, rule.time_to, rule.periodicity, rule)
+        rule.materialized_until = horizon
+        rule.save(update_fields=['materialized_until'])
+    return schedules
+
+
+def visit_slots(dates, time_from, time_to, duration):
+    """All (date, time) pairs of visits for given dates and working hours"""
+    step = timedelta(minutes=duration)
+    times = []
+    time = datetime.combine(datetime.min, time_from)
+    end = datetime.combine(datetime.min, time_to)
+    while time < end:
+        times.append(time.time())
+        time += step
+    return [(date, time) for date in dates for time in times]
+
+
+def generate_schedule(doctor, dates, time_from, time_to, periodicity, rule=None):
+    """
+    Write schedules and visits for all dates in one transaction.
+
+    Rows are inserted in batches, already existing schedules or visits
+    of the doctor are left untouched, and dates which already have another
+    schedule get no visits. With VIRTUAL_VISITS only schedules are written,
+    visits are computed from them on read. Returns schedules of the dates
+    which have these working hours.
+    """
+    if not doctor.visit_duration:
+        raise APIException('Visit duration must be set before creating a schedule.')
+
+    schedules = [
+        Schedule(
+            doctor=doctor, date=date, time_from=time_from, time_to=time_to, periodicity=periodicity, rule=rule
+        )
+        for date in dates
+    ]
+    with transaction.atomic():
+        Schedule.objects.bulk_create(schedules, batch_size=settings.SCHEDULE_BATCH_SIZE, ignore_conflicts=True)
+        # Dates which kept a schedule with other hours are skipped, their visits would not be bookable
+        dates = set(Schedule.objects.filter(
+            doctor=doctor, date__in=dates, time_from=time_from, time_to=time_to
+        ).values_list('date', flat=True))
+        visits = []
+        if not settings.VIRTUAL_VISITS:
+            visits = [
+                Visit(doctor=doctor, date=date, time=time)
+                for date, time in visit_slots(sorted(dates), time_from, time_to, int(doctor.visit_duration))
+            ]
+        Visit.objects.bulk_create(visits, batch_size=settings.SCHEDULE_BATCH_SIZE, ignore_conflicts=True)
+        if visits:
+            index_visits(Visit.objects.filter(doctor=doctor, date__in=dates))
+        # Changes are written last, close to the commit, see hospital.sync.horizon
+        record_rows(Schedule.objects.filter(doctor=doctor, date__in=dates))
+        if visits:
+            record_rows(Visit.objects.filter(doctor=doctor, date__in=dates))
+        invalidate_calendars(doctors=[doctor.pk])
+    return [schedule for schedule in schedules if schedule.date in dates]
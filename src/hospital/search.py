@@ -0,0 +1,97 @@
+import unicodedata
+from difflib import SequenceMatcher
+
+from django.db import connection
+from django.db.models import F, FloatField, Func, Q, Value
+from django.db.models.functions import Greatest
+
+from users.models import Doctor
+from .models import Hospital, Specialization, Service
+
+
+class SearchText(Func):
+    """Lower-cased text without accents, the expression trigram indexes are built on"""
+    function = 'immutable_unaccent'
+    template = '%(function)s(lower(%(expressions)s))'
+
+
+class Similarity(Func):
+    """Trigram similarity of two texts, from 0 to 1"""
+    function = 'similarity'
+    output_field = FloatField()
+
+
+def normalize(text):
+    """Lower-case the text and strip accents, the same way as SearchText does"""
+    decomposed = unicodedata.normalize('NFKD', text.lower().strip())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def use_trigrams():
+    return connection.vendor == 'postgresql'
+
+
+def matching(queryset, fields, term, also=None):
+    """
+    Rows matching the term in any of fields, or the ``also`` condition.
+
+    On PostgreSQL rows match by trigram similarity (typos) or by substring and
+    both are served by trigram indexes. Other databases match case-insensitive
+    substrings only.
+    """
+    condition = also or Q()
+    if not use_trigrams():
+        for field in fields:
+            condition |= Q(**{field + '__icontains': term})
+        return queryset.filter(condition)
+
+    annotations = {f'search_{field}': SearchText(field) for field in fields}
+    for name in annotations:
+        condition |= Q(**{name + '__trigram_similar': term}) | Q(**{name + '__contains': term})
+    return queryset.annotate(**annotations).filter(condition)
+
+
+def ranked(queryset, fields, term, limit, also=None):
+    """Best matches of the term first, see ``matching``"""
+    rows = matching(queryset, fields, term, also)
+    if use_trigrams():
+        similarities = [Similarity(F(f'search_{field}'), Value(term)) for field in fields]
+        rank = similarities[0] if len(similarities) == 1 else Greatest(*similarities)
+        return list(rows.annotate(search_rank=rank).order_by('-search_rank', 'pk')[:limit])
+
+    def rank(row):
+        texts = [normalize(str(getattr(row, field) or '')) for field in fields]
+        return max(
+            (2 if text.startswith(term) else 1 if term in text else 0) + SequenceMatcher(None, term, text).ratio()
+            for text in texts
+        )
+    return sorted(rows.order_by('pk')[:limit * 10], key=rank, reverse=True)[:limit]
+
+
+def search_doctors(term, limit):
+    """Doctors by name, then doctors of matching specializations"""
+    specializations = matching(Specialization.objects.all(), ('title',), term).values('pk')
+    by_specialization = Q(pk__in=Doctor.specialization.through.objects.filter(
+        specialization__in=specializations
+    ).values('doctor_id'))
+    return ranked(Doctor.objects.all(), ('last_name', 'first_name'), term, limit, by_specialization)
+
+
+def search_hospitals(term, limit):
+    return ranked(Hospital.objects.all(), ('title', 'short_title', 'address'), term, limit)
+
+
+def search_specializations(term, limit):
+    return ranked(Specialization.objects.all(), ('title',), term, limit)
+
+
+def search_services(term, limit):
+    return ranked(Service.objects.all(), ('title',), term, limit)
+
+
+SEARCH_CATEGORIES = (
+    ('Doctors', search_doctors, lambda doctor: doctor.get_full_name),
+    ('Hospitals', search_hospitals, lambda hospital: hospital.title),
+    ('Specializations', search_specializations, lambda specialization: specialization.title),
+    ('Services', search_services, lambda service: service.title),
+)
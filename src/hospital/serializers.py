@@ -1,10 +1,16 @@
+from datetime import date
+
+from django.conf import settings
 from rest_framework import serializers
 
-from rest_framework.reverse import reverse
 from users.models import Doctor
 
 from .models import Hospital, Review, Specialization, Service, Schedule, Visit, Booking, HospitalLike, Feedback, \
-    DoctorLike
+    DoctorLike, ScheduleRule, FreeSlot
+from .recurrence import RecurrenceRule
+from .booking import book_slot, book_visit
+from .exports import FORMATS
+from .links import TemplateURLField
 
 
 class ReviewCreateSerializer(serializers.ModelSerializer):
@@ -68,11 +74,7 @@ class HospitalDetailSerializer(serializers.ModelSerializer):
 
 class SpecializationListSerializer(serializers.ModelSerializer):
     """"Serializer for list of doctor's Specializations"""
-    url = serializers.SerializerMethodField()
-
-    def get_url(self, obj):
-        request = self.context.get('request')
-        return request.build_absolute_uri(reverse('specializations', kwargs={"url": obj}))
+    url = TemplateURLField('specializations', lookup_field='url')
 
     class Meta:
         model = Specialization
@@ -81,11 +83,7 @@ class SpecializationListSerializer(serializers.ModelSerializer):
 
 class ServiceListSerializer(serializers.ModelSerializer):
     """"Serializer for list of hospital's Services"""
-    url = serializers.SerializerMethodField()
-
-    def get_url(self, obj):
-        request = self.context.get('request')
-        return request.build_absolute_uri(reverse('hospital-services', kwargs={"url": obj}))
+    url = TemplateURLField('hospital-services', lookup_field='url')
 
     class Meta:
         model = Service
@@ -102,6 +100,27 @@ class ScheduleSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class ScheduleRuleSerializer(serializers.ModelSerializer):
+    """Serializer for recurrence rules of doctor's schedule"""
+    exdates = serializers.ListField(child=serializers.DateField(), source='exdate_list', required=False)
+
+    class Meta:
+        model = ScheduleRule
+        fields = ['id', 'rrule', 'dtstart', 'time_from', 'time_to', 'exdates', 'ends_on', 'materialized_until']
+        read_only_fields = ['ends_on', 'materialized_until']
+
+    def validate_rrule(self, value):
+        try:
+            return str(RecurrenceRule.parse(value))
+        except ValueError as error:
+            raise serializers.ValidationError(str(error))
+
+    def validate(self, data):
+        if data['time_from'] >= data['time_to']:
+            raise serializers.ValidationError('Schedule must end after it starts.')
+        return data
+
+
 class VisitSerializer(serializers.ModelSerializer):
     """Serializer for visits(timespaces when client can visit a doctor)"""
     date = serializers.TimeField(format='%A')
@@ -113,23 +132,133 @@ class VisitSerializer(serializers.ModelSerializer):
         fields = ['id', 'date', 'time', 'doctor']
 
 
+class SearchParamsSerializer(serializers.Serializer):
+    """Query parameters of combined search"""
+    limit = serializers.IntegerField(min_value=1, max_value=50, default=settings.SEARCH_RESULTS_LIMIT)
+    autocomplete = serializers.BooleanField(default=False)
+
+
+class AvailabilitySearchSerializer(serializers.Serializer):
+    """Query parameters of availability search"""
+    specialization = serializers.SlugField(required=False)
+    hospital = serializers.IntegerField(required=False)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    time_from = serializers.TimeField(required=False)
+    time_to = serializers.TimeField(required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=25)
+
+
+class SyncParamsSerializer(serializers.Serializer):
+    """Query parameters of delta sync, ``since`` is the cursor of the previous sync"""
+    since = serializers.IntegerField(min_value=0, required=False)
+
+
+class ExportParamsSerializer(serializers.Serializer):
+    """Query parameters of exports"""
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    output = serializers.ChoiceField(choices=list(FORMATS), default='csv')
+    gzip = serializers.BooleanField(default=False)
+
+    def validate(self, data):
+        data['date_from'] = data.get('date_from', date.today())
+        data['date_to'] = data.get('date_to', data['date_from'])
+        if data['date_to'] < data['date_from']:
+            raise serializers.ValidationError('date_to must not be before date_from.')
+        return data
+
+
+class FreeSlotSerializer(serializers.ModelSerializer):
+    """Serializer for free visits found by availability search"""
+    doctor_name = serializers.CharField(source='doctor.get_full_name')
+    time = serializers.TimeField(format='%H:%M')
+
+    class Meta:
+        model = FreeSlot
+        fields = ['visit', 'doctor', 'doctor_name', 'hospital', 'date', 'time']
+
+
 class BookingCreateDestroySerializer(serializers.ModelSerializer):
     """Serializer for creating or deleting bookings"""
 
     class Meta:
         model = Booking
         fields = ['visit', 'service']
+        # Booked visits are rejected by the booking service with a conflict
+        extra_kwargs = {'visit': {'validators': []}}
+
+    def create(self, validated_data):
+        return book_visit(
+            validated_data['client'], validated_data['visit'].pk, validated_data.get('service'),
+            validated_data.get('idempotency_key')
+        )
+
+
+class SlotSerializer(serializers.Serializer):
+    """Slot of doctor's schedule by date and time, used to hold visits when visits are virtual"""
+    doctor = serializers.PrimaryKeyRelatedField(queryset=Doctor.objects.all())
+    date = serializers.DateField()
+    time = serializers.TimeField()
+
+
+class SlotBookingSerializer(serializers.ModelSerializer):
+    """Serializer for booking a visit by doctor, date and time, when visits are virtual"""
+    doctor = serializers.PrimaryKeyRelatedField(queryset=Doctor.objects.all(), source='visit.doctor')
+    date = serializers.DateField(source='visit.date')
+    time = serializers.TimeField(source='visit.time')
+
+    class Meta:
+        model = Booking
+        fields = ['doctor', 'date', 'time', 'service']
+
+    def create(self, validated_data):
+        slot = validated_data['visit']
+        return book_slot(
+            validated_data['client'], slot['doctor'], slot['date'], slot['time'], validated_data.get('service'),
+            validated_data.get('idempotency_key')
+        )
+
+
+class BulkCancelItemSerializer(serializers.Serializer):
+    booking = serializers.IntegerField()
+
+
+class BulkMoveItemSerializer(serializers.Serializer):
+    booking = serializers.IntegerField()
+    visit = serializers.IntegerField()
+
+
+class BulkCreateItemSerializer(serializers.Serializer):
+    visit = serializers.IntegerField()
+    client = serializers.IntegerField()
+    service = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+
+
+class BulkBookingSerializer(serializers.Serializer):
+    """Serializer for a batch of booking changes of one action"""
+    item_serializers = {
+        'cancel': BulkCancelItemSerializer,
+        'move': BulkMoveItemSerializer,
+        'create': BulkCreateItemSerializer,
+    }
+    action = serializers.ChoiceField(choices=list(item_serializers))
+    items = serializers.ListField(
+        child=serializers.DictField(), min_length=1, max_length=settings.BULK_BOOKING_MAX_ITEMS
+    )
+
+    def validate(self, data):
+        items = self.item_serializers[data['action']](data=data['items'], many=True)
+        if not items.is_valid():
+            raise serializers.ValidationError({'items': items.errors})
+        return dict(data, items=items.validated_data)
 
 
 class BookingListSerializer(serializers.ModelSerializer):
     """Serializer for listing bookings"""
     client = serializers.SlugRelatedField(slug_field='first_name', read_only=True)
 
-    visit = serializers.SerializerMethodField()
-
-    def get_visit(self, obj):
-        request = self.context.get('request')
-        return request.build_absolute_uri(reverse('visit-detail', kwargs={"pk": obj.visit.id}))
+    visit = TemplateURLField('visit-detail', lookup_field='visit_id', lookup_url_kwarg='pk')
 
     class Meta:
         model = Booking
@@ -1,7 +1,16 @@
-from django.db.models import Avg
-from django.db.models.signals import post_delete
+from datetime import datetime
+
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
 from django.dispatch import receiver
-from .models import Visit, Schedule, Review, Feedback
+from users.models import Doctor, MyUser
+from .availability import in_batch, occupy_slots, release_slots
+from .caching import invalidate
+from .calendars import forget_owner, invalidate_calendars, invalidate_showing
+from .models import Visit, Schedule, Review, Feedback, Booking, FreeSlot, Hospital, RatingStar, Specialization, \
+    Service
+from .outbox import booking_event, publish_events
+from .ratings import change_rating
+from .sync import record
 
 
 @receiver(post_delete, sender=Schedule)
@@ -10,27 +19,142 @@ def delete_visits(sender, instance, **kwargs):
         Visit.objects.filter(doctor=instance.doctor, date=instance.date).delete()
 
 
-@receiver(post_delete, sender=Review)
-def decrement_reviews_amount(sender, instance, **kwargs):
-    if sender == Review:
-        hospital = instance.hospital
-        average_ratings = Review.objects.filter(hospital=hospital).aggregate(Avg('rating__value'))
-        hospital.reviews_amount -= 1
-        if average_ratings['rating__value__avg'] is not None:
-            hospital.rating = float(average_ratings['rating__value__avg'])
-        else:
-            hospital.rating = 0
-        hospital.save()
+RATED = {
+    Review: ('hospital_id', Hospital, 'reviews_amount'),
+    Feedback: ('doctor_id', Doctor, 'feedbacks_amount'),
+}
+
+
+@receiver(pre_save, sender=Review)
+@receiver(pre_save, sender=Feedback)
+def remember_rating(sender, instance, raw=False, **kwargs):
+    """Remember rated object and stars of an updated review, to move them out of running sums"""
+    target = RATED[sender][0]
+    instance.rated_before = None
+    if instance.pk and not raw:
+        instance.rated_before = sender.objects.filter(pk=instance.pk).values_list(target, 'rating__value').first()
+
 
+@receiver(post_save, sender=Review)
+@receiver(post_save, sender=Feedback)
+def add_rating(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    target, model, amount = RATED[sender]
+    rated_id, value = getattr(instance, target), instance.rating.value
+    before = getattr(instance, 'rated_before', None)
+    if before and before[0] == rated_id:
+        change_rating(model, rated_id, amount, value - before[1], 0)
+        return
+    if before:
+        change_rating(model, before[0], amount, -before[1], -1)
+    change_rating(model, rated_id, amount, value, 1)
 
+
+@receiver(post_delete, sender=Review)
 @receiver(post_delete, sender=Feedback)
-def decrement_reviews_amount(sender, instance, **kwargs):
-    if sender == Feedback:
-        doctor = instance.doctor
-        average_ratings = Feedback.objects.filter(doctor=doctor).aggregate(Avg('rating__value'))
-        doctor.feedbacks_amount -= 1
-        if average_ratings['rating__value__avg'] is not None:
-            doctor.rating = float(average_ratings['rating__value__avg'])
-        else:
-            doctor.rating = 0
-        doctor.save()
+def remove_rating(sender, instance, **kwargs):
+    target, model, amount = RATED[sender]
+    try:
+        value = instance.rating.value
+    except RatingStar.DoesNotExist:
+        return
+    change_rating(model, getattr(instance, target), amount, -value, -1)
+
+
+@receiver(post_save, sender=Booking)
+def occupy_free_slot(sender, instance, created, **kwargs):
+    if created and not in_batch():
+        occupy_slots([instance.visit_id])
+        publish_events([booking_event('booking.created', instance, instance.visit)])
+
+
+@receiver(post_delete, sender=Booking)
+def release_free_slot(sender, instance, **kwargs):
+    """Clients hear only of cancelled future visits, not of past ones removed with old schedules"""
+    if not in_batch():
+        release_slots([instance.visit_id])
+        visit = instance.visit
+        if datetime.combine(visit.date, visit.time) > datetime.now():
+            publish_events([booking_event('booking.cancelled', instance, visit)])
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def invalidate_booking_calendars(sender, instance, raw=False, **kwargs):
+    if not raw and not in_batch():
+        invalidate_calendars(doctors=[instance.visit.doctor_id], clients=[instance.client_id])
+
+
+@receiver(post_save, sender=Schedule)
+@receiver(post_delete, sender=Schedule)
+def invalidate_schedule_calendar(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate_calendars(doctors=[instance.doctor_id])
+
+
+@receiver(post_save, sender=Doctor)
+def invalidate_doctor_calendars(sender, instance, raw=False, **kwargs):
+    """Feeds show doctor's name and visit duration"""
+    if not raw:
+        invalidate_showing(doctors=[instance.pk])
+
+
+@receiver(post_save, sender=Hospital)
+def invalidate_hospital_calendars(sender, instance, raw=False, **kwargs):
+    """Feeds of clients show hospital's title and address"""
+    if not raw:
+        invalidate_showing(hospital=instance.pk)
+
+
+@receiver(post_save, sender=MyUser)
+@receiver(post_delete, sender=MyUser)
+def forget_calendar_owner(sender, instance, **kwargs):
+    """Feed addresses stop working right away when the user is deactivated, deleted or gets a new nonce"""
+    forget_owner(instance.pk)
+
+
+@receiver(post_save, sender=Hospital)
+@receiver(post_save, sender=Visit)
+@receiver(post_save, sender=Schedule)
+@receiver(post_save, sender=Booking)
+def record_change(sender, instance, raw=False, **kwargs):
+    if not raw and not in_batch():
+        record([instance])
+
+
+@receiver(post_delete, sender=Hospital)
+@receiver(post_delete, sender=Visit)
+@receiver(post_delete, sender=Schedule)
+@receiver(post_delete, sender=Booking)
+def record_delete(sender, instance, **kwargs):
+    """Deletes are kept as tombstones, also those cascaded from schedules and visits"""
+    if not in_batch():
+        record([instance], deleted=True)
+
+
+@receiver(post_save, sender=Doctor)
+def move_free_slots(sender, instance, **kwargs):
+    FreeSlot.objects.filter(doctor=instance).exclude(hospital_id=instance.hospital_id).update(
+        hospital_id=instance.hospital_id
+    )
+
+
+@receiver(post_save, sender=Hospital)
+@receiver(post_save, sender=Doctor)
+@receiver(post_save, sender=Specialization)
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Hospital)
+@receiver(post_delete, sender=Doctor)
+@receiver(post_delete, sender=Specialization)
+@receiver(post_delete, sender=Service)
+def invalidate_catalogue(sender, raw=False, **kwargs):
+    if not raw:
+        invalidate(sender)
+
+
+@receiver(m2m_changed, sender=Hospital.services.through)
+@receiver(m2m_changed, sender=Doctor.specialization.through)
+def invalidate_catalogue_relations(sender, instance, action, **kwargs):
+    if action.startswith('post_'):
+        invalidate(Hospital if sender is Hospital.services.through else Doctor)
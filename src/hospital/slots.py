@@ -0,0 +1,69 @@
+from datetime import date, datetime, timedelta
+
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+
+from .models import Schedule, Visit
+
+SCHEDULES_BATCH = 7
+
+
+def schedule_times(schedule, duration):
+    """Start times of visits inside the schedule window"""
+    step = timedelta(minutes=duration)
+    time = datetime.combine(schedule.date, schedule.time_from)
+    end = datetime.combine(schedule.date, schedule.time_to)
+    while time < end:
+        yield time.time()
+        time += step
+
+
+def upcoming(now):
+    """Filter of visits and slots which start after ``now``"""
+    return Q(date__gt=now.date()) | Q(date=now.date(), time__gt=now.time())
+
+
+def free_slots(doctor, limit=25, after=None, held=frozenset()):
+    """
+    Free visits of the doctor computed from schedules minus booked visits.
+
+    Visits which already exist are returned as they are, the others are
+    unsaved Visit objects which get stored only when somebody books them.
+    Booked visits and visits with ids in ``held`` are left out.
+    Listing starts from now or right after the (date, time) position.
+    """
+    now = datetime.now()
+    start = max(after[0], now.date()) if after else now.date()
+    schedules = Schedule.objects.filter(doctor=doctor, date__gte=start).order_by('date')
+    slots = []
+    offset = 0
+    while len(slots) < limit:
+        batch = list(schedules[offset:offset + SCHEDULES_BATCH])
+        if not batch:
+            break
+        offset += SCHEDULES_BATCH
+        existing = {
+            (visit.date, visit.time): visit
+            for visit in Visit.objects.filter(
+                doctor=doctor, date__in=[schedule.date for schedule in batch]
+            ).select_related('booking_visit')
+        }
+        for schedule in batch:
+            for time in schedule_times(schedule, int(doctor.visit_duration)):
+                visit = existing.get((schedule.date, time)) or Visit(doctor=doctor, date=schedule.date, time=time)
+                if visit.pk and (hasattr(visit, 'booking_visit') or visit.pk in held):
+                    continue
+                if after and (visit.date, visit.time) <= after or datetime.combine(visit.date, visit.time) <= now:
+                    continue
+                slots.append(visit)
+    return slots[:limit]
+
+
+def claim_slot(doctor, visit_date, visit_time):
+    """Return visit for the slot of doctor's schedule, creating it if it is not stored yet"""
+    if visit_date < date.today():
+        raise ValidationError('Visit is in the past.')
+    schedule = Schedule.objects.filter(doctor=doctor, date=visit_date).first()
+    if schedule is None or visit_time not in schedule_times(schedule, int(doctor.visit_duration)):
+        raise ValidationError('Doctor has no visit at this time.')
+    return Visit.objects.get_or_create(doctor=doctor, date=visit_date, time=visit_time)[0]
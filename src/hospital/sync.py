@@ -0,0 +1,128 @@
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .models import Booking, ChangeLog, Hospital, Schedule, Visit
+
+
+class SyncExpired(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = 'Changes since this cursor are not kept anymore, download full lists again.'
+    default_code = 'sync_expired'
+
+
+# Synced models by the name of their changes, with columns sent for changed rows
+SYNCED = {
+    'hospital': (Hospital, (
+        'id', 'title', 'short_title', 'type', 'address', 'phone_number', 'opening_time', 'closing_time',
+        'hospital_likes_amount', 'rating',
+    )),
+    'visit': (Visit, ('id', 'doctor_id', 'date', 'time')),
+    'schedule': (Schedule, ('id', 'doctor_id', 'date', 'time_from', 'time_to')),
+    'booking': (Booking, ('id', 'visit_id', 'client_id', 'service', 'visit__doctor_id', 'visit__date', 'visit__time')),
+}
+NAMES = {model: name for name, (model, columns) in SYNCED.items()}
+
+
+def change(instance, deleted=False):
+    """Unsaved change of the instance with the doctor and client whose sync it belongs to"""
+    doctor_id = client_id = None
+    if isinstance(instance, Booking):
+        doctor_id, client_id = instance.visit.doctor_id, instance.client_id
+    elif not isinstance(instance, Hospital):
+        doctor_id = instance.doctor_id
+    return ChangeLog(
+        model=NAMES[type(instance)], object_id=instance.pk, deleted=deleted, doctor_id=doctor_id, client_id=client_id
+    )
+
+
+def record(instances, deleted=False):
+    """Write changes of the instances with one INSERT"""
+    ChangeLog.objects.bulk_create([change(instance, deleted) for instance in instances])
+
+
+def record_rows(queryset):
+    """Write changes of rows of the queryset, for rows written in bulk without primary keys or signals"""
+    record(queryset.select_related('visit') if queryset.model is Booking else queryset)
+
+
+def horizon():
+    """
+    Lowest id of changes of the last SYNC_SAFETY_LAG seconds, None when there are none.
+
+    Ids are taken when changes are written, not when they commit, so a
+    recent change with a lower id may still be uncommitted. Cursors never
+    pass this id. Changes older than the lag are assumed to be committed,
+    which holds when the lag is longer than the time from writing a change
+    to the commit of its transaction. Bulk bookings and schedule generation
+    write their changes at the end of their transactions for this reason.
+    """
+    return ChangeLog.objects.filter(
+        created_at__gt=timezone.now() - timedelta(seconds=settings.SYNC_SAFETY_LAG)
+    ).order_by('id').values_list('id', flat=True).first()
+
+
+def latest_cursor():
+    """Cursor of the first sync, right before changes which may still be uncommitted"""
+    first_recent = horizon()
+    if first_recent is not None:
+        return first_recent - 1
+    return ChangeLog.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def changes_since(cursor, doctor_id=None, client_id=None, limit=None):
+    """
+    Changes after the cursor which belong to the doctor or the client, oldest first.
+
+    Changes from the ``horizon`` on are left for the next sync, so a change
+    committed after a newer one is not skipped by the cursor.
+    Raises SyncExpired when changes after the cursor were already purged.
+    """
+    limit = limit or settings.SYNC_PAGE_SIZE
+    first = ChangeLog.objects.order_by('id').values_list('id', flat=True).first()
+    if (first is None and cursor > 0) or (first is not None and cursor < first - 1):
+        raise SyncExpired()
+
+    scope = Q(model='hospital')
+    if doctor_id is not None:
+        scope |= Q(doctor_id=doctor_id)
+    if client_id is not None:
+        scope |= Q(client_id=client_id)
+    changes = ChangeLog.objects.filter(scope, id__gt=cursor)
+    first_recent = horizon()
+    if first_recent is not None:
+        changes = changes.filter(id__lt=first_recent)
+    return list(changes.order_by('id')[:limit + 1])
+
+
+def sync(cursor, doctor_id=None, client_id=None):
+    """
+    Rows changed and ids of rows deleted after the cursor, with the cursor to continue from.
+
+    Only the last change of every row counts. Rows dated before
+    ``expired_before`` are removed by retention without tombstones, clients
+    drop them by date.
+    """
+    changes = changes_since(cursor, doctor_id, client_id)
+    has_more = len(changes) > settings.SYNC_PAGE_SIZE
+    changes = changes[:settings.SYNC_PAGE_SIZE]
+
+    latest = {}
+    for change_row in changes:
+        latest[(change_row.model, change_row.object_id)] = change_row.deleted
+    result = {
+        'cursor': str(changes[-1].id if changes else cursor),
+        'has_more': has_more,
+        'expired_before': date.today() - timedelta(days=settings.RETENTION_DAYS - 1),
+    }
+    for name, (model, columns) in SYNCED.items():
+        changed = [pk for (changed_model, pk), deleted in latest.items() if changed_model == name and not deleted]
+        result[f'{name}s'] = {
+            'changed': list(model.objects.filter(pk__in=changed).order_by('pk').values(*columns)) if changed else [],
+            'deleted': [pk for (changed_model, pk), deleted in latest.items() if changed_model == name and deleted],
+        }
+    return result
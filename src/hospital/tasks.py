@@ -1,13 +1,57 @@
-from datetime import date, timedelta
+import logging
+
+from django.conf import settings
+from django.db.models import F, Q
 
 from core.celery import app
 
 
-from .models import Schedule
+from .models import ScheduleRule
+from .outbox import drain
+from .partitions import ensure_future_partitions
+from .retention import purge_expired_once
+from .schedule_generator import materialize_rule, schedule_horizon
+
+logger = logging.getLogger(__name__)
+
+
+@app.task
+def purge_expired_schedules():
+    """Remove schedules and visits older than RETENTION_DAYS, see ``purge_expired``"""
+    return purge_expired_once()
+
+
+@app.task
+def extend_schedules():
+    """
+    Keep schedules of recurrence rules materialized up to the rolling horizon.
+
+    Every rule is materialized in its own transaction, a rule which fails is
+    logged and retried the next night without stopping the others. Doctors
+    without a visit duration can not get visits and are skipped.
+    """
+    horizon = schedule_horizon()
+    rules = ScheduleRule.objects.filter(
+        Q(materialized_until__isnull=True) | Q(materialized_until__lt=horizon),
+        Q(ends_on__isnull=True) | Q(ends_on__gt=F('materialized_until')) | Q(materialized_until__isnull=True),
+        doctor__visit_duration__gt=0,
+    ).select_related('doctor').order_by('id')
+    for rule in rules.iterator():
+        try:
+            materialize_rule(rule, horizon)
+        except Exception:
+            logger.exception('Schedules of rule %s were not extended', rule.pk)
+
+
+@app.task
+def drain_outbox():
+    """Handle pending outbox events in batches until there are none left"""
+    while drain() == settings.OUTBOX_BATCH_SIZE:
+        pass
 
 
 @app.task
-def reset_schedule():
-    today = date.today()
-    bad_date = str(today - timedelta(days=5))
-    Schedule.objects.filter(date__lte=bad_date).delete()
+def extend_partitions():
+    """Create monthly partitions of visits and schedules ahead of time"""
+    if settings.DATE_PARTITIONS:
+        ensure_future_partitions()
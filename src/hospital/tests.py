@@ -1,3 +1,1283 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+import tempfile
+from unittest import mock
+from unittest import skipUnless
+from datetime import date, datetime, time, timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APITestCase, APIClient, APIRequestFactory
+
+from users.models import MyUser, Doctor, Client, HospitalAdmin
+from .models import Schedule, ScheduleRule, Visit, Booking, FreeSlot, Specialization, Hospital, Review, Feedback, \
+    RatingStar, Service, OutboxEvent, ChangeLog
+from .holds import HoldsUnavailable, hold_store
+from .links import format_url, route_template
+from .pagination import KeysetPagination
+from .rows import RowRenderer
+from . import serializers
+from .outbox import HANDLERS, drain, publish
+from .partitions import convert_to_partitioned, drop_partitions, ensure_future_partitions, months, partition_name
+from .recurrence import RecurrenceRule
+from .retention import LOCK_KEY, purge_expired, purge_expired_once
+from .schedule_generator import generate_schedule, materialize_rule, schedule_horizon
+from .tasks import extend_schedules
+
+SCHEDULE_URL = '/api/v1/schedule/'
+BOOKING_URL = '/api/v1/booking/'
+
+in_memory_holds = override_settings(VISIT_HOLDS_BACKEND='hospital.holds.InMemoryHoldStore')
+
+
+def sample_doctor(email='doctor@doctor.com', visit_duration=30):
+    """Create and return doctor object"""
+    user = MyUser.objects.create_user(email, False, True, 'useruser111')
+    doctor = Doctor.objects.create_doctor(user=user, first_name='Doctor', last_name='JaneDoe')
+    doctor.visit_duration = visit_duration
+    doctor.save()
+    return doctor
+
+
+def sample_client(email='client@client.com'):
+    """Create and return client object"""
+    user = MyUser.objects.create_user(email, False, False, 'useruser111')
+    return Client.objects.create_client(
+        user=user, first_name='Client', last_name='Test', phone_number='+38029342402', gender='Male', age=20
+    )
+
+
+class ScheduleGeneratorTestCase(APITestCase):
+    """Test generation of schedules and visits"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.doctor = sample_doctor()
+        self.client.force_authenticate(self.doctor.user)
+
+    def test_generate_schedule_is_idempotent(self):
+        """Test generating the same schedule twice does not duplicate rows"""
+        dates = [date(2021, 9, 27) + timedelta(days=day) for day in range(4)]
+        generate_schedule(self.doctor, dates, time(9), time(12), 'Every day')
+        generate_schedule(self.doctor, dates, time(9), time(12), 'Every day')
+
+        self.assertEqual(Schedule.objects.filter(doctor=self.doctor).count(), 4)
+        self.assertEqual(Visit.objects.filter(doctor=self.doctor).count(), 4 * 6)
+
+    def test_create_schedule(self):
+        """Test creating schedule generates visits for one day"""
+        payload = {
+            'date': '2021-09-27',
+            'time_from': '09:00:00',
+            'time_to': '10:00:00',
+            'periodicity': 'Once'
+        }
+
+        response = self.client.post(SCHEDULE_URL, payload)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Schedule.objects.filter(doctor=self.doctor).count(), 1)
+        self.assertEqual(Visit.objects.filter(doctor=self.doctor).count(), 2)
+
+    def test_second_schedule_on_a_date(self):
+        """Test a date with a schedule gets no visits of other working hours"""
+        day = date.today() + timedelta(days=1)
+        generate_schedule(self.doctor, [day], time(9), time(10), 'Once')
+        self.assertEqual(generate_schedule(self.doctor, [day], time(14), time(15), 'Once'), [])
+        self.assertEqual(
+            list(Visit.objects.filter(doctor=self.doctor).values_list('time', flat=True)), [time(9), time(9, 30)]
+        )
+        self.assertEqual(FreeSlot.objects.filter(doctor=self.doctor).count(), 2)
+
+        payload = {'date': str(day), 'time_from': '14:00:00', 'time_to': '15:00:00', 'periodicity': 'Once'}
+        response = self.client.post(SCHEDULE_URL, payload)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Schedule.objects.get(doctor=self.doctor).time_from, time(9))
+
+    def test_create_every_day_schedule(self):
+        """Test every day schedule is generated up to the horizon, not to the end of month"""
+        payload = {
+            'date': str(date.today()),
+            'time_from': '09:00:00',
+            'time_to': '10:00:00',
+            'periodicity': 'Every day'
+        }
+
+        response = self.client.post(SCHEDULE_URL, payload)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        days = (schedule_horizon() - date.today()).days + 1
+        self.assertEqual(Schedule.objects.filter(doctor=self.doctor).count(), days)
+        self.assertEqual(Visit.objects.filter(doctor=self.doctor).count(), days * 2)
+
+
+class RecurrenceRuleTestCase(APITestCase):
+    """Test recurrence rules of schedules"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.doctor = sample_doctor()
+        self.client.force_authenticate(self.doctor.user)
+
+    def test_occurrences(self):
+        """Test dates of rules with interval, weekdays, count and exdates"""
+        start = date(2021, 9, 27)
+        rule = RecurrenceRule.parse('FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,FR;COUNT=3')
+        self.assertEqual(str(rule), 'FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,FR;COUNT=3')
+        self.assertEqual(
+            rule.occurrences(start, start, date(2021, 12, 31)),
+            [date(2021, 9, 27), date(2021, 10, 1), date(2021, 10, 11)]
+        )
+        self.assertEqual(rule.last_date(start), date(2021, 10, 11))
+
+        rule = RecurrenceRule.parse('FREQ=DAILY;BYDAY=SA,SU;UNTIL=20211010')
+        self.assertEqual(
+            rule.occurrences(start, date(2021, 10, 3), date(2021, 12, 31), [date(2021, 10, 9)]),
+            [date(2021, 10, 3), date(2021, 10, 10)]
+        )
+
+    def test_invalid_rule(self):
+        """Test unsupported rules are rejected"""
+        for text in ('FREQ=MONTHLY', 'FREQ=DAILY;BYDAY=XX', 'FREQ=DAILY;COUNT=2;UNTIL=20211010', 'BYDAY=MO'):
+            with self.assertRaises(ValueError):
+                RecurrenceRule.parse(text)
+
+    def test_rule_is_topped_up(self):
+        """Test periodic task extends rule's schedules when the horizon moves"""
+        payload = {
+            'rrule': 'FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR',
+            'dtstart': str(date.today()),
+            'time_from': '09:00:00',
+            'time_to': '10:00:00',
+            'exdates': [str(date.today() + timedelta(days=1))]
+        }
+        response = self.client.post('/api/v1/schedule/rules/', payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        rule = ScheduleRule.objects.get(doctor=self.doctor)
+        self.assertEqual(rule.materialized_until, schedule_horizon())
+        self.assertFalse(Schedule.objects.filter(date=date.today() + timedelta(days=1)).exists())
+
+        generated = Schedule.objects.filter(rule=rule).count()
+        Schedule.objects.filter(date__gt=date.today() + timedelta(weeks=4)).delete()
+        ScheduleRule.objects.filter(pk=rule.pk).update(materialized_until=date.today() + timedelta(weeks=4))
+        extend_schedules()
+        self.assertEqual(Schedule.objects.filter(rule=rule).count(), generated)
+
+    def test_failed_rule_does_not_stop_others(self):
+        """Test rules after a failing one and after a doctor without visit duration are topped up"""
+        others = [sample_doctor(f'doctor{number}@doctor.com') for number in range(2)]
+        rules = [
+            ScheduleRule.objects.create(
+                doctor=doctor, rrule='FREQ=DAILY', dtstart=date.today(), time_from=time(9), time_to=time(10)
+            )
+            for doctor in [self.doctor] + others
+        ]
+        Doctor.objects.filter(pk=self.doctor.pk).update(visit_duration=None)
+        failing = rules[1].pk
+        materialize = materialize_rule
+
+        def fail_once(rule, horizon=None):
+            if rule.pk == failing:
+                raise ValueError('Broken rule')
+            return materialize(rule, horizon)
+        with mock.patch('hospital.tasks.materialize_rule', side_effect=fail_once), \
+                self.assertLogs('hospital.tasks', 'ERROR'):
+            extend_schedules()
+        self.assertEqual(
+            [rule.materialized_until for rule in ScheduleRule.objects.order_by('id')], [None, None, schedule_horizon()]
+        )
+
+
+@in_memory_holds
+class VisitListTestCase(APITestCase):
+    """Test listing and booking of free visits"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.doctor = sample_doctor()
+        self.patient = sample_client()
+        self.tomorrow = date.today() + timedelta(days=1)
+
+    def visits_url(self):
+        return f'/api/v1/doctor/{self.doctor.pk}/visits/'
+
+    def test_booked_visits_are_not_listed(self):
+        """Test list of visits contains only free visits"""
+        generate_schedule(self.doctor, [self.tomorrow], time(9), time(10), 'Once')
+        Booking.objects.create(visit=Visit.objects.get(time=time(9)), client=self.patient)
+
+        response = self.client.get(self.visits_url())
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([visit['time'] for visit in response.data['results']], ['09:30'])
+
+    def listed_at(self, now):
+        """Times of today's visits listed for the doctor and found by availability search at the moment"""
+        class FrozenDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return now
+        with mock.patch('hospital.slots.datetime', FrozenDatetime), \
+                mock.patch('hospital.views.datetime', FrozenDatetime), \
+                mock.patch('hospital.availability.datetime', FrozenDatetime):
+            visits = self.client.get(self.visits_url()).data['results']
+            slots = self.client.get('/api/v1/availability/').data
+        return [visit['time'] for visit in visits], [slot['time'] for slot in slots]
+
+    def test_started_visits_are_not_listed(self):
+        """Test visits of today which already started are neither listed nor found"""
+        today = date.today()
+        generate_schedule(self.doctor, [today], time(9), time(11), 'Once')
+        self.assertEqual(self.listed_at(datetime.combine(today, time(10))), (['10:30'], ['10:30']))
+        with override_settings(VIRTUAL_VISITS=True):
+            later = ['10:00', '10:30']
+            self.assertEqual(self.listed_at(datetime.combine(today, time(9, 45))), (later, later))
+
+    @override_settings(VIRTUAL_VISITS=True)
+    def test_virtual_visits(self):
+        """Test visits are computed from schedules and stored only when booked"""
+        generate_schedule(self.doctor, [self.tomorrow], time(9), time(10), 'Once')
+        self.assertFalse(Visit.objects.exists())
+
+        response = self.client.get(self.visits_url())
+        self.assertEqual(
+            [(visit['id'], visit['time']) for visit in response.data['results']], [(None, '09:00'), (None, '09:30')]
+        )
+
+        self.client.force_authenticate(self.patient.user)
+        payload = {'doctor': self.doctor.pk, 'date': str(self.tomorrow), 'time': '09:30'}
+        response = self.client.post(BOOKING_URL, payload)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Booking.objects.get().visit.time, time(9, 30))
+
+        response = self.client.post(BOOKING_URL, dict(payload, time='09:15'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(self.visits_url())
+        self.assertEqual([visit['time'] for visit in response.data['results']], ['09:00'])
+
+
+@in_memory_holds
+class BookingTestCase(APITestCase):
+    """Test booking of visits"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.doctor = sample_doctor()
+        self.patient = sample_client()
+        self.tomorrow = date.today() + timedelta(days=1)
+        generate_schedule(self.doctor, [self.tomorrow], time(9), time(10), 'Once')
+        self.visit = Visit.objects.get(time=time(9))
+        self.client.force_authenticate(self.patient.user)
+
+    def test_booked_visit_conflict(self):
+        """Test booking a booked visit returns conflict"""
+        response = self.client.post(BOOKING_URL, {'visit': self.visit.pk})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.client.force_authenticate(sample_client('other@client.com').user)
+        response = self.client.post(BOOKING_URL, {'visit': self.visit.pk})
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_visit_not_bookable(self):
+        """Test visits in the past or out of schedule can not be booked"""
+        past = Visit.objects.create(doctor=self.doctor, date=date.today() - timedelta(days=1), time=time(9))
+        unscheduled = Visit.objects.create(doctor=self.doctor, date=self.tomorrow, time=time(15))
+        for visit in (past, unscheduled):
+            response = self.client.post(BOOKING_URL, {'visit': visit.pk})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Booking.objects.exists())
+
+    def test_idempotency_key(self):
+        """Test retried request with the same idempotency key books once"""
+        for _ in range(2):
+            response = self.client.post(BOOKING_URL, {'visit': self.visit.pk}, HTTP_IDEMPOTENCY_KEY='key')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Booking.objects.get().visit, self.visit)
+
+        other = Visit.objects.get(time=time(9, 30))
+        response = self.client.post(BOOKING_URL, {'visit': other.pk}, HTTP_IDEMPOTENCY_KEY='key')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@in_memory_holds
+class BulkBookingTestCase(APITestCase):
+    """Test bulk booking changes by hospital admins"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.hospital = Hospital.objects.create(
+            title='Hospital', short_title='H', type='Private', description='Description',
+            opening_time=time(8), closing_time=time(20), address='Street'
+        )
+        user = MyUser.objects.create_user('admin@admin.com', True, False, 'useruser111')
+        self.admin = HospitalAdmin.objects.create_hospital_admin(user, self.hospital, 'Admin', 'Test')
+        self.doctor = sample_doctor()
+        self.doctor.hospital = self.hospital
+        self.doctor.save()
+        self.other_doctor = sample_doctor('other@doctor.com')
+        self.patients = [sample_client(f'client{number}@client.com') for number in range(3)]
+        tomorrow = date.today() + timedelta(days=1)
+        generate_schedule(self.doctor, [tomorrow], time(9), time(11), 'Once')
+        generate_schedule(self.other_doctor, [tomorrow], time(9), time(10), 'Once')
+        self.visits = list(Visit.objects.filter(doctor=self.doctor).order_by('time'))
+        self.client.force_authenticate(user)
+
+    def bulk(self, action, items):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(BOOKING_URL + 'bulk/', {'action': action, 'items': items}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(result['ok'], result.get('status')) for result in response.data['results']]
+
+    def book(self, visit, patient):
+        return Booking.objects.create(visit=visit, client=patient)
+
+    def test_bulk_cancel(self):
+        """Test bookings are cancelled and visits are free again"""
+        bookings = [self.book(visit, patient) for visit, patient in zip(self.visits, self.patients)]
+        foreign = self.book(Visit.objects.filter(doctor=self.other_doctor).first(), self.patients[0])
+        items = [{'booking': booking.pk} for booking in bookings + [foreign]]
+        self.assertEqual(self.bulk('cancel', items), [(True, 'cancelled')] * 3 + [(False, None)])
+        self.assertEqual(list(Booking.objects.all()), [foreign])
+        self.assertEqual(FreeSlot.objects.filter(doctor=self.doctor).count(), 4)
+
+    def test_bulk_cancel_past_booking(self):
+        """Test clients are not told of cancelled past visits"""
+        yesterday = date.today() - timedelta(days=1)
+        generate_schedule(self.doctor, [yesterday], time(9), time(10), 'Once')
+        past = self.book(Visit.objects.get(doctor=self.doctor, date=yesterday, time=time(9)), self.patients[0])
+        future = self.book(self.visits[0], self.patients[1])
+        OutboxEvent.objects.all().delete()
+        items = [{'booking': past.pk}, {'booking': future.pk}]
+        self.assertEqual(self.bulk('cancel', items), [(True, 'cancelled')] * 2)
+        self.assertEqual([event.payload['booking'] for event in OutboxEvent.objects.all()], [future.pk])
+
+    def test_bulk_move(self):
+        """Test bookings are moved to free visits only"""
+        first, second = self.book(self.visits[0], self.patients[0]), self.book(self.visits[1], self.patients[1])
+        items = [{'booking': first.pk, 'visit': self.visits[2].pk}, {'booking': second.pk, 'visit': self.visits[2].pk}]
+        self.assertEqual(self.bulk('move', items), [(True, 'moved'), (False, None)])
+        first.refresh_from_db()
+        self.assertEqual(first.visit, self.visits[2])
+        self.assertEqual(
+            set(FreeSlot.objects.values_list('visit_id', flat=True).filter(doctor=self.doctor)),
+            {self.visits[0].pk, self.visits[3].pk}
+        )
+
+    def test_bulk_create(self):
+        """Test visits are booked for clients"""
+        self.book(self.visits[0], self.patients[0])
+        items = [{'visit': visit.pk, 'client': patient.pk} for visit, patient in zip(self.visits, self.patients)]
+        self.assertEqual(self.bulk('create', items), [(False, None), (True, 'created'), (True, 'created')])
+        self.assertEqual(Booking.objects.count(), 3)
+        self.assertEqual(FreeSlot.objects.filter(doctor=self.doctor).count(), 1)
+
+    def test_queries_do_not_grow_with_batch(self):
+        """Test a batch runs a fixed number of queries"""
+        def count_queries(visits):
+            items = [{'visit': visit.pk, 'client': self.patients[0].pk} for visit in visits]
+            with CaptureQueriesContext(connection) as queries:
+                self.bulk('create', items)
+            return len(queries)
+        self.assertEqual(count_queries(self.visits[:1]), count_queries(self.visits[1:]))
+
+    def test_only_hospital_admin(self):
+        """Test clients can not change bookings in bulk"""
+        self.client.force_authenticate(self.patients[0].user)
+        payload = {'action': 'cancel', 'items': [{'booking': 1}]}
+        response = self.client.post(BOOKING_URL + 'bulk/', payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(None)
+        response = self.client.post(BOOKING_URL + 'bulk/', payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+@in_memory_holds
+class ExportTestCase(APITestCase):
+    """Test streamed exports of hospital data"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.hospital = Hospital.objects.create(
+            title='Hospital', short_title='H', type='Private', description='Description',
+            opening_time=time(8), closing_time=time(20), address='Street'
+        )
+        user = MyUser.objects.create_user('admin@admin.com', True, False, 'useruser111')
+        HospitalAdmin.objects.create_hospital_admin(user, self.hospital, 'Admin', 'Test')
+        doctor = sample_doctor()
+        doctor.hospital = self.hospital
+        doctor.save()
+        other_doctor = sample_doctor('other@doctor.com')
+        patient = sample_client()
+        self.tomorrow = date.today() + timedelta(days=1)
+        generate_schedule(doctor, [self.tomorrow], time(9), time(10), 'Once')
+        generate_schedule(other_doctor, [self.tomorrow], time(9), time(10), 'Once')
+        for visit in Visit.objects.filter(time=time(9)):
+            Booking.objects.create(visit=visit, client=patient, service='Checkup, first')
+        self.client.force_authenticate(user)
+
+    def export(self, name, **params):
+        params.setdefault('date_from', self.tomorrow)
+        return self.client.get(f'/api/v1/exports/{name}/', params)
+
+    def test_csv(self):
+        """Test bookings of the admin's hospital are streamed as CSV"""
+        response = self.export('bookings')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode('utf-8'))))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['time'], '09:00:00')
+        self.assertEqual(rows[0]['service'], 'Checkup, first')
+
+    def test_gzipped_ndjson(self):
+        response = self.export('visits', output='ndjson', gzip=True)
+        self.assertIn('visits-', response['Content-Disposition'])
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode('utf-8').splitlines()
+        visits = [json.loads(line) for line in lines]
+        self.assertEqual([visit['time'] for visit in visits], ['09:00:00', '09:30:00'])
+        self.assertIsNotNone(visits[0]['booking'])
+        self.assertIsNone(visits[1]['booking'])
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.export('payments').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(
+            self.export('bookings', date_to=date.today()).status_code, status.HTTP_400_BAD_REQUEST
+        )
+        self.client.force_authenticate(sample_client('other@client.com').user)
+        self.assertEqual(self.export('bookings').status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.export('bookings').status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bookings.csv.gz')
+            call_command(
+                'export_data', 'bookings', hospital=self.hospital.pk, date_from=self.tomorrow, gzip=True, path=path
+            )
+            with gzip.open(path, 'rt') as file:
+                self.assertEqual(len(list(csv.DictReader(file))), 1)
+
+
+class CalendarFeedTestCase(APITestCase):
+    """Test iCalendar feeds of doctors and clients"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.doctor = sample_doctor()
+        self.patient = sample_client()
+        self.tomorrow = date.today() + timedelta(days=1)
+        generate_schedule(self.doctor, [self.tomorrow], time(9), time(10), 'Once')
+        self.visits = list(Visit.objects.order_by('time'))
+        self.booking = Booking.objects.create(visit=self.visits[0], client=self.patient, service='Checkup; first')
+
+    def feed_url(self, user):
+        self.client.force_authenticate(MyUser.objects.get(pk=user.pk))
+        url = self.client.get('/api/v1/calendar/').data['url']
+        self.client.force_authenticate(None)
+        return url
+
+    def test_doctor_feed(self):
+        """Test unchanged feeds cost no queries and changes are seen after commit"""
+        url = self.feed_url(self.doctor.user)
+        response = self.client.get(url)
+        content = response.content.decode('utf-8')
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        self.assertIn(f'UID:booking-{self.booking.pk}@hospital', content)
+        self.assertIn(f'DTSTART:{self.tomorrow:%Y%m%d}T090000', content)
+        self.assertIn('DESCRIPTION:Checkup\\; first', content)
+        self.assertIn('SUMMARY:Working hours', content)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = Booking.objects.create(visit=self.visits[1], client=sample_client('other@client.com'))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(f'UID:booking-{booking.pk}@hospital', response.content.decode('utf-8'))
+
+    def test_client_feed(self):
+        self.doctor.hospital = Hospital.objects.create(
+            title='Hospital', short_title='H', type='Private', description='Description',
+            opening_time=time(8), closing_time=time(20), address='Street'
+        )
+        self.doctor.save()
+        content = self.client.get(self.feed_url(self.patient.user)).content.decode('utf-8')
+        self.assertIn('LOCATION:Hospital\\, Street', content)
+        self.assertNotIn('Working hours', content)
+
+    def test_invalid_feeds(self):
+        url = self.feed_url(self.doctor.user)
+        self.assertEqual(self.client.get(url.replace('.ics', 'x.ics')).status_code, status.HTTP_404_NOT_FOUND)
+        user = MyUser.objects.create_user('admin@admin.com', True, False, 'useruser111')
+        self.client.force_authenticate(user)
+        self.assertEqual(self.client.get('/api/v1/calendar/').status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_revoked_feeds(self):
+        """Test a new address or deactivation of the user stops the old address"""
+        url = self.feed_url(self.doctor.user)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        self.client.force_authenticate(MyUser.objects.get(pk=self.doctor.user.pk))
+        new_url = self.client.post('/api/v1/calendar/').data['url']
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(new_url).status_code, status.HTTP_200_OK)
+
+        user = MyUser.objects.get(pk=self.doctor.user.pk)
+        user.is_active = False
+        user.save()
+        self.assertEqual(self.client.get(new_url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_doctor_changes(self):
+        """Test feeds showing the doctor change with doctor's name"""
+        url = self.feed_url(self.patient.user)
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctor.first_name = 'Renamed'
+            self.doctor.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('SUMMARY:Visit: Renamed JaneDoe', response.content.decode('utf-8'))
+
+
+class OutboxTestCase(APITestCase):
+    """Test events of changes are written with the changes and handled by drain"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.doctor = sample_doctor()
+        self.patient = sample_client()
+        generate_schedule(self.doctor, [date.today() + timedelta(days=1)], time(9), time(10), 'Once')
+        self.client.force_authenticate(self.patient.user)
+
+    def test_booking_notification(self):
+        """Test booking writes an event and drain emails the client once"""
+        self.client.post(BOOKING_URL, {'visit': Visit.objects.get(time=time(9)).pk})
+        event = OutboxEvent.objects.get()
+        self.assertEqual((event.topic, event.payload['time']), ('booking.created', '09:00'))
+
+        self.assertEqual(drain(), 1)
+        self.assertEqual(drain(), 0)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [self.patient.user.email])
+
+    def test_schedule_deleted(self):
+        """Test deleting schedule writes events of its cancelled bookings"""
+        Booking.objects.create(visit=Visit.objects.get(time=time(9)), client=self.patient)
+        Schedule.objects.get().delete()
+        self.assertEqual(
+            list(OutboxEvent.objects.order_by('id').values_list('topic', flat=True)),
+            ['booking.created', 'booking.cancelled']
+        )
+
+    def test_past_schedule_deleted(self):
+        """Test removing past schedules does not tell clients their past visits are cancelled"""
+        yesterday = date.today() - timedelta(days=1)
+        generate_schedule(self.doctor, [yesterday], time(9), time(10), 'Once')
+        Booking.objects.create(visit=Visit.objects.get(date=yesterday, time=time(9)), client=self.patient)
+        OutboxEvent.objects.all().delete()
+        Schedule.objects.get(date=yesterday).delete()
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_deduplication_and_retries(self):
+        """Test events are deduplicated and failed events are retried"""
+        def fail(events):
+            raise ValueError('Handler failed')
+        HANDLERS['test.event'].append(fail)
+        self.addCleanup(HANDLERS.pop, 'test.event')
+        publish('test.event', 'test:1', number=1)
+        publish('test.event', 'test:1', number=1)
+
+        self.assertEqual(drain(), 0)
+        event = OutboxEvent.objects.get()
+        self.assertEqual((event.attempts, event.processed_at), (1, None))
+
+        HANDLERS['test.event'].remove(fail)
+        self.assertEqual(drain(), 1)
+
+
+@in_memory_holds
+class VisitHoldTestCase(APITestCase):
+    """Test holding visits before booking"""
+
+    def setUp(self):
+        self.addCleanup(hold_store().clear)
+        self.client = APIClient()
+        self.doctor = sample_doctor()
+        self.patient = sample_client()
+        self.other = sample_client('other@client.com')
+        generate_schedule(self.doctor, [date.today() + timedelta(days=1)], time(9), time(10), 'Once')
+        self.visit = Visit.objects.get(time=time(9))
+        self.hold_url = f'/api/v1/doctor/visits/{self.visit.pk}/hold/'
+
+    def test_held_visit(self):
+        """Test held visit is not listed and only the holder can book it"""
+        self.client.force_authenticate(self.patient.user)
+        response = self.client.post(self.hold_url)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = self.client.get(f'/api/v1/doctor/{self.doctor.pk}/visits/')
+        self.assertEqual([visit['time'] for visit in response.data['results']], ['09:30'])
+
+        self.client.force_authenticate(self.other.user)
+        self.assertEqual(self.client.post(self.hold_url).status_code, status.HTTP_409_CONFLICT)
+        response = self.client.post(BOOKING_URL, {'visit': self.visit.pk})
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        self.client.force_authenticate(self.patient.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(BOOKING_URL, {'visit': self.visit.pk})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIsNone(hold_store().holder(self.visit.pk))
+
+    def test_release_and_expire(self):
+        """Test released or expired hold frees the visit"""
+        self.client.force_authenticate(self.patient.user)
+        self.client.post(self.hold_url)
+        self.assertEqual(self.client.delete(self.hold_url).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.client.delete(self.hold_url).status_code, status.HTTP_404_NOT_FOUND)
+
+        with override_settings(VISIT_HOLD_TTL=0):
+            self.client.post(self.hold_url)
+        self.assertEqual(hold_store().held_visits([self.doctor.pk]), set())
+
+    def test_held_visits_of_doctor(self):
+        """Test held visits are read per doctor and availability search leaves them out"""
+        self.client.force_authenticate(self.patient.user)
+        self.client.post(self.hold_url)
+        self.assertEqual(hold_store().held_visits([self.doctor.pk]), {self.visit.pk})
+        self.assertEqual(hold_store().held_visits([self.doctor.pk + 1]), set())
+        tomorrow = (date.today() + timedelta(days=1)).isoformat()
+        response = self.client.get('/api/v1/availability/', {'date_from': tomorrow, 'date_to': tomorrow})
+        self.assertEqual([slot['time'] for slot in response.data], ['09:30'])
+
+    @override_settings(VIRTUAL_VISITS=True)
+    def test_held_slot(self):
+        """Test a slot of virtual visits is held by doctor, date and time and only the holder can book it"""
+        tomorrow = date.today() + timedelta(days=2)
+        generate_schedule(self.doctor, [tomorrow], time(9), time(10), 'Once')
+        payload = {'doctor': self.doctor.pk, 'date': str(tomorrow), 'time': '09:00'}
+        self.client.force_authenticate(self.patient.user)
+        response = self.client.post('/api/v1/doctor/visits/hold/', payload)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(hold_store().holder(response.data['visit']), self.patient.pk)
+
+        response = self.client.get(f'/api/v1/doctor/{self.doctor.pk}/visits/', {'page_size': 10})
+        self.assertEqual([visit['time'] for visit in response.data['results']], ['09:00', '09:30', '09:30'])
+
+        self.client.force_authenticate(self.other.user)
+        response = self.client.post('/api/v1/doctor/visits/hold/', payload)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.client.post(BOOKING_URL, payload).status_code, status.HTTP_409_CONFLICT)
+
+        self.client.force_authenticate(self.patient.user)
+        self.assertEqual(self.client.post(BOOKING_URL, payload).status_code, status.HTTP_201_CREATED)
+        response = self.client.post('/api/v1/doctor/visits/hold/', dict(payload, time='09:15'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_release_failure_after_booking(self):
+        """Test the booking succeeds when the hold can not be released after commit"""
+        self.client.force_authenticate(self.patient.user)
+        self.client.post(self.hold_url)
+        with mock.patch.object(hold_store(), 'release', side_effect=HoldsUnavailable()), \
+                self.assertLogs('hospital.booking', 'WARNING'), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(BOOKING_URL, {'visit': self.visit.pk})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+
+@in_memory_holds
+class AvailabilitySearchTestCase(APITestCase):
+    """Test availability search across doctors"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.cardiologist = sample_doctor()
+        self.surgeon = sample_doctor('surgeon@doctor.com', visit_duration=60)
+        self.patient = sample_client()
+        self.specialization = Specialization.objects.create(title='Cardiology', url='cardiology')
+        self.cardiologist.specialization.add(self.specialization)
+        self.tomorrow = date.today() + timedelta(days=1)
+
+    def search(self, **params):
+        response = self.client.get('/api/v1/availability/', params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(slot['doctor'], slot['time']) for slot in response.data]
+
+    def check_search(self):
+        generate_schedule(self.cardiologist, [self.tomorrow], time(9), time(10), 'Once')
+        generate_schedule(self.surgeon, [self.tomorrow], time(9), time(11), 'Once')
+
+        self.assertEqual(self.search(specialization='cardiology'), [
+            (self.cardiologist.pk, '09:00'), (self.cardiologist.pk, '09:30')
+        ])
+        self.assertEqual(self.search(time_from='09:30', limit=2), [
+            (self.cardiologist.pk, '09:30'), (self.surgeon.pk, '10:00')
+        ])
+
+        self.client.force_authenticate(self.patient.user)
+        if Visit.objects.exists():
+            payload = {'visit': Visit.objects.get(doctor=self.cardiologist, time=time(9)).pk}
+        else:
+            payload = {'doctor': self.cardiologist.pk, 'date': str(self.tomorrow), 'time': '09:00'}
+        response = self.client.post(BOOKING_URL, payload)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.search(specialization='cardiology'), [(self.cardiologist.pk, '09:30')])
+
+    def test_search_free_slot_index(self):
+        """Test search uses free slot index which follows bookings"""
+        self.check_search()
+        self.assertEqual(FreeSlot.objects.count(), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.get().delete()
+        self.assertEqual(FreeSlot.objects.count(), 4)
+
+    @override_settings(VIRTUAL_VISITS=True)
+    def test_search_virtual_visits(self):
+        """Test search computes free visits from schedules"""
+        self.check_search()
+
+
+@in_memory_holds
+class KeysetPaginationTestCase(APITestCase):
+    """Test cursor pagination of list endpoints"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.doctor = sample_doctor(visit_duration=10)
+        self.tomorrow = date.today() + timedelta(days=1)
+
+    def fetch_all(self, url):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append([visit['time'] for visit in response.data['results']])
+            url = response.data['next']
+        return pages
+
+    def check_pages(self):
+        pages = self.fetch_all(f'/api/v1/doctor/{self.doctor.pk}/visits/?page_size=4')
+        self.assertEqual([len(page) for page in pages], [4, 4, 4, 4, 2])
+        times = [visit for page in pages for visit in page]
+        self.assertEqual(len(set(times)), 18)
+        self.assertEqual(times[:2], ['09:00', '09:10'])
+        self.assertEqual(times[-1], '11:50')
+
+    def test_visit_pages(self):
+        """Test pages of visits follow each other without gaps or repeats"""
+        generate_schedule(self.doctor, [self.tomorrow], time(9), time(12), 'Once')
+        self.check_pages()
+
+    @override_settings(VIRTUAL_VISITS=True)
+    def test_virtual_visit_pages(self):
+        """Test pages of virtual visits follow each other without gaps or repeats"""
+        generate_schedule(self.doctor, [self.tomorrow], time(9), time(12), 'Once')
+        self.check_pages()
+
+    def test_descending_ordering(self):
+        """Test pages of doctors ordered by likes with ties"""
+        for number, likes in enumerate([5, 3, 3, 3, 1]):
+            doctor = sample_doctor(f'doctor{number}@doctor.com')
+            Doctor.objects.filter(pk=doctor.pk).update(doctor_likes_amount=likes, first_name=str(number))
+        specialization = Specialization.objects.create(title='Cardiology', url='cardiology')
+        specialization.doctor_set.set(Doctor.objects.all())
+
+        url = '/api/v1/doctors/cardiology/?page_size=2'
+        names = []
+        while url:
+            response = self.client.get(url)
+            names.extend(doctor['first_name'] for doctor in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(names, ['0', '1', '2', '3', '4', 'Doctor'])
+
+        response = self.client.get('/api/v1/doctors/cardiology/?cursor=broken')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_invalid_cursors(self):
+        """Test decodable cursors with values of wrong length or type are invalid, not server errors"""
+        generate_schedule(self.doctor, [self.tomorrow], time(9), time(12), 'Once')
+        url = f'/api/v1/doctor/{self.doctor.pk}/visits/'
+        for position in (['x', 'y'], [1], [1, 2], [[], {}], ['2021-01-01', '09:00', 1]):
+            cursor = KeysetPagination().encode_cursor(position)
+            for virtual in (False, True):
+                with self.subTest(position=position, virtual=virtual), override_settings(VIRTUAL_VISITS=virtual):
+                    response = self.client.get(url, {'cursor': cursor})
+                    self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class LinksTestCase(APITestCase):
+    """Test URLs built from route templates"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_route_template(self):
+        self.assertEqual(route_template('visit-detail', 'pk'), '/api/v1/doctor/visits/{pk}/')
+        self.assertEqual(format_url(route_template('specializations', 'url'), url='a b'), '/api/v1/doctors/a%20b/')
+
+    def test_list_urls(self):
+        """Test listed URLs point to the slug and the visit of each row"""
+        Specialization.objects.create(title='Cardiology', url='cardiology')
+        response = self.client.get('/api/v1/specializations/')
+        self.assertEqual(response.data['results'][0]['url'], 'http://testserver/api/v1/doctors/cardiology/')
+
+        doctor = sample_doctor()
+        patient = sample_client()
+        generate_schedule(doctor, [date.today() + timedelta(days=1)], time(9), time(10), 'Once')
+        visit = Visit.objects.first()
+        Booking.objects.create(visit=visit, client=patient, service='Checkup')
+        self.client.force_authenticate(doctor.user)
+        response = self.client.get('/api/v1/booking/list/')
+        self.assertEqual(response.data['results'][0]['visit'], f'http://testserver/api/v1/doctor/visits/{visit.pk}/')
+
+
+class RowRendererTestCase(APITestCase):
+    """Test rows rendered from values() match the serializers byte for byte"""
+
+    def setUp(self):
+        self.request = Request(APIRequestFactory().get('/'))
+        self.doctor = sample_doctor()
+        self.hospital = Hospital.objects.create(
+            title='Hospital', short_title='H', type='Private', description='Description',
+            opening_time=time(8), closing_time=time(20, 30), address='Street', logo='hospitals/logo.png'
+        )
+        Hospital.objects.create(
+            title='Other', short_title='O', type='Private', description='Description',
+            opening_time=time(9), closing_time=time(17), address='Street'
+        )
+        Specialization.objects.create(title='Cardiology', url='cardiology')
+        generate_schedule(self.doctor, [date.today() + timedelta(days=1)], time(9), time(10), 'Once')
+        Booking.objects.create(visit=Visit.objects.first(), client=sample_client(), service='Checkup')
+
+    def assertSameJSON(self, serializer_class, queryset):
+        serializer = serializer_class(queryset, many=True, context={'request': self.request})
+        renderer = RowRenderer(serializer_class(context={'request': self.request}))
+        rows = renderer.render(queryset.values(*renderer.columns))
+        self.assertEqual(JSONRenderer().render(rows), JSONRenderer().render(serializer.data))
+
+    def test_list_serializers(self):
+        self.assertSameJSON(serializers.HospitalListSerializer, Hospital.objects.order_by('id'))
+        self.assertSameJSON(serializers.DoctorListSerializer, Doctor.objects.order_by('id'))
+        self.assertSameJSON(serializers.VisitSerializer, Visit.objects.order_by('id'))
+        self.assertSameJSON(serializers.BookingListSerializer, Booking.objects.order_by('id'))
+        self.assertSameJSON(serializers.SpecializationListSerializer, Specialization.objects.order_by('id'))
+
+    def test_needs_instances(self):
+        """Test serializers with fields computed from instances are rejected"""
+        with self.assertRaises(TypeError):
+            RowRenderer(serializers.HospitalDetailSerializer())
+
+
+class CatalogueCacheTestCase(APITestCase):
+    """Test caching of public catalogue responses"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.hospital = Hospital.objects.create(
+            title='Hospital', short_title='H', type='Private', description='Description',
+            opening_time=time(8), closing_time=time(20), address='Street'
+        )
+        self.url = '/api/v1/hospitals/'
+
+    def test_cached_until_changed(self):
+        """Test responses are served from cache until a listed model changes"""
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data['results'][0]['hospital_likes_amount'], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.hospital.add_like()
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['results'][0]['hospital_likes_amount'], 1)
+
+    def test_relation_change(self):
+        """Test adding a specialization to a doctor invalidates doctors of the specialization"""
+        specialization = Specialization.objects.create(title='Cardiology', url='cardiology')
+        url = '/api/v1/doctors/cardiology/'
+        self.assertEqual(self.client.get(url).data['results'], [])
+        with self.captureOnCommitCallbacks(execute=True):
+            sample_doctor().specialization.add(specialization)
+        self.assertEqual(len(self.client.get(url).data['results']), 1)
+
+    def test_conditional_get(self):
+        """Test unchanged responses are answered with 304"""
+        response = self.client.get(self.url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+@in_memory_holds
+class QueryCountTestCase(APITestCase):
+    """Test endpoints run a fixed number of queries regardless of result size"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.hospital = Hospital.objects.create(
+            title='Hospital', short_title='H', type='Private', description='Description',
+            opening_time=time(8), closing_time=time(20), address='Street'
+        )
+        self.doctor = sample_doctor(visit_duration=10)
+        self.doctor.hospital = self.hospital
+        self.doctor.save()
+        self.star = RatingStar.objects.create(value=5)
+        self.tomorrow = date.today() + timedelta(days=1)
+        generate_schedule(self.doctor, [self.tomorrow], time(9), time(18), 'Once')
+        self.rows = 0
+
+    def add_rows(self, amount):
+        """Add bookings, reviews, feedbacks, doctors and services, committing them invalidates cached responses"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_rows(amount)
+        self.rows += amount
+
+    def create_rows(self, amount):
+        for number in range(self.rows, self.rows + amount):
+            patient = sample_client(f'client{number}@client.com')
+            visit = Visit.objects.filter(booking_visit__isnull=True).order_by('time').first()
+            Booking.objects.create(visit=visit, client=patient, service='Checkup')
+            Review.objects.create(author=patient, rating=self.star, hospital=self.hospital, text='Good')
+            self.doctor.feedbacks.create(author=patient, rating=self.star, text='Good')
+            doctor = sample_doctor(f'doctor{number}@doctor.com')
+            doctor.hospital = self.hospital
+            doctor.save()
+            service = Service.objects.create(title=f'Service {number}', url=f'service-{number}')
+            self.hospital.services.add(service)
+
+    def count_queries(self, url, user=None):
+        self.client.force_authenticate(user and MyUser.objects.get(pk=user.pk))
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(context.captured_queries)
+
+    def assertFixedQueries(self, url, expected, user=None):
+        """Check query count of the endpoint stays the same when more rows are added"""
+        self.add_rows(1)
+        self.assertEqual(self.count_queries(url, user), expected)
+        self.add_rows(4)
+        self.assertEqual(self.count_queries(url, user), expected)
+
+    def test_booking_list_for_doctor(self):
+        self.assertFixedQueries('/api/v1/booking/list/', 2, self.doctor.user)
+
+    def test_hospital_detail(self):
+        self.assertFixedQueries(f'/api/v1/hospitals/{self.hospital.pk}/', 4)
+
+    def test_doctor_profile(self):
+        self.assertFixedQueries(f'/users/doctor/profile/{self.doctor.pk}/', 3)
+
+    def test_visit_list(self):
+        self.assertFixedQueries(f'/api/v1/doctor/{self.doctor.pk}/visits/', 1)
+
+    def test_doctors_by_hospital(self):
+        self.assertFixedQueries(f'/api/v1/hospitals/{self.hospital.pk}/doctors/', 2)
+
+
+class SearchTestCase(APITestCase):
+    """Test combined search"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.doctor = sample_doctor()
+        self.hospital = Hospital.objects.create(
+            title='City Hospital', short_title='City', type='Public', description='Description',
+            opening_time=time(8), closing_time=time(20), address='Shevchenko street'
+        )
+        specialization = Specialization.objects.create(title='Cardiology', url='cardiology')
+        self.cardiologist = sample_doctor('cardiologist@doctor.com')
+        self.cardiologist.specialization.add(specialization)
+        Service.objects.create(title='Cardiogram', url='cardiogram')
+
+    def test_search_is_case_insensitive(self):
+        """Test search matches names, addresses and doctors of specializations"""
+        response = self.client.get('/api/v1/search/JANE/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['Doctors']), 2)
+
+        response = self.client.get('/api/v1/search/shevchenko/')
+        self.assertEqual([hospital['title'] for hospital in response.data['Hospitals']], ['City Hospital'])
+
+        response = self.client.get('/api/v1/search/Cardio/')
+        self.assertEqual(len(response.data['Doctors']), 1)
+        self.assertEqual(len(response.data['Specializations']), 1)
+        self.assertEqual(response.data['Specializations'][0]['title'], 'Cardiology')
+        self.assertEqual(len(response.data['Services']), 1)
+
+    def test_autocomplete(self):
+        """Test autocomplete returns only ids and titles, limited per category"""
+        response = self.client.get('/api/v1/search/jane/', {'autocomplete': 'true', 'limit': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['Doctors'], [{'id': self.doctor.pk, 'title': 'Doctor JaneDoe'}])
+        self.assertEqual(response.data['Hospitals'], [])
+
+
+class LikesTestCase(APITestCase):
+    """Test likes of hospitals and doctors"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.doctor = sample_doctor()
+        self.patient = sample_client()
+        self.hospital = Hospital.objects.create(
+            title='Hospital', short_title='H', type='Private', description='Description',
+            opening_time=time(8), closing_time=time(20), address='Street'
+        )
+        self.client.force_authenticate(self.patient.user)
+
+    def test_hospital_like(self):
+        """Test hospital can be liked once and the like can be removed"""
+        url = f'/api/v1/hospitals/{self.hospital.pk}/like/'
+        response = self.client.post(url, {'hospital': self.hospital.pk})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.post(url, {'hospital': self.hospital.pk})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.hospital.refresh_from_db()
+        self.assertEqual(self.hospital.hospital_likes_amount, 1)
+
+        response = self.client.delete(url + 'delete/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.delete(url + 'delete/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.hospital.refresh_from_db()
+        self.assertEqual(self.hospital.hospital_likes_amount, 0)
+
+    def test_doctor_like(self):
+        """Test doctor likes counter follows likes"""
+        url = f'/api/v1/doctor/{self.doctor.pk}/like/'
+        self.client.post(url, {'doctor': self.doctor.pk})
+        response = self.client.post(url, {'doctor': self.doctor.pk})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.doctor.refresh_from_db()
+        self.assertEqual(self.doctor.doctor_likes_amount, 1)
+        self.client.delete(url + 'delete/')
+        self.doctor.refresh_from_db()
+        self.assertEqual(self.doctor.doctor_likes_amount, 0)
+
+
+class RatingTestCase(APITestCase):
+    """Test ratings of hospitals and doctors follow reviews and feedbacks"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.doctor = sample_doctor()
+        self.patient = sample_client()
+        self.other = sample_client('other@client.com')
+        self.hospital = Hospital.objects.create(
+            title='Hospital', short_title='H', type='Private', description='Description',
+            opening_time=time(8), closing_time=time(20), address='Street'
+        )
+        self.stars = {value: RatingStar.objects.create(value=value) for value in range(1, 6)}
+
+    def review(self, client, stars):
+        self.client.force_authenticate(client.user)
+        payload = {'author': client.pk, 'rating': self.stars[stars].pk, 'hospital': self.hospital.pk, 'text': 'Text'}
+        return self.client.post(f'/api/v1/hospitals/{self.hospital.pk}/review/create/', payload)
+
+    def assertRating(self, obj, rating, rating_sum, amount, amount_field):
+        obj.refresh_from_db()
+        self.assertEqual(float(obj.rating), rating)
+        self.assertEqual(obj.rating_sum, rating_sum)
+        self.assertEqual(getattr(obj, amount_field), amount)
+
+    def test_review_changes(self):
+        """Test creating, changing and deleting reviews keeps hospital rating"""
+        self.assertEqual(self.review(self.patient, 5).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.review(self.other, 2).status_code, status.HTTP_201_CREATED)
+        self.assertRating(self.hospital, 3.5, 7, 2, 'reviews_amount')
+        self.assertFalse(OutboxEvent.objects.exists())
+        self.assertEqual(self.review(self.other, 1).status_code, status.HTTP_400_BAD_REQUEST)
+
+        review = Review.objects.get(author=self.other)
+        review.rating = self.stars[4]
+        review.save()
+        self.assertRating(self.hospital, 4.5, 9, 2, 'reviews_amount')
+
+        Review.objects.get(author=self.patient).delete()
+        self.assertRating(self.hospital, 4, 4, 1, 'reviews_amount')
+        review.delete()
+        self.assertRating(self.hospital, 0, 0, 0, 'reviews_amount')
+
+    def test_feedback_changes(self):
+        """Test creating and deleting feedbacks keeps doctor rating"""
+        self.client.force_authenticate(self.patient.user)
+        payload = {'author': self.patient.pk, 'rating': self.stars[3].pk, 'doctor': self.doctor.pk, 'text': 'Text'}
+        response = self.client.post(f'/api/v1/doctor/{self.doctor.pk}/feedback/create/', payload)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.post(f'/api/v1/doctor/{self.doctor.pk}/feedback/create/', payload)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        Feedback.objects.create(author=self.other, rating=self.stars[4], doctor=self.doctor, text='Text')
+        self.assertRating(self.doctor, 3.5, 7, 2, 'feedbacks_amount')
+
+        Feedback.objects.filter(author=self.patient).get().delete()
+        self.assertRating(self.doctor, 4, 4, 1, 'feedbacks_amount')
+
+    def test_rebuild_ratings(self):
+        """Test rebuild command recomputes corrupted ratings"""
+        self.review(self.patient, 5)
+        self.review(self.other, 4)
+        Hospital.objects.update(rating=1, rating_sum=100, reviews_amount=7)
+        Doctor.objects.update(rating=3, rating_sum=3, feedbacks_amount=1)
+
+        call_command('rebuild_ratings', batch_size=1, stdout=StringIO())
+        self.assertRating(self.hospital, 4.5, 9, 2, 'reviews_amount')
+        self.assertRating(self.doctor, 0, 0, 0, 'feedbacks_amount')
+
+
+class RetentionTestCase(APITestCase):
+    """Test removal of expired schedules and visits"""
+
+    def setUp(self):
+        self.doctor = sample_doctor()
+        patient = sample_client()
+        old = [date.today() - timedelta(days=days) for days in (10, 11)]
+        generate_schedule(self.doctor, old + [date.today() + timedelta(days=1)], time(9), time(10), 'Every day')
+        Booking.objects.create(visit=Visit.objects.filter(date=old[0]).first(), client=patient)
+
+    def test_purge_expired(self):
+        """Test expired rows are removed in chunks and recent rows are kept"""
+        report = purge_expired(chunk_size=3)
+        self.assertEqual(
+            {table: report[table] for table in ('hospital_booking', 'hospital_visit', 'hospital_schedule')},
+            {'hospital_booking': 1, 'hospital_visit': 4, 'hospital_schedule': 2}
+        )
+        self.assertEqual(list(Schedule.objects.values_list('date', flat=True)), [date.today() + timedelta(days=1)])
+        self.assertEqual(Visit.objects.count(), 2)
+        self.assertEqual(FreeSlot.objects.count(), 2)
+
+    def test_archive(self):
+        """Test removed rows are copied to archive tables"""
+        purge_expired(archive=True)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM hospital_visit_archive')
+            self.assertEqual(cursor.fetchone()[0], 4)
+
+    def test_lock(self):
+        """Test purge does not run while another worker holds the lock"""
+        cache.add(LOCK_KEY, 'worker', 60)
+        self.addCleanup(cache.delete, LOCK_KEY)
+        self.assertIsNone(purge_expired_once())
+        self.assertEqual(Visit.objects.count(), 6)
+
+
+class PartitionsTestCase(APITestCase):
+    """Test helpers of monthly partitions"""
+
+    def test_months(self):
+        """Test months are listed across the end of a year"""
+        self.assertEqual(
+            list(months(date(2021, 11, 15), date(2022, 1, 1))),
+            [date(2021, 11, 1), date(2021, 12, 1), date(2022, 1, 1)]
+        )
+        self.assertEqual(partition_name(Visit, date(2021, 11, 1)), 'hospital_visit_p202111')
+
+    def test_not_partitioned(self):
+        """Test tables which are not partitioned are left to chunked deletes"""
+        self.assertEqual(drop_partitions(Visit, date.today()), [])
+
+    @skipUnless(connection.vendor == 'postgresql', 'Partitions need PostgreSQL')
+    def test_extend_with_rows_in_default(self):
+        """Test rows of months without a partition are moved into the partition when it is created"""
+        convert_to_partitioned(Visit)
+        far = date.today() + timedelta(days=366)
+        visit = Visit.objects.create(doctor=sample_doctor(), date=far, time=time(9))
+        ensure_future_partitions([Visit], months_ahead=13)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT id FROM {partition_name(Visit, far.replace(day=1))}')
+            self.assertEqual(cursor.fetchall(), [(visit.pk, )])
+            cursor.execute('SELECT COUNT(*) FROM hospital_visit_default')
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+
+@override_settings(SYNC_SAFETY_LAG=0)
+class SyncTestCase(APITestCase):
+    """Test delta sync of changed and deleted rows"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.doctor = sample_doctor()
+        self.patient = sample_client()
+        self.client.force_authenticate(MyUser.objects.get(pk=self.patient.user.pk))
+        self.cursor = self.client.get('/api/v1/sync/').data['cursor']
+        self.tomorrow = date.today() + timedelta(days=1)
+        generate_schedule(self.doctor, [self.tomorrow], time(9), time(10), 'Once')
+        self.visits = list(Visit.objects.order_by('time'))
+
+    def sync(self, cursor):
+        return self.client.get('/api/v1/sync/', {'since': cursor})
+
+    def test_changes_and_tombstones(self):
+        booking = Booking.objects.create(visit=self.visits[0], client=self.patient, service='Checkup')
+        Booking.objects.create(visit=self.visits[1], client=sample_client('other@client.com'))
+        response = self.sync(self.cursor)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['id'] for row in response.data['bookings']['changed']], [booking.pk])
+        self.assertEqual(response.data['visits']['changed'], [])
+        self.assertFalse(response.data['has_more'])
+
+        cursor = response.data['cursor']
+        self.assertEqual(self.sync(cursor).data['bookings'], {'changed': [], 'deleted': []})
+        booking_id = booking.pk
+        booking.delete()
+        self.assertEqual(self.sync(cursor).data['bookings'], {'changed': [], 'deleted': [booking_id]})
+
+    def test_doctor_sync(self):
+        """Test doctors get their generated schedules and visits, written in bulk"""
+        self.client.force_authenticate(MyUser.objects.get(pk=self.doctor.user.pk))
+        response = self.sync(self.cursor)
+        self.assertEqual(len(response.data['schedules']['changed']), 1)
+        visits = [row['id'] for row in response.data['visits']['changed']]
+        self.assertEqual(visits, [visit.pk for visit in self.visits])
+
+    @override_settings(SYNC_PAGE_SIZE=1)
+    def test_pages(self):
+        hospital = Hospital.objects.create(
+            title='Hospital', short_title='H', type='Private', description='Description',
+            opening_time=time(8), closing_time=time(20), address='Street'
+        )
+        hospital.add_like()
+        Booking.objects.create(visit=self.visits[0], client=self.patient)
+        first = self.sync(self.cursor).data
+        self.assertTrue(first['has_more'])
+        self.assertEqual(first['hospitals']['changed'][0]['hospital_likes_amount'], 1)
+        second = self.sync(first['cursor']).data
+        self.assertTrue(second['has_more'])
+        self.assertEqual(second['hospitals']['changed'][0]['id'], hospital.pk)
+        self.assertFalse(self.sync(self.sync(second['cursor']).data['cursor']).data['has_more'])
+
+    def test_safety_lag(self):
+        """Test cursors do not pass changes which may still be uncommitted"""
+        booking = Booking.objects.create(visit=self.visits[0], client=self.patient)
+        with override_settings(SYNC_SAFETY_LAG=60):
+            cursor = self.client.get('/api/v1/sync/').data['cursor']
+            self.assertEqual(self.sync(self.cursor).data['cursor'], cursor)
+            self.assertEqual(self.sync(cursor).data['bookings']['changed'], [])
+            ChangeLog.objects.update(created_at=timezone.now() - timedelta(minutes=5))
+            response = self.sync(cursor)
+        self.assertEqual([row['id'] for row in response.data['bookings']['changed']], [booking.pk])
+
+    def test_expired_cursor(self):
+        Booking.objects.create(visit=self.visits[0], client=self.patient)
+        ChangeLog.objects.filter(pk__lte=ChangeLog.objects.order_by('-id')[1].pk).delete()
+        self.assertEqual(self.sync(self.cursor).status_code, status.HTTP_410_GONE)
+        self.assertEqual(self.sync('x').status_code, status.HTTP_400_BAD_REQUEST)
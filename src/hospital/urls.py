@@ -15,9 +15,16 @@ urlpatterns = [
     # Doctors
     path('doctors/<str:url>/', views.DoctorsBySpecializationsListAPIView.as_view(), name='specializations'),
     path('schedule/', views.ScheduleListCreateAPIView.as_view()),
+    path('schedule/rules/', views.ScheduleRuleListCreateAPIView.as_view()),
+    path('schedule/rules/<int:pk>/', views.ScheduleRuleDestroyAPIView.as_view()),
     path('booking/', views.BookingCreateAPIView.as_view()),
     path('booking/list/', views.BookingListAPIView.as_view()),
     path('booking/<int:pk>/', views.BookingDestroyAPIView.as_view()),
+    path('booking/bulk/', views.BulkBookingAPIView.as_view()),
+    path('exports/<str:name>/', views.ExportAPIView.as_view()),
+    path('calendar/', views.CalendarLinkAPIView.as_view()),
+    path('calendar/<str:token>.ics', views.CalendarFeedAPIView.as_view(), name='calendar-feed'),
+    path('sync/', views.SyncAPIView.as_view()),
     # path('schedule/delete/', views.ScheduleDestroyAPIView.as_view()),
 
 
@@ -26,7 +33,10 @@ urlpatterns = [
     path('search/<str:q>/', views.SearchCombinedAPIView.as_view()),
 
     path('doctor/<int:pk>/visits/', views.VisitListAPIView.as_view()),
+    path('availability/', views.AvailabilityListAPIView.as_view()),
     path('doctor/visits/<int:pk>/', views.VisitDestroyAPIView.as_view(), name='visit-detail'),
+    path('doctor/visits/<int:pk>/hold/', views.VisitHoldAPIView.as_view()),
+    path('doctor/visits/hold/', views.SlotHoldAPIView.as_view()),
     path('doctor/<int:pk>/feedback/create/', views.FeedbackCreateAPIView.as_view()),
     path('doctor/<int:pk>/like/', views.DoctorLikeCreateAPIView.as_view()),
     path('doctor/<int:pk>/like/delete/', views.DoctorLikeDeleteAPIView.as_view()),
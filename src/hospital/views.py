@@ -1,81 +1,116 @@
-from django.db.models import Avg
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
+from django.core import signing
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date
 from rest_framework import generics, status
-from rest_framework.exceptions import APIException
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
 from . import serializers
 from .models import Hospital, Specialization, Service, Schedule, Visit, Booking, HospitalLike, Review, Feedback, \
-    DoctorLike
-from .permissions import IsHospitalAdminOrReadOnly, IsVisitOwner, IsBookingAdmin
-from .schedule_generator import schedule_choose
-from users.models import Doctor
-
-
-class HospitalListAPIView(generics.ListAPIView):
+    DoctorLike, ScheduleRule
+from .permissions import IsHospitalAdminOrReadOnly, IsVisitOwner, IsBookingAdmin, IsHospitalAdmin
+from .availability import search_free_slots
+from .booking import SlotUnavailable
+from .caching import CachedListMixin, not_modified
+from .calendars import FEED_EVENTS, cached_feed, feed_token, read_feed_token, rotate_nonce, validators
+from .rows import RowListMixin
+from .bulk_booking import bulk_cancel, bulk_create, bulk_move
+from .exports import EXPORTS, FORMATS, export_chunks
+from .holds import hold_store
+from .schedule_generator import schedule_choose, create_rule
+from .search import SEARCH_CATEGORIES, normalize
+from .sync import latest_cursor, sync
+from .slots import claim_slot, free_slots, upcoming
+from users.models import Doctor, ROLE_PROFILES
+
+
+class HospitalListAPIView(CachedListMixin, RowListMixin, generics.ListAPIView):
     """List of all hospitals"""
     serializer_class = serializers.HospitalListSerializer
     queryset = Hospital.objects.all()
     permission_classes = (AllowAny, )
+    cache_models = (Hospital, )
+    ordering = ('-hospital_likes_amount', 'id')
 
 
 class HospitalDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
     """Retrieve all information about hospital"""
     serializer_class = serializers.HospitalDetailSerializer
-    queryset = Hospital.objects.all()
+    queryset = Hospital.objects.prefetch_related(
+        Prefetch('reviews', queryset=Review.objects.only('hospital_id', 'author_id', 'text', 'created_at')),
+        Prefetch('doctors', queryset=Doctor.objects.only('hospital_id', 'first_name', 'last_name')),
+        Prefetch('services', queryset=Service.objects.only('title')),
+    )
     permission_classes = (IsHospitalAdminOrReadOnly, )
 
 
-class SpecializationListAPIView(generics.ListAPIView):
+class SpecializationListAPIView(CachedListMixin, RowListMixin, generics.ListAPIView):
     """View for list of doctor's Specializations"""
     serializer_class = serializers.SpecializationListSerializer
     queryset = Specialization.objects.all()
     permission_classes = (AllowAny,)
+    cache_models = (Specialization, )
 
 
-class ServiceListAPIView(generics.ListAPIView):
+class ServiceListAPIView(CachedListMixin, RowListMixin, generics.ListAPIView):
     """View for list of hospital's Services"""
     serializer_class = serializers.ServiceListSerializer
     queryset = Service.objects.all()
     permission_classes = (AllowAny,)
+    cache_models = (Service, )
 
 
-class HospitalsByServicesListAPIView(generics.ListAPIView):
+class HospitalsByServicesListAPIView(CachedListMixin, RowListMixin, generics.ListAPIView):
     """List of hospitals by certain services"""
 
     serializer_class = serializers.HospitalListSerializer
     permission_classes = (AllowAny,)
+    cache_models = (Hospital, Service)
+    ordering = ('-hospital_likes_amount', 'id')
 
     def get_queryset(self):
         service = get_object_or_404(Service, url=self.kwargs.get('url'))
-        return Hospital.objects.filter(services=service).order_by('-hospital_likes_amount')
+        return Hospital.objects.filter(services=service)
 
 
-class DoctorsBySpecializationsListAPIView(generics.ListAPIView):
+class DoctorsBySpecializationsListAPIView(CachedListMixin, RowListMixin, generics.ListAPIView):
     """List of doctors by certain specializations"""
 
     serializer_class = serializers.DoctorListSerializer
     permission_classes = (AllowAny,)
+    cache_models = (Doctor, Specialization)
+    ordering = ('-doctor_likes_amount', 'id')
 
     def get_queryset(self):
         specialization = get_object_or_404(Specialization, url=self.kwargs.get('url'))
-        return Doctor.objects.filter(specialization=specialization).order_by('-doctor_likes_amount')
+        return Doctor.objects.filter(specialization=specialization)
 
 
-class DoctorsByHospitalsListAPIView(generics.ListAPIView):
+class DoctorsByHospitalsListAPIView(CachedListMixin, RowListMixin, generics.ListAPIView):
     """List of doctors by certain hospitals"""
 
     serializer_class = serializers.DoctorListSerializer
     permission_classes = (AllowAny,)
+    cache_models = (Doctor, Hospital)
+    ordering = ('-doctor_likes_amount', 'id')
 
     def get_queryset(self):
         hospital = get_object_or_404(Hospital, pk=self.kwargs.get('pk'))
-        return Doctor.objects.filter(hospital=hospital).order_by('-doctor_likes_amount')
+        return Doctor.objects.filter(hospital=hospital)
 
 
 class SearchCombinedAPIView(generics.ListAPIView):
-    """Search filter, by contains in doctors, hospitals, specializations and services"""
+    """Search doctors, hospitals, specializations and services, best matches first"""
 
     serializer_class_doctors = serializers.DoctorListSerializer
     serializer_class_hospitals = serializers.HospitalListSerializer
@@ -83,100 +118,213 @@ class SearchCombinedAPIView(generics.ListAPIView):
     serializer_class_services = serializers.ServiceListSerializer
     permission_classes = (AllowAny,)
 
-    def get_queryset_doctors(self):
-        return Doctor.objects.filter(last_name__contains=self.kwargs.get('q'))
-
-    def get_queryset_hospitals(self):
-        return Hospital.objects.filter(title__contains=self.kwargs.get('q'))
-
-    def get_queryset_specializations(self):
-        return Specialization.objects.filter(title__contains=self.kwargs.get('q'))
-
-    def get_queryset_services(self):
-        return Service.objects.filter(title__contains=self.kwargs.get('q'))
-
     def list(self, request, *args, **kwargs):
-        doctors = self.serializer_class_doctors(self.get_queryset_doctors(), many=True)
-        hospitals = self.serializer_class_hospitals(self.get_queryset_hospitals(), many=True)
-        specializations = self.serializer_class_specializations(self.get_queryset_specializations(), many=True)
-        services = self.serializer_class_services(self.get_queryset_services(), many=True)
-
-        return Response({
-            "Doctors": doctors.data,
-            "Hospitals": hospitals.data,
-            "Specializations": specializations.data,
-            "Services": services.data
-        })
+        params = serializers.SearchParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        term = normalize(self.kwargs.get('q'))
+        limit = params.validated_data['limit']
+
+        results = {}
+        for category, search, title in SEARCH_CATEGORIES:
+            found = search(term, limit)
+            if params.validated_data['autocomplete']:
+                results[category] = [{'id': obj.pk, 'title': title(obj)} for obj in found]
+            else:
+                serializer_class = getattr(self, 'serializer_class_' + category.lower())
+                results[category] = serializer_class(found, many=True, context=self.get_serializer_context()).data
+        return Response(results)
 
 
 class ScheduleListCreateAPIView(generics.ListCreateAPIView):
     """Creating schedule for each doctor"""
     serializer_class = serializers.ScheduleSerializer
+    ordering = ('date', 'id')
 
     def get_queryset(self):
-        return Schedule.objects.filter(doctor=self.request.user.user_doctor)
+        return Schedule.objects.filter(doctor=self.request.user.user_doctor).select_related('doctor')
 
     def perform_create(self, serializer):
         return schedule_choose(serializer, self.request.user.user_doctor)
 
 
-class VisitListAPIView(generics.ListAPIView):
+class ScheduleRuleListCreateAPIView(generics.ListCreateAPIView):
+    """Recurrence rules of doctor's schedule, schedules are generated ahead by celery"""
+    serializer_class = serializers.ScheduleRuleSerializer
+
+    def get_queryset(self):
+        return ScheduleRule.objects.filter(doctor=self.request.user.user_doctor)
+
+    def perform_create(self, serializer):
+        data = serializer.validated_data
+        serializer.instance = create_rule(
+            self.request.user.user_doctor, data['rrule'], data['dtstart'],
+            data['time_from'], data['time_to'], data.get('exdate_list', ())
+        )
+
+
+class ScheduleRuleDestroyAPIView(generics.RetrieveDestroyAPIView):
+    """Stop a recurrence rule, already generated schedules are kept"""
+    serializer_class = serializers.ScheduleRuleSerializer
+
+    def get_queryset(self):
+        return ScheduleRule.objects.filter(doctor=self.request.user.user_doctor)
+
+
+class VisitListAPIView(RowListMixin, generics.ListAPIView):
     """List of able visits"""
     serializer_class = serializers.VisitSerializer
     permission_classes = (AllowAny,)
+    ordering = ('date', 'time')
 
     def get_queryset(self):
-        return Visit.objects.filter(doctor=self.kwargs.get('pk')).order_by('date')[:25]
+        if settings.VIRTUAL_VISITS:
+            position = self.paginator.decode_cursor(self.request, parsers=(date.fromisoformat, time.fromisoformat))
+            after = tuple(position) if position else None
+            return free_slots(
+                get_object_or_404(Doctor, pk=self.kwargs.get('pk')),
+                limit=self.paginator.get_page_size(self.request) + 1, after=after,
+                held=hold_store().held_visits([self.kwargs.get('pk')])
+            )
+        return Visit.objects.filter(
+            upcoming(datetime.now()), doctor=self.kwargs.get('pk'), booking_visit__isnull=True
+        ).exclude(pk__in=hold_store().held_visits([self.kwargs.get('pk')]))
+
+
+class VisitHoldAPIView(generics.GenericAPIView):
+    """Client can hold a free visit for a few minutes while filling in the booking, see SlotHoldAPIView for slots"""
+    queryset = Visit.objects.filter(booking_visit__isnull=True).only('id', 'doctor_id', 'date', 'time')
+
+    def post(self, request, *args, **kwargs):
+        visit = self.get_object()
+        if datetime.combine(visit.date, visit.time) <= datetime.now():
+            raise ValidationError('Visit is in the past.')
+        if not hold_store().hold(visit.pk, visit.doctor_id, request.user.user_client.pk, settings.VISIT_HOLD_TTL):
+            raise SlotUnavailable('This visit is held by another client.')
+        return Response({'visit': visit.pk, 'expires_in': settings.VISIT_HOLD_TTL}, status=status.HTTP_201_CREATED)
+
+    def delete(self, request, *args, **kwargs):
+        pk = self.kwargs.get('pk')
+        doctor_id = Visit.objects.filter(pk=pk).values_list('doctor_id', flat=True).first()
+        if doctor_id is None or not hold_store().release(pk, doctor_id, request.user.user_client.pk):
+            raise NotFound('You do not hold this visit.')
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class SlotHoldAPIView(VisitHoldAPIView):
+    """
+    Client can hold a slot by doctor, date and time, used with virtual visits.
+
+    The slot's visit is stored first, so the hold is kept under its id and
+    released or booked like any other visit.
+    """
+    serializer_class = serializers.SlotSerializer
+    http_method_names = ['post', 'options']
+
+    def get_object(self):
+        serializer = self.get_serializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        slot = serializer.validated_data
+        visit = claim_slot(slot['doctor'], slot['date'], slot['time'])
+        if Booking.objects.filter(visit=visit).exists():
+            raise SlotUnavailable()
+        return visit
+
+
+class AvailabilityListAPIView(generics.ListAPIView):
+    """Earliest free visits across doctors, filtered by specialization, hospital, dates and time of day"""
+    serializer_class = serializers.FreeSlotSerializer
+    permission_classes = (AllowAny,)
+    pagination_class = None
+
+    def get_queryset(self):
+        params = serializers.AvailabilitySearchSerializer(data=self.request.query_params)
+        params.is_valid(raise_exception=True)
+        search = dict(params.validated_data)
+        date_from = search.pop('date_from', date.today())
+        date_to = search.pop('date_to', date_from + timedelta(days=7))
+        return search_free_slots(max(date_from, date.today()), date_to, **search)
 
 
 class VisitDestroyAPIView(generics.RetrieveDestroyAPIView):
     """View for destroying or retrieving a visit"""
     serializer_class = serializers.VisitSerializer
-    queryset = Visit.objects.all()
+    queryset = Visit.objects.select_related('doctor', 'booking_visit__client')
     permission_classes = (IsVisitOwner, )
 
 
 class BookingCreateAPIView(generics.CreateAPIView):
-    """Client can book an appointment with a doctor"""
-    serializer_class = serializers.BookingCreateDestroySerializer
+    """
+    Client can book an appointment with a doctor.
+
+    Requests with the same Idempotency-Key header book only once and
+    return the same booking, so clients can safely retry them.
+    """
+
+    def get_serializer_class(self):
+        if settings.VIRTUAL_VISITS:
+            return serializers.SlotBookingSerializer
+        return serializers.BookingCreateDestroySerializer
 
     def perform_create(self, serializer):
-        serializer.save(client=self.request.user.user_client)
+        idempotency_key = self.request.headers.get('Idempotency-Key')
+        if idempotency_key and len(idempotency_key) > 255:
+            raise ValidationError('Idempotency key must not be longer than 255 characters.')
+        serializer.save(client=self.request.user.user_client, idempotency_key=idempotency_key)
 
 
-class BookingListAPIView(generics.ListAPIView):
+class BookingListAPIView(RowListMixin, generics.ListAPIView):
     """List of bookings for every doctor and every client"""
     queryset = Booking.objects.all()
     serializer_class = serializers.BookingListSerializer
+    ordering = ('visit__date', 'visit__time', 'id')
 
     def get_queryset(self):
         if self.request.user.is_doctor:
-            return Booking.objects.filter(visit__doctor=self.request.user.user_doctor).order_by('visit__date')
+            bookings = Booking.objects.filter(visit__doctor=self.request.user.user_doctor)
         else:
-            return Booking.objects.filter(client=self.request.user.user_client).order_by('visit__date')
+            bookings = Booking.objects.filter(client=self.request.user.user_client)
+        return bookings
 
 
 class BookingDestroyAPIView(generics.RetrieveDestroyAPIView):
     """Delete booking if hospital admin"""
     serializer_class = serializers.BookingCreateDestroySerializer
-    queryset = Booking.objects.all()
+    queryset = Booking.objects.select_related('visit__doctor')
     permission_classes = (IsBookingAdmin, )
 
 
+class BulkBookingAPIView(generics.GenericAPIView):
+    """
+    Hospital admin can cancel, move or create many bookings of hospital's doctors at once.
+
+    The whole batch runs in one transaction with a fixed number of queries
+    and the response has a result for every item.
+    """
+    serializer_class = serializers.BulkBookingSerializer
+    permission_classes = (IsHospitalAdmin, )
+    actions = {'cancel': bulk_cancel, 'move': bulk_move, 'create': bulk_create}
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        action = serializer.validated_data['action']
+        hospital_id = request.user.user_hospital_admin.hospital_id
+        results = self.actions[action](hospital_id, serializer.validated_data['items'])
+        return Response({'action': action, 'results': results})
+
+
 class HospitalLikeCreateAPIView(generics.CreateAPIView):
     """Creating hospital likes"""
     serializer_class = serializers.HospitalLikesSerializer
 
-    def check_like(self):
-        user = self.request.user.user_client
-        if HospitalLike.objects.filter(user=user, hospital=self.kwargs.get('pk')).exists():
-            raise APIException('You already liked this hospital')
-
     def perform_create(self, serializer):
-        self.check_like()
-        serializer.save(user=self.request.user.user_client)
-        liked_hospital = Hospital.objects.get(id=self.kwargs.get('pk'))
-        liked_hospital.add_like()
+        hospital = get_object_or_404(Hospital.objects.only('id'), pk=self.kwargs.get('pk'))
+        try:
+            with transaction.atomic():
+                serializer.save(user=self.request.user.user_client, hospital=hospital)
+                hospital.add_like()
+        except IntegrityError:
+            raise ValidationError('You already liked this hospital')
 
 
 class HospitalLikeDeleteAPIView(generics.DestroyAPIView):
@@ -185,90 +333,174 @@ class HospitalLikeDeleteAPIView(generics.DestroyAPIView):
 
     def delete(self, request, *args, **kwargs):
         user = self.request.user.user_client
-        try:
-            like_obj = HospitalLike.objects.get(user=user, hospital=self.kwargs.get('pk'))
-        except HospitalLike.DoesNotExist:
+        hospital = get_object_or_404(Hospital.objects.only('id'), pk=self.kwargs.get('pk'))
+        with transaction.atomic():
+            deleted, _ = HospitalLike.objects.filter(user=user, hospital=hospital).delete()
+            if deleted:
+                hospital.remove_like()
+        if not deleted:
             return Response(status=status.HTTP_404_NOT_FOUND,
                             data={'Message': "Like doesn't exists"})
-        liked_hospital = Hospital.objects.get(id=self.kwargs.get('pk'))
-
-        like_obj.delete()
-        liked_hospital.hospital_likes_amount -= 1
-        liked_hospital.save()
 
         return Response(status=status.HTTP_200_OK)
 
 
 class HospitalReviewCreateAPIView(generics.CreateAPIView):
-    """Create a review for a hospital"""
+    """Create a review for a hospital, its rating is updated by signals"""
     serializer_class = serializers.ReviewCreateSerializer
 
     def perform_create(self, serializer):
         user = self.request.user.user_client
-        hospital = get_object_or_404(Hospital, id=self.kwargs.get('pk'))
+        hospital = get_object_or_404(Hospital.objects.only('id'), id=self.kwargs.get('pk'))
         if Review.objects.filter(hospital=hospital, author=user).exists():
-            raise APIException('You have already commented this hospital.')
-        average_ratings = Review.objects.filter(hospital=hospital).aggregate(Avg('rating__value'))
-
-        if average_ratings['rating__value__avg'] is not None:
-            hospital.rating = float(average_ratings['rating__value__avg'])
-        else:
-            hospital.rating = float(serializer.validated_data['rating'].value)
-        hospital.reviews_amount += 1
-        hospital.save()
-        serializer.save(author=user)
+            raise ValidationError('You have already commented this hospital.')
+        with transaction.atomic():
+            serializer.save(author=user, hospital=hospital)
 
 
 class FeedbackCreateAPIView(generics.CreateAPIView):
-    """Create a review after visiting doctor"""
+    """Create a review after visiting doctor, its rating is updated by signals"""
     serializer_class = serializers.FeedbackCreateSerializer
 
     def perform_create(self, serializer):
         user = self.request.user.user_client
-        doctor = get_object_or_404(Doctor, id=self.kwargs.get('pk'))
+        doctor = get_object_or_404(Doctor.objects.only('id'), id=self.kwargs.get('pk'))
         if Feedback.objects.filter(doctor=doctor, author=user).exists():
-            raise APIException('You have already left a feedback.')
-        average_ratings = Feedback.objects.filter(doctor=doctor).aggregate(Avg('rating__value'))
-
-        if average_ratings['rating__value__avg'] is not None:
-            doctor.rating = float(average_ratings['rating__value__avg'])
-        else:
-            doctor.rating = float(serializer.validated_data['rating'].value)
-        doctor.feedbacks_amount += 1
-        doctor.save()
-        serializer.save(author=user)
+            raise ValidationError('You have already left a feedback.')
+        with transaction.atomic():
+            serializer.save(author=user, doctor=doctor)
 
 
 class DoctorLikeCreateAPIView(generics.CreateAPIView):
-    """Creating hospital likes"""
+    """Creating doctor likes"""
     serializer_class = serializers.DoctorLikesSerializer
 
-    def check_like(self):
-        user = self.request.user.user_client
-        if DoctorLike.objects.filter(user=user, doctor=self.kwargs.get('pk')).exists():
-            raise APIException('You already liked this doctor')
-
     def perform_create(self, serializer):
-        self.check_like()
-        serializer.save(user=self.request.user.user_client)
-        liked_doctor = Doctor.objects.get(id=self.kwargs.get('pk'))
-        liked_doctor.add_like()
+        doctor = get_object_or_404(Doctor.objects.only('id'), pk=self.kwargs.get('pk'))
+        try:
+            with transaction.atomic():
+                serializer.save(user=self.request.user.user_client, doctor=doctor)
+                doctor.add_like()
+        except IntegrityError:
+            raise ValidationError('You already liked this doctor')
 
 
 class DoctorLikeDeleteAPIView(generics.DestroyAPIView):
-    """Deleting hospital likes"""
+    """Deleting doctor likes"""
     serializer_class = serializers.DoctorLikesSerializer
 
     def delete(self, request, *args, **kwargs):
         user = self.request.user.user_client
-        try:
-            like_obj = DoctorLike.objects.get(user=user, doctor=self.kwargs.get('pk'))
-        except DoctorLike.DoesNotExist:
+        doctor = get_object_or_404(Doctor.objects.only('id'), pk=self.kwargs.get('pk'))
+        with transaction.atomic():
+            deleted, _ = DoctorLike.objects.filter(user=user, doctor=doctor).delete()
+            if deleted:
+                doctor.remove_like()
+        if not deleted:
             return Response(status=status.HTTP_404_NOT_FOUND,
                             data={'Message': "Like doesn't exists"})
-        liked_doctor = Doctor.objects.get(id=self.kwargs.get('pk'))
-        like_obj.delete()
-        liked_doctor.doctor_likes_amount -= 1
-        liked_doctor.save()
 
         return Response(status=status.HTTP_200_OK)
+
+
+class ExportAPIView(generics.GenericAPIView):
+    """
+    Hospital admin can download bookings, visits, reviews or feedbacks of the hospital as CSV or NDJSON.
+
+    Rows are streamed as they are read from the database, optionally gzipped,
+    so exports of any size take the same memory.
+    """
+    permission_classes = (IsHospitalAdmin, )
+
+    def get(self, request, *args, **kwargs):
+        name = self.kwargs.get('name')
+        if name not in EXPORTS:
+            raise NotFound('Unknown export.')
+        params = serializers.ExportParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        date_from, date_to, output, compress = (
+            params.validated_data[field] for field in ('date_from', 'date_to', 'output', 'gzip')
+        )
+
+        response = StreamingHttpResponse(
+            export_chunks(name, request.user.user_hospital_admin.hospital_id, date_from, date_to, output, compress),
+            content_type='application/gzip' if compress else FORMATS[output][1]
+        )
+        filename = f'{name}-{date_from}-{date_to}.{output}' + ('.gz' if compress else '')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class CalendarLinkAPIView(APIView):
+    """Secret address of the user's calendar feed, to subscribe to in a calendar app, POST replaces a leaked one"""
+
+    def get(self, request):
+        role = request.user.role
+        if role not in FEED_EVENTS:
+            raise PermissionDenied('Only doctors and clients have calendars.')
+        token = feed_token(role, getattr(request.user, ROLE_PROFILES[role]).pk, request.user)
+        return Response({'url': request.build_absolute_uri(reverse('calendar-feed', kwargs={'token': token}))})
+
+    def post(self, request):
+        if request.user.role not in FEED_EVENTS:
+            raise PermissionDenied('Only doctors and clients have calendars.')
+        rotate_nonce(request.user)
+        return self.get(request)
+
+
+class CalendarFeedAPIView(APIView):
+    """
+    iCalendar feed of bookings and working hours of a doctor, or of bookings of a client.
+
+    Calendar apps can not send tokens, the signed address identifies the user.
+    It carries the user's nonce, so it stops working when the nonce is
+    replaced or the user is deactivated.
+    ETag and Last-Modified follow the version of the calendar, which changes
+    with every booking or schedule of its owner, so polls of an unchanged
+    calendar are answered with 304 after one cache lookup.
+    """
+    authentication_classes = ()
+    permission_classes = (AllowAny, )
+
+    def get(self, request, token):
+        try:
+            role, profile, user_id, nonce = read_feed_token(token)
+        except signing.BadSignature:
+            raise NotFound()
+        today = date.today()
+        etag, last_modified, version, owner_nonce = validators(role, profile, user_id, today)
+        if not owner_nonce or not constant_time_compare(owner_nonce, nonce):
+            raise NotFound()
+        if not_modified(request, etag, last_modified):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = HttpResponse(
+                cached_feed(role, profile, version, today), content_type='text/calendar; charset=utf-8'
+            )
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+class SyncAPIView(APIView):
+    """
+    Changes of hospitals and of the user's visits, schedules and bookings since a cursor.
+
+    The first sync without ``since`` returns only the current cursor, the
+    client downloads full lists and then polls with the returned cursors,
+    following ``has_more`` pages. 410 means the cursor is too old to continue.
+    """
+
+    def get(self, request):
+        params = serializers.SyncParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        if 'since' not in params.validated_data:
+            return Response({'cursor': str(latest_cursor())})
+        role = request.user.role
+        profile = getattr(request.user, ROLE_PROFILES[role]).pk if role in ('doctor', 'client') else None
+        return Response(sync(
+            params.validated_data['since'],
+            doctor_id=profile if role == 'doctor' else None,
+            client_id=profile if role == 'client' else None,
+        ))
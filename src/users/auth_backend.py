@@ -2,8 +2,11 @@ from datetime import datetime
 
 import jwt
 from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
 from rest_framework import authentication, exceptions
-from .models import MyUser
+
+from .cache import get_user
+from .models import ROLE_PROFILES
 
 ALGORITHM = 'HS256'
 
@@ -47,9 +50,23 @@ class JWTAuthentication(authentication.BaseAuthentication):
             msg = 'Token expired.'
             raise exceptions.AuthenticationFailed(msg)
 
-        try:
-            user = MyUser.objects.get(id=payload['id'])
-            return user, token
-        except MyUser.DoesNotExist:
+        role = payload.get('role')
+        user = get_user(payload['id'], role)
+        if user is None:
             msg = 'No user matching this token was found.'
             raise exceptions.AuthenticationFailed(msg)
+
+        if not user.is_active:
+            msg = 'This user has been deactivated.'
+            raise exceptions.AuthenticationFailed(msg)
+
+        if role in ROLE_PROFILES and payload.get('profile') != self._profile_id(user, role):
+            msg = 'Token does not match the user profile.'
+            raise exceptions.AuthenticationFailed(msg)
+        return user, token
+
+    def _profile_id(self, user, role):
+        try:
+            return getattr(user, ROLE_PROFILES[role]).pk
+        except ObjectDoesNotExist:
+            return None
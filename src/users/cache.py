@@ -0,0 +1,132 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import MyUser, ROLE_PROFILES
+
+
+class LocalCache:
+    """
+    Small per-process LRU cache whose entries expire after ttl seconds.
+
+    Entries can be dropped only in the process which holds them, so the ttl
+    bounds how long other processes may serve a changed user.
+    """
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_users = LocalCache(settings.AUTH_LOCAL_CACHE_SIZE, settings.AUTH_LOCAL_CACHE_TTL)
+
+
+# Columns of cached users and profiles, the rest is deferred and loaded only when a view reads it
+USER_FIELDS = ('id', 'is_active', 'is_staff', 'is_superuser', 'is_doctor', 'is_hospital_admin')
+PROFILE_FIELDS = ('id', 'user_id', 'hospital_id')
+
+
+def user_key(user_id, role):
+    return f'auth:user:{user_id}:{role}'
+
+
+def profile_fields(role):
+    profile = MyUser._meta.get_field(ROLE_PROFILES[role]).related_model
+    attnames = {field.attname for field in profile._meta.concrete_fields}
+    return profile, [name for name in PROFILE_FIELDS if name in attnames]
+
+
+def load_user(user_id, role):
+    """Cached columns of the user and of the profile of the role, None when there is no such user"""
+    columns = list(USER_FIELDS)
+    if role in ROLE_PROFILES:
+        profile, fields = profile_fields(role)
+        columns += [f'{ROLE_PROFILES[role]}__{name}' for name in fields]
+    row = MyUser.objects.filter(id=user_id).values_list(*columns).first()
+    if row is None:
+        return None
+    return list(row)
+
+
+def from_columns(model, names, values):
+    """Instance with the columns loaded and the other ones deferred, from_db takes them in the model's order"""
+    loaded = dict(zip(names, values))
+    attnames = [field.attname for field in model._meta.concrete_fields if field.attname in loaded]
+    return model.from_db(None, attnames, [loaded[name] for name in attnames])
+
+
+def build_user(data, role):
+    """User with the profile of the role already set, built from cached columns"""
+    user = from_columns(MyUser, USER_FIELDS, data[:len(USER_FIELDS)])
+    if role in ROLE_PROFILES:
+        profile_model, fields = profile_fields(role)
+        values = data[len(USER_FIELDS):]
+        profile = from_columns(profile_model, fields, values) if values[0] is not None else None
+        if profile is not None:
+            profile_model._meta.get_field('user').set_cached_value(profile, user)
+        MyUser._meta.get_field(ROLE_PROFILES[role]).set_cached_value(user, profile)
+    return user
+
+
+def get_user(user_id, role=None):
+    """
+    User with the profile of the role already loaded, None when there is no such user.
+
+    Users are looked up in the process cache, then in the shared cache and only
+    then in the database. Only ids and flags are cached, never password hashes,
+    other columns are deferred and loaded if a view needs them. Every request
+    gets its own instances. Cached users are dropped when the user or a profile
+    is saved, changes made with ``QuerySet.update``, e.g. a bulk deactivation,
+    are seen after AUTH_CACHE_TTL seconds unless ``forget_user`` is called.
+    """
+    key = user_key(user_id, role)
+    data = local_users.get(key)
+    if data is None:
+        data = cache.get(key)
+        if data is None:
+            data = load_user(user_id, role)
+            if data is None:
+                return None
+            cache.set(key, data, settings.AUTH_CACHE_TTL)
+        local_users.set(key, data)
+    return build_user(data, role)
+
+
+def forget_user(user_id):
+    """Drop cached copies of the user, called whenever the user or a profile changes"""
+    keys = [user_key(user_id, role) for role in (None, *ROLE_PROFILES)]
+    cache.delete_many(keys)
+    for key in keys:
+        local_users.delete(key)
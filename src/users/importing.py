@@ -0,0 +1,213 @@
+import csv
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models.functions import Upper
+from rest_framework import serializers
+
+from hospital.caching import invalidate
+from hospital.models import Hospital, Specialization
+from .models import Client, Doctor, HospitalAdmin, MyUser, ROLE_PROFILES
+
+
+class StaffRowSerializer(serializers.Serializer):
+    """One person of a staff import, checks which need the database are done per chunk in ``validate_chunk``"""
+    role = serializers.ChoiceField(choices=list(ROLE_PROFILES))
+    email = serializers.EmailField(max_length=254)
+    password = serializers.CharField(min_length=8, max_length=128, trim_whitespace=False)
+    first_name = serializers.CharField(max_length=255)
+    last_name = serializers.CharField(max_length=255)
+    phone_number = serializers.CharField(max_length=17, required=False, validators=[Client.phone_regex])
+    gender = serializers.ChoiceField(choices=Client.GENDER_CHOICES, required=False)
+    age = serializers.IntegerField(min_value=0, default=18)
+    hospital = serializers.IntegerField(required=False)
+    specializations = serializers.ListField(child=serializers.SlugField(), default=list)
+
+    def validate_email(self, value):
+        return MyUser.objects.normalize_email(value)
+
+    def validate(self, data):
+        if data['role'] == 'client':
+            missing = {field: 'This field is required.' for field in ('phone_number', 'gender') if field not in data}
+            if missing:
+                raise serializers.ValidationError(missing)
+        elif data['specializations'] and data['role'] != 'doctor':
+            raise serializers.ValidationError({'specializations': 'Only doctors have specializations.'})
+        return data
+
+
+def csv_rows(file):
+    """Rows of a CSV file with a header line, specializations are separated by semicolons"""
+    for row in csv.DictReader(file):
+        row = {key: value for key, value in row.items() if value not in ('', None)}
+        if 'specializations' in row:
+            row['specializations'] = [slug.strip() for slug in row['specializations'].split(';') if slug.strip()]
+        yield row
+
+
+def json_rows(file, read_size=64 * 1024):
+    """
+    Objects of a JSON array or of JSON lines, decoded as they are read.
+
+    Only the object being decoded is held in memory, not the whole file.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    finished = False
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,[]':
+            position += 1
+        try:
+            row, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if finished:
+                if buffer[position:].strip():
+                    raise
+                return
+            chunk = file.read(read_size)
+            finished = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield row
+
+
+def read_rows(file, name):
+    """Rows of an uploaded or opened staff file, by the extension of its name"""
+    if isinstance(file.read(0), bytes):
+        file = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    if os.path.splitext(name)[1].lower() == '.csv':
+        return csv_rows(file)
+    return json_rows(file)
+
+
+@contextmanager
+def hashing_pool(workers, threads):
+    """
+    Executor hashing passwords of a chunk in parallel.
+
+    Processes are the default, threads are for processes which can not start
+    children, e.g. Celery workers, PBKDF2 releases the GIL so they still hash in parallel.
+    """
+    executor_class = ThreadPoolExecutor if threads else ProcessPoolExecutor
+    with executor_class(max_workers=workers or settings.STAFF_IMPORT_WORKERS or os.cpu_count()) as executor:
+        yield executor
+
+
+def validate_chunk(chunk, specializations, seen, report):
+    """Valid rows of the chunk, errors of the others are added to the report"""
+    valid = []
+    errors = []
+    for number, row in chunk:
+        serializer = StaffRowSerializer(data=row)
+        if serializer.is_valid():
+            valid.append((number, serializer.validated_data))
+        else:
+            errors.append({'row': number, 'errors': serializer.errors})
+
+    # Login matches emails case-insensitively, so emails differing only in case are taken too
+    emails = [data['email'].upper() for number, data in valid]
+    taken = set(MyUser.objects.annotate(upper_email=Upper('email')).filter(
+        upper_email__in=emails
+    ).values_list('upper_email', flat=True))
+    hospitals = set(Hospital.objects.filter(
+        pk__in={data['hospital'] for number, data in valid if 'hospital' in data}
+    ).values_list('pk', flat=True))
+
+    checked = []
+    for number, data in valid:
+        row_errors = {}
+        if data['email'].upper() in taken or data['email'].upper() in seen:
+            row_errors['email'] = 'User with this email already exists.'
+        if 'hospital' in data and data['hospital'] not in hospitals:
+            row_errors['hospital'] = 'Hospital does not exist.'
+        unknown = [slug for slug in data['specializations'] if slug not in specializations]
+        if unknown:
+            row_errors['specializations'] = f'Unknown specializations: {", ".join(unknown)}.'
+        if row_errors:
+            errors.append({'row': number, 'errors': row_errors})
+        else:
+            seen.add(data['email'].upper())
+            checked.append(data)
+    report['errors'].extend(sorted(errors, key=lambda error: error['row']))
+    return checked
+
+
+def write_chunk(rows, passwords, specializations):
+    """Create users, profiles and specializations of doctors of the chunk with a few bulk INSERTs"""
+    with transaction.atomic():
+        users = MyUser.objects.bulk_create([
+            MyUser(
+                email=data['email'], password=password,
+                is_doctor=data['role'] == 'doctor', is_hospital_admin=data['role'] == 'hospital_admin'
+            )
+            for data, password in zip(rows, passwords)
+        ])
+        if users and users[0].pk is None:
+            # The database does not return ids of inserted rows
+            ids = dict(MyUser.objects.filter(email__in=[user.email for user in users]).values_list('email', 'id'))
+            for user in users:
+                user.pk = ids[user.email]
+
+        profiles = {'client': [], 'doctor': [], 'hospital_admin': []}
+        for data, user in zip(rows, users):
+            names = {'user': user, 'first_name': data['first_name'], 'last_name': data['last_name']}
+            if data['role'] == 'client':
+                profile = Client(**names, phone_number=data['phone_number'], gender=data['gender'], age=data['age'])
+            elif data['role'] == 'doctor':
+                profile = Doctor(**names, hospital_id=data.get('hospital'))
+            else:
+                profile = HospitalAdmin(**names, hospital_id=data.get('hospital'))
+            profiles[data['role']].append(profile)
+        Client.objects.bulk_create(profiles['client'])
+        HospitalAdmin.objects.bulk_create(profiles['hospital_admin'])
+        Doctor.objects.bulk_create(profiles['doctor'])
+
+        slugs = {user.pk: data['specializations'] for data, user in zip(rows, users) if data['specializations']}
+        if slugs:
+            doctors = Doctor.objects.filter(user_id__in=slugs).values_list('user_id', 'id')
+            Doctor.specialization.through.objects.bulk_create([
+                Doctor.specialization.through(doctor_id=doctor, specialization_id=specializations[slug])
+                for user, doctor in doctors
+                for slug in set(slugs[user])
+            ])
+
+
+def import_staff(rows, dry_run=False, chunk_size=None, workers=None, threads=False):
+    """
+    Create clients, doctors and hospital admins with their users from an iterable of rows.
+
+    Rows are read, validated and written in chunks of STAFF_IMPORT_CHUNK_SIZE,
+    each chunk in its own transaction, so a file never has to fit in memory
+    and a failed import keeps the chunks written before. Invalid rows are
+    skipped and reported by their number, ``dry_run`` only validates.
+    Returns the report.
+    """
+    chunk_size = chunk_size or settings.STAFF_IMPORT_CHUNK_SIZE
+    specializations = dict(Specialization.objects.values_list('url', 'id'))
+    report = {'valid' if dry_run else 'created': 0, 'errors': []}
+    seen = set()
+    numbered = enumerate(rows, start=1)
+
+    with nullcontext() if dry_run else hashing_pool(workers, threads) as pool:
+        while True:
+            chunk = list(islice(numbered, chunk_size))
+            if not chunk:
+                break
+            checked = validate_chunk(chunk, specializations, seen, report)
+            if checked and not dry_run:
+                passwords = list(pool.map(make_password, [data['password'] for data in checked], chunksize=16))
+                write_chunk(checked, passwords, specializations)
+            report['valid' if dry_run else 'created'] += len(checked)
+
+    if report.get('created'):
+        invalidate(Doctor)
+    return report
@@ -0,0 +1,30 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from users.importing import import_staff, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Create clients, doctors and hospital admins from a CSV, JSON or JSON lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--dry-run', action='store_true', help='Only validate the rows')
+        parser.add_argument('--chunk-size', type=int)
+        parser.add_argument('--workers', type=int, help='Processes hashing passwords')
+        parser.add_argument('--report', help='Write errors of invalid rows to this JSON file')
+
+    def handle(self, *args, **options):
+        with open(options['path'], 'rb') as file:
+            report = import_staff(
+                read_rows(file, options['path']), dry_run=options['dry_run'],
+                chunk_size=options['chunk_size'], workers=options['workers']
+            )
+        if options['report']:
+            with open(options['report'], 'w') as file:
+                json.dump(report['errors'], file, indent=2)
+        for error in report['errors'][:20]:
+            self.stdout.write(self.style.ERROR(f"Row {error['row']}: {json.dumps(error['errors'])}"))
+        done = f"{report['valid']} valid rows" if options['dry_run'] else f"Imported {report['created']} users"
+        self.stdout.write(self.style.SUCCESS(f"{done}, {len(report['errors'])} invalid rows"))
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.3 on 2026-10-18 14:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='doctor',
+            index=models.Index(fields=['-doctor_likes_amount', 'id'], name='users_docto_doctor__a09a98_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctor',
+            index=models.Index(fields=['hospital', '-doctor_likes_amount', 'id'], name='users_docto_hospita_e0430e_idx'),
+        ),
+    ]
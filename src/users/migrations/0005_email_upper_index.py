@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+def create_email_index(apps, schema_editor):
+    """Login looks emails up case-insensitively with UPPER(email), only PostgreSQL needs the index for it"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE INDEX IF NOT EXISTS users_myuser_email_upper ON users_myuser (UPPER(email))')
+
+
+def drop_email_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS users_myuser_email_upper')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_refresh_token'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_email_index, drop_email_index),
+    ]
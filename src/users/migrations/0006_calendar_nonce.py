@@ -0,0 +1,18 @@
+# Generated by Django 3.2.3 on 2026-10-18 15:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_email_upper_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='myuser',
+            name='calendar_nonce',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+    ]
@@ -6,8 +6,20 @@ from django.conf import settings
 
 from django.contrib.auth.base_user import BaseUserManager, AbstractBaseUser
 from django.contrib.auth.models import PermissionsMixin
+from django.core.exceptions import ObjectDoesNotExist
 from django.core.validators import RegexValidator
 from django.db import models
+from django.db.models import F
+
+from hospital.caching import invalidate
+
+
+# Role claim of a token and the relation of user's profile for the role
+ROLE_PROFILES = {
+    'client': 'user_client',
+    'doctor': 'user_doctor',
+    'hospital_admin': 'user_hospital_admin',
+}
 
 
 class UserManager(BaseUserManager):
@@ -78,6 +90,9 @@ class MyUser(AbstractBaseUser, PermissionsMixin):
     is_doctor = models.BooleanField(default=False)
     is_hospital_admin = models.BooleanField(default=False)
 
+    # Secret part of the calendar feed address, a new one revokes the old address
+    calendar_nonce = models.CharField(max_length=32, blank=True, default='')
+
     created_at = models.DateTimeField(auto_now_add=True)
 
     updated_at = models.DateTimeField(auto_now=True)
@@ -100,21 +115,54 @@ class MyUser(AbstractBaseUser, PermissionsMixin):
         """
         return self._generate_jwt_token()
 
+    @property
+    def role(self):
+        if self.is_doctor:
+            return 'doctor'
+        if self.is_hospital_admin:
+            return 'hospital_admin'
+        return 'client'
+
     def _generate_jwt_token(self):
         """
-        Generates a JSON Web Token that stores this user's ID and has an expiry
-        date set to 60 days into the future.
+        Generates a JSON Web Token that stores this user's ID, role and profile ID
+        and expires after ACCESS_TOKEN_TTL seconds, see users.tokens for renewal.
         """
-        dt = datetime.datetime.now() + datetime.timedelta(days=1)
+        dt = datetime.datetime.now() + datetime.timedelta(seconds=settings.ACCESS_TOKEN_TTL)
+        try:
+            profile_id = getattr(self, ROLE_PROFILES[self.role]).pk
+        except ObjectDoesNotExist:
+            profile_id = None
 
         token = jwt.encode({
             'id': self.pk,
+            'role': self.role,
+            'profile': profile_id,
             'exp': str(time.mktime(dt.timetuple()))[:-2]
         }, settings.SECRET_KEY, algorithm='HS256')
 
         return token
 
 
+class RefreshToken(models.Model):
+    """
+    Refresh token of a user, only its SHA-256 hash is stored.
+
+    Every use replaces the token with a new one of the same family, a used
+    token presented again revokes the whole family.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='refresh_tokens', on_delete=models.CASCADE)
+    token_hash = models.CharField(max_length=64, unique=True)
+    family = models.UUIDField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    used_at = models.DateTimeField(null=True, blank=True)
+    revoked_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'Refresh token of {self.user_id}'
+
+
 class Client(models.Model):
     """Client's profile"""
     user = models.OneToOneField(settings.AUTH_USER_MODEL, related_name='user_client', on_delete=models.CASCADE)
@@ -171,16 +219,28 @@ class Doctor(models.Model):
     doctor_likes_amount = models.PositiveIntegerField(default=0)
     visit_duration = models.PositiveIntegerField(null=True, blank=True)
     rating = models.DecimalField(default=0, max_digits=3, decimal_places=2)
+    rating_sum = models.PositiveIntegerField(default=0)
     feedbacks_amount = models.PositiveIntegerField(default=0)
 
     objects = DoctorManager()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-doctor_likes_amount', 'id']),
+            models.Index(fields=['hospital', '-doctor_likes_amount', 'id']),
+        ]
+
     def __str__(self):
         return f'Doctor: {self.first_name} {self.last_name}'
 
     def add_like(self):
-        self.doctor_likes_amount += 1
-        self.save()
+        """Increment likes counter in the database, without touching other columns"""
+        Doctor.objects.filter(pk=self.pk).update(doctor_likes_amount=F('doctor_likes_amount') + 1)
+        invalidate(Doctor)
+
+    def remove_like(self):
+        Doctor.objects.filter(pk=self.pk).update(doctor_likes_amount=F('doctor_likes_amount') - 1)
+        invalidate(Doctor)
 
     @property
     def get_full_name(self):
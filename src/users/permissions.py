@@ -14,10 +14,10 @@ class IsProfileOwnerOrHospitalAdmin(BasePermission):
         if request.method in SAFE_METHODS:
             return True
         elif request.user.is_authenticated:
-            if obj.hospital == request.user.user_hospital_admin.hospital:
+            if obj.user_id == request.user.pk:
                 return True
-            else:
-                return obj.user == request.user
+            admin = getattr(request.user, 'user_hospital_admin', None) if request.user.is_hospital_admin else None
+            return bool(admin and obj.hospital_id and obj.hospital_id == admin.hospital_id)
 
 
 class IsProfileOwner(BasePermission):
@@ -1,9 +1,10 @@
-from django.contrib.auth import authenticate
+from django.core.validators import FileExtensionValidator
 from django.utils.translation import ugettext_lazy as _
 
 from rest_framework import serializers
 
 from .models import Doctor, Client, MyUser, HospitalAdmin
+from .tokens import issue_tokens, login
 from hospital.models import Feedback
 
 
@@ -85,7 +86,9 @@ class DoctorProfileSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Doctor
-        exclude = ['doctor_likes_amount', 'user']
+        # Rating columns are running aggregates kept by hospital.ratings.change_rating
+        exclude = ['doctor_likes_amount', 'user', 'rating_sum']
+        read_only_fields = ['rating', 'feedbacks_amount']
 
 
 class ClientProfileSerializer(serializers.ModelSerializer):
@@ -107,6 +110,7 @@ class UserLoginSerializer(serializers.Serializer):
         write_only=True
     )
     token = serializers.CharField(max_length=255, read_only=True)
+    refresh = serializers.CharField(max_length=255, read_only=True)
     date = serializers.CharField(max_length=255, read_only=True)
 
     def validate(self, data):
@@ -114,7 +118,7 @@ class UserLoginSerializer(serializers.Serializer):
         password = data.get('password', None)
 
         if username and password:
-            user = authenticate(username=username, password=password)
+            user = login(username, password)
             if user is None:
                 msg = _('Unable to log in with provided credentials.')
                 raise serializers.ValidationError(msg, code='authorization')
@@ -122,14 +126,15 @@ class UserLoginSerializer(serializers.Serializer):
             if not user.is_active:
                 raise serializers.ValidationError('This user has been deactivated.')
 
-            if MyUser.objects.filter(email=username).exists():
-                user_object = MyUser.objects.get(email=username)
-            else:
-                raise serializers.ValidationError(
-                    'User with given email and password does not exists'
-                )
-
-            return {
-                'email': user_object.email,
-                'token': user_object.token,
-            }
+            return {'email': user.email, **issue_tokens(user)}
+
+
+class RefreshTokenSerializer(serializers.Serializer):
+    """Serializer for renewing or revoking tokens with a refresh token"""
+    refresh = serializers.CharField(max_length=255)
+
+
+class StaffImportSerializer(serializers.Serializer):
+    """Serializer for uploading a staff file, see users.importing"""
+    file = serializers.FileField(validators=[FileExtensionValidator(['csv', 'json', 'jsonl'])])
+    dry_run = serializers.BooleanField(default=False)
@@ -0,0 +1,23 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import forget_user
+from .models import MyUser, Client, Doctor, HospitalAdmin
+
+
+@receiver(post_save, sender=MyUser)
+@receiver(post_delete, sender=MyUser)
+def forget_changed_user(sender, instance, **kwargs):
+    """Cached users must not outlive changes of the user, e.g. deactivation"""
+    forget_user(instance.pk)
+
+
+@receiver(post_save, sender=Client)
+@receiver(post_save, sender=Doctor)
+@receiver(post_save, sender=HospitalAdmin)
+@receiver(post_delete, sender=Client)
+@receiver(post_delete, sender=Doctor)
+@receiver(post_delete, sender=HospitalAdmin)
+def forget_profile_user(sender, instance, **kwargs):
+    """Cached users carry their profile, so they are dropped when the profile changes"""
+    forget_user(instance.user_id)
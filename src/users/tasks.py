@@ -0,0 +1,16 @@
+from django.core.files.storage import default_storage
+
+from core.celery import app
+
+from .importing import import_staff, read_rows
+
+
+@app.task
+def import_staff_file(name):
+    """Import an uploaded staff file and delete it, returns the report"""
+    try:
+        with default_storage.open(name, 'rb') as file:
+            # Worker processes can not start a process pool, passwords are hashed by threads
+            return import_staff(read_rows(file, name), threads=True)
+    finally:
+        default_storage.delete(name)
@@ -1,6 +1,26 @@
+import io
+import json
+import os
+import tempfile
+from unittest import mock
+from datetime import time
+
+import jwt
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import override_settings
 from rest_framework import status
-from rest_framework.test import APITestCase, APIClient
-from .models import MyUser
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APITestCase, APIClient, APIRequestFactory
+from .auth_backend import JWTAuthentication
+from .cache import local_users, user_key
+from hospital.models import Hospital, Specialization
+from .importing import json_rows
+from .models import MyUser, Client, Doctor, HospitalAdmin, RefreshToken
+from .tasks import import_staff_file
+from .tokens import login
 
 CLIENT_REGISTER_URL = '/users/client/register/'
 DOCTOR_REGISTER_URL = '/users/doctor/register/'
@@ -139,3 +159,230 @@ class UsersLoginTestCase(APITestCase):
         response = self.client.post('/users/login/', payload)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn('token', response.data)
+
+
+class JWTAuthenticationTestCase(APITestCase):
+    """Test token authentication"""
+
+    def setUp(self):
+        cache.clear()
+        local_users.clear()
+        user = sample_user('user@user.com', 'useruser111', False, False)
+        self.patient = Client.objects.create_client(
+            user=user, first_name='Client', last_name='Test', phone_number='+38029342402', gender='Male', age=20
+        )
+        self.token = MyUser.objects.get(pk=user.pk).token
+
+    def authenticate(self, token=None):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Token {token or self.token}')
+        return JWTAuthentication().authenticate(request)[0]
+
+    def test_token_claims(self):
+        """Test token carries role and profile of the user"""
+        payload = jwt.decode(self.token, settings.SECRET_KEY, algorithms='HS256')
+        self.assertEqual(payload['role'], 'client')
+        self.assertEqual(payload['profile'], self.patient.pk)
+
+    def test_cached_user(self):
+        """Test user and profile are loaded with one query and then served from cache"""
+        with self.assertNumQueries(1):
+            user = self.authenticate()
+            self.assertEqual(user.user_client, self.patient)
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+            self.assertEqual(user.user_client, self.patient)
+
+    def test_cache_has_no_password(self):
+        """Test only ids and flags are cached, other columns are loaded when read"""
+        user = self.authenticate()
+        cached = cache.get(user_key(user.pk, 'client'))
+        self.assertNotIn(MyUser.objects.get(pk=user.pk).password, cached)
+        self.assertEqual(user.email, 'user@user.com')
+        self.assertTrue(user.check_password('useruser111'))
+
+    def test_profile_change_invalidates_cache(self):
+        """Test changed profile is not served from cache"""
+        self.authenticate()
+        self.patient.first_name = 'Changed'
+        self.patient.save()
+        self.assertEqual(self.authenticate().user_client.first_name, 'Changed')
+
+    def test_deactivated_user(self):
+        """Test deactivated user can not authenticate with a cached token"""
+        self.authenticate()
+        self.patient.user.is_active = False
+        self.patient.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_replaced_profile(self):
+        """Test token of a deleted profile is rejected"""
+        self.patient.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+
+class DoctorProfileTestCase(APITestCase):
+    """Test doctor's profile updates"""
+
+    def test_rating_is_read_only(self):
+        user = sample_user('doctor@user.com', 'useruser111', True, False)
+        doctor = Doctor.objects.create_doctor(user=user, first_name='Doctor', last_name='Test')
+        Doctor.objects.filter(pk=doctor.pk).update(rating=4, rating_sum=8, feedbacks_amount=2)
+        self.client.force_authenticate(user)
+        response = self.client.patch(
+            f'/users/doctor/profile/{doctor.pk}/',
+            {'first_name': 'Renamed', 'rating': 5, 'rating_sum': 1000, 'feedbacks_amount': 1}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('rating_sum', response.data)
+        doctor.refresh_from_db()
+        self.assertEqual(
+            (doctor.first_name, doctor.rating, doctor.rating_sum, doctor.feedbacks_amount), ('Renamed', 4, 8, 2)
+        )
+
+
+class RefreshTokenTestCase(APITestCase):
+    """Test login, renewal and revocation of tokens"""
+
+    def setUp(self):
+        self.client = APIClient()
+        user = sample_user('user@user.com', 'useruser111', False, False)
+        Client.objects.create_client(
+            user=user, first_name='Client', last_name='Test', phone_number='+38029342402', gender='Male', age=20
+        )
+
+    def login(self, password='useruser111'):
+        return self.client.post('/users/login/', {'email': 'User@user.com', 'password': password}, format='json')
+
+    def refresh(self, refresh):
+        return self.client.post('/users/token/refresh/', {'refresh': refresh}, format='json')
+
+    def test_login(self):
+        """Test login fetches the user once and stores only the hash of the refresh token"""
+        with self.assertNumQueries(2):
+            response = self.login()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('token', response.data)
+        self.assertFalse(RefreshToken.objects.filter(token_hash=response.data['refresh']).exists())
+        self.assertEqual(self.login('wrong').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_rotation(self):
+        """Test refresh tokens work once and a reused one revokes its family"""
+        first = self.login().data['refresh']
+        response = self.refresh(first)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        second = response.data['refresh']
+        self.assertNotEqual(first, second)
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f"Token {response.data['token']}")
+        self.assertEqual(JWTAuthentication().authenticate(request)[0].email, 'user@user.com')
+
+        self.assertEqual(self.refresh(first).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.refresh(second).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_logout(self):
+        refresh = self.login().data['refresh']
+        self.assertEqual(
+            self.client.post('/users/logout/', {'refresh': refresh}, format='json').status_code,
+            status.HTTP_204_NO_CONTENT
+        )
+        self.assertEqual(self.refresh(refresh).status_code, status.HTTP_403_FORBIDDEN)
+
+
+class StaffImportTestCase(APITestCase):
+    """Test bulk import of users from files"""
+
+    def setUp(self):
+        self.hospital = Hospital.objects.create(
+            title='Hospital', short_title='H', type='Private', description='Description',
+            opening_time=time(8), closing_time=time(20), address='Street'
+        )
+        Specialization.objects.create(title='Cardiology', url='cardiology')
+        Specialization.objects.create(title='Surgery', url='surgery')
+        sample_user('taken@user.com', 'useruser111', False, False)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write_csv(self):
+        path = os.path.join(self.directory.name, 'staff.csv')
+        with open(path, 'w') as file:
+            file.write(
+                'role,email,password,first_name,last_name,phone_number,gender,hospital,specializations\n'
+                'client,Client@User.com,useruser111,Client,Test,+38029342402,Male,,\n'
+                f'doctor,doctor@user.com,useruser111,Doctor,Test,,,{self.hospital.pk},cardiology;surgery\n'
+                f'hospital_admin,admin@user.com,useruser111,Admin,Test,,,{self.hospital.pk},\n'
+                'client,taken@user.com,useruser111,Client,Taken,+38029342402,Male,,\n'
+                'doctor,unknown@user.com,useruser111,Doctor,Unknown,,,,dentistry\n'
+                'client,phone@user.com,useruser111,Client,Phone,,,,\n'
+                'doctor,client@user.com,useruser111,Doctor,Twice,,,,\n'
+            )
+        return path
+
+    def test_import_command(self):
+        report = os.path.join(self.directory.name, 'report.json')
+        call_command('import_staff', self.write_csv(), chunk_size=2, workers=2, report=report, stdout=io.StringIO())
+
+        self.assertEqual(MyUser.objects.count(), 4)
+        # Only the domain is normalized, the user logs in with the email as it was given
+        self.assertEqual(Client.objects.get(user__email='Client@user.com').phone_number, '+38029342402')
+        self.assertIsNotNone(login('Client@User.com', 'useruser111'))
+        self.assertIsNotNone(login('client@user.com', 'useruser111'))
+        doctor = Doctor.objects.get(user__email='doctor@user.com')
+        self.assertEqual(doctor.hospital, self.hospital)
+        self.assertEqual(sorted(doctor.specialization.values_list('url', flat=True)), ['cardiology', 'surgery'])
+        self.assertTrue(HospitalAdmin.objects.filter(user__email='admin@user.com', hospital=self.hospital).exists())
+        with open(report) as file:
+            self.assertEqual([error['row'] for error in json.load(file)], [4, 5, 6, 7])
+
+    def test_dry_run(self):
+        call_command('import_staff', self.write_csv(), dry_run=True, stdout=io.StringIO())
+        self.assertEqual(MyUser.objects.count(), 1)
+
+    def test_json_rows(self):
+        """Test JSON arrays and JSON lines are decoded across reads"""
+        rows = [{'email': f'user{number}@user.com', 'specializations': ['surgery']} for number in range(5)]
+        array = io.StringIO(json.dumps(rows, indent=2))
+        lines = io.StringIO('\n'.join(json.dumps(row) for row in rows))
+        self.assertEqual(list(json_rows(array, read_size=7)), rows)
+        self.assertEqual(list(json_rows(lines, read_size=7)), rows)
+
+    def test_import_endpoint(self):
+        """Test only staff can import and imports run in celery, the task runs in the test process"""
+        rows = [{
+            'role': 'doctor', 'email': 'doctor@user.com', 'password': 'useruser111',
+            'first_name': 'Doctor', 'last_name': 'Test', 'specializations': ['surgery'],
+        }]
+        upload = SimpleUploadedFile('staff.json', json.dumps(rows).encode('utf-8'))
+        staff = sample_user('staff@user.com', 'useruser111', False, False)
+        self.client.force_authenticate(staff)
+        self.assertEqual(
+            self.client.post('/users/staff/import/', {'file': upload}).status_code, status.HTTP_403_FORBIDDEN
+        )
+
+        staff.is_staff = True
+        staff.save()
+        upload.seek(0)
+        response = self.client.post('/users/staff/import/', {'file': upload, 'dry_run': True})
+        self.assertEqual(response.data, {'valid': 1, 'errors': []})
+        upload.seek(0)
+        run_here = mock.patch(
+            'users.views.import_staff_file.delay', side_effect=lambda name: import_staff_file.apply(args=(name, ))
+        )
+        with override_settings(MEDIA_ROOT=self.directory.name), run_here:
+            response = self.client.post('/users/staff/import/', {'file': upload})
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['report'], {'created': 1, 'errors': []})
+        self.assertTrue(Doctor.objects.filter(user__email='doctor@user.com', specialization__url='surgery').exists())
+        self.assertEqual(os.listdir(os.path.join(self.directory.name, 'imports')), [])
+
+    def test_unreadable_file(self):
+        """Test malformed or not UTF-8 files are rejected in dry runs"""
+        staff = sample_user('staff@user.com', 'useruser111', False, False)
+        staff.is_staff = True
+        staff.save()
+        self.client.force_authenticate(staff)
+        for name, content in (('staff.json', b'[{"role": "doctor",'), ('staff.csv', b'role,email\n\xff\xfe,x\n')):
+            upload = SimpleUploadedFile(name, content)
+            response = self.client.post('/users/staff/import/', {'file': upload, 'dry_run': True})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('file', response.data)
@@ -0,0 +1,103 @@
+import hashlib
+import secrets
+import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import exceptions, status
+
+from .models import MyUser, RefreshToken, ROLE_PROFILES
+
+hashing_pool = ThreadPoolExecutor(max_workers=settings.LOGIN_HASH_WORKERS, thread_name_prefix='login-hash')
+
+
+class LoginUnavailable(exceptions.APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many logins at the moment, try again later.'
+    default_code = 'login_unavailable'
+
+
+def hash_token(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def users_with_profiles():
+    return MyUser.objects.select_related(*ROLE_PROFILES.values())
+
+
+def login(email, password):
+    """
+    User with the email and password together with the profile, None when credentials are wrong.
+
+    Emails match case-insensitively, the way they are typed does not matter.
+    The user is fetched with one query and the password is hashed in the
+    bounded pool of LOGIN_HASH_WORKERS threads, so a burst of logins can not
+    take all CPUs of the process. Unknown emails are hashed too, the answer
+    takes the same time either way.
+    """
+    user = users_with_profiles().filter(email__iexact=email).order_by('pk').first()
+    outdated = []
+    if user is None:
+        task = hashing_pool.submit(hashers.make_password, password)
+    else:
+        task = hashing_pool.submit(hashers.check_password, password, user.password, outdated.append)
+    try:
+        correct = task.result(timeout=settings.LOGIN_HASH_TIMEOUT)
+    except TimeoutError:
+        task.cancel()
+        raise LoginUnavailable()
+    if user is None or not correct:
+        return None
+    if outdated:
+        # The hasher or its iterations changed, the password is stored hashed the current way
+        user.set_password(password)
+        user.save(update_fields=['password'])
+    return user
+
+
+def issue_tokens(user, family=None):
+    """Access token and a new refresh token of the family, a new family when it is None"""
+    refresh = secrets.token_urlsafe(32)
+    RefreshToken.objects.create(
+        user=user, token_hash=hash_token(refresh), family=family or uuid.uuid4(),
+        expires_at=timezone.now() + timedelta(seconds=settings.REFRESH_TOKEN_TTL)
+    )
+    return {'token': user.token, 'refresh': refresh}
+
+
+def rotate(refresh):
+    """
+    Replace the refresh token with a new one and a new access token, the password is not checked again.
+
+    A token which was already replaced means it leaked, so the whole family
+    is revoked and both the thief and the user have to log in again.
+    """
+    now = timezone.now()
+    tokens = None
+    with transaction.atomic():
+        stored = RefreshToken.objects.select_for_update().filter(token_hash=hash_token(refresh)).first()
+        valid = stored is not None and not stored.revoked_at and stored.expires_at > now
+        if valid and stored.used_at:
+            # The revocation is committed before the request fails
+            RefreshToken.objects.filter(family=stored.family, revoked_at__isnull=True).update(revoked_at=now)
+        elif valid:
+            user = users_with_profiles().get(pk=stored.user_id)
+            if user.is_active:
+                stored.used_at = now
+                stored.save(update_fields=['used_at'])
+                tokens = issue_tokens(user, stored.family)
+    if tokens is None:
+        raise exceptions.AuthenticationFailed('Invalid refresh token.')
+    return tokens
+
+
+def revoke(refresh):
+    """Revoke the family of the refresh token, e.g. on logout"""
+    stored = RefreshToken.objects.filter(token_hash=hash_token(refresh)).only('family').first()
+    if stored is None:
+        return 0
+    return RefreshToken.objects.filter(family=stored.family, revoked_at__isnull=True).update(revoked_at=timezone.now())
@@ -1,7 +1,8 @@
 from django.urls import path
 from .views import (
-    UserLogin, DoctorRegistrationAPIView, ClientRegistrationAPIView,
-    HospitalAdminRegistrationAPIView, DoctorProfileAPIView, ClientProfileAPIView
+    UserLogin, UserLogout, TokenRefresh, DoctorRegistrationAPIView, ClientRegistrationAPIView,
+    HospitalAdminRegistrationAPIView, DoctorProfileAPIView, ClientProfileAPIView, StaffImportAPIView,
+    StaffImportStatusAPIView
 )
 
 urlpatterns = [
@@ -10,5 +11,9 @@ urlpatterns = [
     path('doctor/profile/<int:pk>/', DoctorProfileAPIView.as_view()),
     path('profile/<int:pk>/', ClientProfileAPIView.as_view()),
     path('hospital-admin/register/', HospitalAdminRegistrationAPIView.as_view(), name='hospital-admin-register'),
-    path('login/', UserLogin.as_view())
+    path('login/', UserLogin.as_view()),
+    path('logout/', UserLogout.as_view()),
+    path('token/refresh/', TokenRefresh.as_view()),
+    path('staff/import/', StaffImportAPIView.as_view()),
+    path('staff/import/<str:task_id>/', StaffImportStatusAPIView.as_view())
 ]
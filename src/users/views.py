@@ -1,14 +1,27 @@
+import csv
+import os
+import uuid
+
+from celery.result import AsyncResult
+from django.core.files.storage import default_storage
+from django.db.models import Prefetch
 from rest_framework import status
 from rest_framework import generics
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.views import APIView
 
 
 from . import serializers
 
+from hospital.models import Feedback, Specialization
 from .models import Doctor, Client
+from .importing import import_staff, read_rows
 from .permissions import IsProfileOwnerOrHospitalAdmin, IsProfileOwner
+from .tasks import import_staff_file
+from .tokens import revoke, rotate
 
 
 class ClientRegistrationAPIView(generics.CreateAPIView):
@@ -40,10 +53,36 @@ class UserLogin(APIView):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+class TokenRefresh(APIView):
+    """New access and refresh tokens for a refresh token, which can not be used again"""
+    permission_classes = (AllowAny,)
+    serializer_class = serializers.RefreshTokenSerializer
+
+    def post(self, request):
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(rotate(serializer.validated_data['refresh']), status=status.HTTP_200_OK)
+
+
+class UserLogout(APIView):
+    """Revoke the refresh token and all tokens which replaced it"""
+    permission_classes = (AllowAny,)
+    serializer_class = serializers.RefreshTokenSerializer
+
+    def post(self, request):
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        revoke(serializer.validated_data['refresh'])
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 class DoctorProfileAPIView(generics.RetrieveUpdateDestroyAPIView):
     """Retrieve a doctor's profile"""
     serializer_class = serializers.DoctorProfileSerializer
-    queryset = Doctor.objects.all()
+    queryset = Doctor.objects.prefetch_related(
+        Prefetch('feedbacks', queryset=Feedback.objects.only('doctor_id', 'author_id', 'text', 'created_at')),
+        Prefetch('specialization', queryset=Specialization.objects.only('id')),
+    )
     permission_classes = (IsProfileOwnerOrHospitalAdmin, )
 
 
@@ -54,5 +93,40 @@ class ClientProfileAPIView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = (IsProfileOwner, )
 
 
+class StaffImportAPIView(APIView):
+    """
+    Staff can import clients, doctors and hospital admins from a file.
+
+    Dry runs are validated right away, imports run in celery and their report
+    is returned by StaffImportStatusAPIView.
+    """
+    permission_classes = (IsAdminUser,)
+    parser_classes = (MultiPartParser,)
+    serializer_class = serializers.StaffImportSerializer
+
+    def post(self, request):
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        file = serializer.validated_data['file']
+        if serializer.validated_data['dry_run']:
+            try:
+                report = import_staff(read_rows(file, file.name), dry_run=True)
+            except (ValueError, csv.Error) as error:
+                # Malformed JSON or CSV, or a file which is not UTF-8
+                raise ValidationError({'file': f'File can not be read: {error}'})
+            return Response(report, status=status.HTTP_200_OK)
+
+        name = default_storage.save(f'imports/{uuid.uuid4().hex}{os.path.splitext(file.name)[1].lower()}', file)
+        return Response(import_status(import_staff_file.delay(name)), status=status.HTTP_202_ACCEPTED)
+
+
+class StaffImportStatusAPIView(APIView):
+    """Status and report of a staff import"""
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, task_id):
+        return Response(import_status(AsyncResult(task_id)), status=status.HTTP_200_OK)
 
 
+def import_status(result):
+    return {'task': result.id, 'status': result.status, 'report': result.result if result.successful() else None}